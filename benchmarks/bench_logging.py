@@ -0,0 +1,377 @@
+"""
+Benchmarks for the overhead squid adds to a training run.
+
+Dummy pipelines wrapped by SklearnLogger, PytorchLogger or TensorflowLogger are run
+against a local tracking store, while the number of returned metrics, the size of a
+returned DataFrame and the number of concurrent runs vary. For every scenario the
+script reports run latency percentiles, the latency added on top of the bare
+pipeline, metrics logged per second and DataFrame artifact MB per second.
+
+Usage:
+    python benchmarks/bench_logging.py run --store sqlite --flavors sklearn,pytorch
+    python benchmarks/bench_logging.py run --store server --metrics 10,1000 --rows 0,100000
+    python benchmarks/bench_logging.py compare results/old.json results/new.json
+
+The store is one of:
+    - file: an MLflow file store in a temporary directory.
+    - sqlite: an MLflow SQLite store in a temporary directory.
+    - server: a local `mlflow server` process on top of a SQLite store, with
+    proxied artifacts like the bundled Docker stack.
+
+Results are saved as JSON under benchmarks/results/, named after the squid version,
+so that `compare` can flag regressions between versions.
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from importlib.metadata import version, PackageNotFoundError
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import mlflow
+
+
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+STORES = ("file", "sqlite", "server")
+FLAVORS = ("sklearn", "pytorch", "tensorflow")
+
+
+def _make_model(flavor):
+    """
+    A small model and a function that trains it, so that training time does not
+    drown out the logging overhead.
+    """
+    X = np.random.default_rng(0).normal(size=(256, 8)).astype("float32")
+    y = X.sum(axis=1)
+
+    if flavor == "sklearn":
+        from sklearn.linear_model import LinearRegression
+
+        def train():
+            return LinearRegression().fit(X, y)
+
+    elif flavor == "pytorch":
+        import torch
+
+        X_t, y_t = torch.from_numpy(X), torch.from_numpy(y).unsqueeze(1)
+
+        def train():
+            model = torch.nn.Linear(8, 1)
+            optimizer = torch.optim.SGD(model.parameters(), lr=0.01)
+            for _ in range(10):
+                optimizer.zero_grad()
+                loss = torch.nn.functional.mse_loss(model(X_t), y_t)
+                loss.backward()
+                optimizer.step()
+            return model
+
+    elif flavor == "tensorflow":
+        import tensorflow as tf
+
+        def train():
+            model = tf.keras.Sequential([tf.keras.Input(shape=(8,)), tf.keras.layers.Dense(1)])
+            model.compile(optimizer="sgd", loss="mse")
+            model.fit(X, y, epochs=1, batch_size=64, verbose=0)
+            return model
+
+    else:
+        raise ValueError(f"flavor must be one of {FLAVORS}. Provided '{flavor}'")
+
+    return train
+
+
+def _make_logger(flavor, concurrent, log_models):
+    from squid import SklearnLogger, PytorchLogger, TensorflowLogger
+
+    logger_class = {
+        "sklearn": SklearnLogger,
+        "pytorch": PytorchLogger,
+        "tensorflow": TensorflowLogger
+    }[flavor]
+    return logger_class(logging_kwargs={"log_models": log_models}, concurrent=concurrent)
+
+
+def _make_pipeline(train, n_metrics, n_rows):
+    """
+    A pipeline returning n_metrics scalar metrics and, if n_rows > 0, a DataFrame of
+    predictions with n_rows rows. Both are built once, outside of the timed calls.
+    """
+    metrics = {f"metric_{i}": float(i) for i in range(n_metrics)}
+    if n_rows:
+        rng = np.random.default_rng(0)
+        metrics["predictions"] = pd.DataFrame({
+            "y_true": rng.normal(size=n_rows),
+            "y_pred": rng.normal(size=n_rows)
+        })
+
+    def pipeline(experiment_name=None):
+        return train(), dict(metrics)
+
+    artifact_bytes = len(metrics["predictions"].to_csv(index=False).encode()) if n_rows else 0
+    return pipeline, artifact_bytes
+
+
+def _time_calls(func, n_runs, concurrency, experiment_name):
+    """
+    Call func n_runs times on concurrency threads.
+
+    Returns:
+        - tuple: (latencies of the individual calls in seconds, wall time in seconds)
+    """
+    def call(_):
+        start = time.perf_counter()
+        func(experiment_name=experiment_name)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    if concurrency == 1:
+        latencies = [call(i) for i in range(n_runs)]
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            latencies = list(executor.map(call, range(n_runs)))
+    return latencies, time.perf_counter() - start
+
+
+def run_scenario(flavor, n_metrics, n_rows, concurrency, n_runs=20, warmup=2, log_models=False):
+    """
+    Benchmark one combination of flavor, metric count, DataFrame size and concurrency
+    against the current tracking URI.
+
+    Returns:
+        - dict: The scenario and its measurements.
+    """
+    from squid.ml_logging.utils import _get_experiment_id
+
+    train = _make_model(flavor)
+    pipeline, artifact_bytes = _make_pipeline(train, n_metrics, n_rows)
+    experiment_name = f"bench-{flavor}-{n_metrics}-{n_rows}-{concurrency}"
+    _create_experiment(experiment_name)
+    _get_experiment_id(experiment_name)
+
+    # The bare pipeline is the baseline that squid's overhead is measured against
+    bare_latencies, _ = _time_calls(pipeline, n_runs, 1, experiment_name)
+
+    logger = _make_logger(flavor, concurrent=concurrency > 1, log_models=log_models)
+    try:
+        logged_pipeline = logger.log(pipeline)
+        _time_calls(logged_pipeline, warmup, 1, experiment_name)
+        latencies, wall_time = _time_calls(logged_pipeline, n_runs, concurrency, experiment_name)
+        logger.flush()
+    finally:
+        logger.close()
+
+    p50, p90, p99 = (float(p) for p in np.percentile(latencies, [50, 90, 99]))
+    return {
+        "flavor": flavor,
+        "n_metrics": n_metrics,
+        "n_rows": n_rows,
+        "concurrency": concurrency,
+        "n_runs": n_runs,
+        "p50_s": p50,
+        "p90_s": p90,
+        "p99_s": p99,
+        "mean_s": float(np.mean(latencies)),
+        "overhead_p50_s": p50 - float(np.median(bare_latencies)),
+        "runs_per_s": n_runs / wall_time,
+        "metrics_per_s": n_runs * n_metrics / wall_time,
+        "artifact_mb_per_s": n_runs * artifact_bytes / 1e6 / wall_time
+    }
+
+
+def _create_experiment(experiment_name):
+    """
+    Create the experiment with a local artifact location. Experiments created by squid
+    use mlflow-artifacts:/ locations, which only a tracking server can resolve.
+    """
+    if mlflow.get_tracking_uri().startswith("http"):
+        return
+    if mlflow.get_experiment_by_name(experiment_name) is None:
+        artifact_location = Path(os.environ["SQUID_BENCH_ARTIFACT_ROOT"]) / experiment_name
+        mlflow.create_experiment(experiment_name, artifact_location=artifact_location.as_uri())
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("localhost", 0))
+        return s.getsockname()[1]
+
+
+def _start_mlflow_server(tmp_dir, timeout=60):
+    """Start `mlflow server` with proxied artifacts, and wait until it accepts requests."""
+    import requests
+
+    port = _free_port()
+    process = subprocess.Popen(
+        [
+            sys.executable, "-m", "mlflow", "server",
+            "--backend-store-uri", f"sqlite:///{tmp_dir}/mlflow.db",
+            "--serve-artifacts",
+            "--artifacts-destination", str(Path(tmp_dir) / "artifacts"),
+            "--host", "127.0.0.1",
+            "--port", str(port)
+        ],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+
+    uri = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(f"{uri}/health", timeout=1).ok:
+                return process, uri
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+
+    process.terminate()
+    raise TimeoutError(f"mlflow server did not start within {timeout}s.")
+
+
+def _environment():
+    def package_version(name):
+        try:
+            return version(name)
+        except PackageNotFoundError:
+            return None
+
+    return {
+        "squid_version": package_version("squid-ml") or "dev",
+        "mlflow_version": package_version("mlflow"),
+        "python_version": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds")
+    }
+
+
+def run(args):
+    results = []
+    with tempfile.TemporaryDirectory(prefix="squid-bench-") as tmp_dir:
+        os.environ["SQUID_BENCH_ARTIFACT_ROOT"] = str(Path(tmp_dir) / "artifacts")
+        server = None
+        if args.store == "file":
+            mlflow.set_tracking_uri((Path(tmp_dir) / "mlruns").as_uri())
+        elif args.store == "sqlite":
+            mlflow.set_tracking_uri(f"sqlite:///{tmp_dir}/mlflow.db")
+        else:
+            server, uri = _start_mlflow_server(tmp_dir)
+            mlflow.set_tracking_uri(uri)
+
+        try:
+            scenarios = itertools.product(args.flavors, args.metrics, args.rows, args.concurrency)
+            for flavor, n_metrics, n_rows, concurrency in scenarios:
+                result = run_scenario(
+                    flavor, n_metrics, n_rows, concurrency,
+                    n_runs=args.runs,
+                    warmup=args.warmup,
+                    log_models=args.log_models
+                )
+                results.append(result)
+                print(_format_result(result), flush=True)
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait()
+
+    report = {**_environment(), "store": args.store, "results": results}
+
+    output = Path(args.output) if args.output else (
+        RESULTS_DIR / f"{report['squid_version']}-{args.store}-{int(time.time())}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(f"Saved results to {output}")
+
+
+def _format_result(result):
+    return (
+        f"{result['flavor']:<10} metrics={result['n_metrics']:<5} rows={result['n_rows']:<7} "
+        f"concurrency={result['concurrency']:<3} p50={result['p50_s'] * 1000:8.1f}ms "
+        f"p99={result['p99_s'] * 1000:8.1f}ms overhead={result['overhead_p50_s'] * 1000:8.1f}ms "
+        f"metrics/s={result['metrics_per_s']:10.0f} MB/s={result['artifact_mb_per_s']:7.2f}"
+    )
+
+
+def _scenario_key(result):
+    return (result["flavor"], result["n_metrics"], result["n_rows"], result["concurrency"])
+
+
+def compare(args):
+    """
+    Print the change in median latency per scenario between two result files.
+    Exits with status 1 if any scenario got slower by more than the threshold.
+    """
+    baseline = json.loads(Path(args.baseline).read_text())
+    candidate = json.loads(Path(args.candidate).read_text())
+    baseline_results = {_scenario_key(r): r for r in baseline["results"]}
+
+    print(f"{baseline['squid_version']} ({baseline['store']}) -> {candidate['squid_version']} ({candidate['store']})")
+
+    regressions = 0
+    for result in candidate["results"]:
+        before = baseline_results.get(_scenario_key(result))
+        if before is None:
+            continue
+
+        change = result["p50_s"] / before["p50_s"] - 1
+        regressed = change > args.threshold
+        regressions += regressed
+        flavor, n_metrics, n_rows, concurrency = _scenario_key(result)
+        print(
+            f"{flavor:<10} metrics={n_metrics:<5} rows={n_rows:<7} concurrency={concurrency:<3} "
+            f"p50 {before['p50_s'] * 1000:8.1f}ms -> {result['p50_s'] * 1000:8.1f}ms ({change:+.1%})"
+            f"{'  REGRESSION' if regressed else ''}"
+        )
+
+    if regressions:
+        print(f"{regressions} scenario(s) regressed by more than {args.threshold:.0%}.")
+        sys.exit(1)
+
+
+def _int_list(value):
+    return [int(v) for v in value.split(",")]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Run the benchmarks and save the results.")
+    run_parser.add_argument("--store", choices=STORES, default="sqlite")
+    run_parser.add_argument(
+        "--flavors",
+        type=lambda value: value.split(","),
+        default=["sklearn"],
+        help=f"Comma separated subset of {','.join(FLAVORS)}."
+    )
+    run_parser.add_argument("--metrics", type=_int_list, default=[10, 1000], help="Scalar metric counts.")
+    run_parser.add_argument("--rows", type=_int_list, default=[0, 100_000], help="DataFrame row counts, 0 for none.")
+    run_parser.add_argument("--concurrency", type=_int_list, default=[1, 4], help="Numbers of concurrent runs.")
+    run_parser.add_argument("--runs", type=int, default=20, help="Timed runs per scenario.")
+    run_parser.add_argument("--warmup", type=int, default=2, help="Untimed runs per scenario.")
+    run_parser.add_argument("--log-models", action="store_true", help="Let autologging log the models.")
+    run_parser.add_argument("--output", help="Result file. Defaults to benchmarks/results/<version>-<store>-<time>.json.")
+    run_parser.set_defaults(func=run)
+
+    compare_parser = subparsers.add_parser("compare", help="Compare two result files.")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("candidate")
+    compare_parser.add_argument("--threshold", type=float, default=0.1, help="Allowed slowdown, 0.1 for 10%%.")
+    compare_parser.set_defaults(func=compare)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
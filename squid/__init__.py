@@ -1,2 +1,30 @@
-from .server import Server
-from .ml_logging import *
+import importlib
+
+
+# Public names mapped to the modules defining them. They are imported on first 
+# access, so that `import squid` does not pull in mlflow, pandas or Docker.
+_LAZY_ATTRIBUTES = {
+    "Server": ".server",
+    "SklearnLogger": ".ml_logging",
+    "PytorchLogger": ".ml_logging",
+    "TensorflowLogger": ".ml_logging",
+    "replay_spool": ".ml_logging",
+    "run_sweep": ".ml_logging",
+    "metric_stream": ".ml_logging",
+    "query_runs": ".ml_logging",
+}
+
+__all__ = list(_LAZY_ATTRIBUTES)
+
+
+def __getattr__(name):
+    if name not in _LAZY_ATTRIBUTES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    value = getattr(importlib.import_module(_LAZY_ATTRIBUTES[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -1 +1,5 @@
-from .loggers import *
\ No newline at end of file
+from .loggers import *
+from .spool import *
+from .stream import *
+from .sweep import *
+from .query import *
@@ -0,0 +1,331 @@
+import asyncio
+import contextvars
+import functools
+import os
+import tempfile
+import time
+from urllib.parse import quote, urlparse
+import mlflow
+from mlflow.exceptions import MlflowException
+from mlflow.protos.databricks_pb2 import RESOURCE_ALREADY_EXISTS, RESOURCE_DOES_NOT_EXIST, ErrorCode
+from mlflow.utils.time import get_current_time_millis
+from .artifacts import _dataframe_extension, _write_dataframe, _log_artifact
+from .arrays import _split_metrics, _write_array, ARRAY_EXTENSION
+from .timing import _phase
+from .utils import (
+    _chunk_batch,
+    _convert_name_to_prefix,
+    _experiment_id_cache,
+    _experiment_id_cache_lock,
+    _stale_experiment_error,
+    EXPERIMENT_ID_CACHE_TTL
+)
+
+
+__all__ = ["AsyncMlflowClient"]
+
+
+# Connections kept open to the tracking server by one client.
+DEFAULT_MAX_CONNECTIONS = 16
+
+# Seconds before a request to the tracking server is abandoned.
+DEFAULT_TIMEOUT = 60.0
+
+_UPLOAD_READ_SIZE = 1024 * 1024
+
+
+class AsyncMlflowClient:
+    """
+    A minimal asyncio client for the MLflow REST API of a tracking server, on a
+    pooled httpx.AsyncClient. It covers what a decorated run needs: experiment
+    lookup, run creation, batched metrics, params and tags, and artifact uploads.
+
+    Use it as an async context manager, or call aclose() when done.
+    """
+    def __init__(self, tracking_uri=None, max_connections=DEFAULT_MAX_CONNECTIONS, timeout=DEFAULT_TIMEOUT, transport=None):
+        """
+        Parameters:
+            - tracking_uri (str, optional): An http(s) tracking URI. Defaults to
+            mlflow.get_tracking_uri().
+            - max_connections (int): Maximum number of open connections. Defaults to 16.
+            - timeout (float): Request timeout in seconds. Defaults to 60.
+            - transport (httpx.AsyncBaseTransport, optional): A custom httpx transport.
+
+        Raises:
+            - ModuleNotFoundError: If httpx is not installed.
+            - ValueError: If the tracking URI is not an http(s) URI.
+        """
+        try:
+            import httpx
+        except ModuleNotFoundError:
+            raise ModuleNotFoundError("httpx is required for async logging. Install it with pip install squid-ml[async].")
+
+        self.tracking_uri = (tracking_uri or mlflow.get_tracking_uri()).rstrip("/")
+        if urlparse(self.tracking_uri).scheme not in ("http", "https"):
+            raise ValueError(f"Async logging requires an http(s) tracking URI. Provided '{self.tracking_uri}'")
+
+        auth = None
+        headers = {}
+        if os.environ.get("MLFLOW_TRACKING_TOKEN"):
+            headers["Authorization"] = f"Bearer {os.environ['MLFLOW_TRACKING_TOKEN']}"
+        elif os.environ.get("MLFLOW_TRACKING_USERNAME"):
+            auth = (os.environ["MLFLOW_TRACKING_USERNAME"], os.environ.get("MLFLOW_TRACKING_PASSWORD", ""))
+
+        self._http = httpx.AsyncClient(
+            base_url=self.tracking_uri,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            timeout=timeout,
+            auth=auth,
+            headers=headers,
+            transport=transport
+        )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    async def aclose(self):
+        await self._http.aclose()
+
+    async def _call(self, method, endpoint, **kwargs):
+        """
+        Send a request and return its decoded JSON body.
+
+        Raises:
+            - MlflowException: If the server rejects the request, with the server's error code.
+        """
+        response = await self._http.request(method, endpoint, **kwargs)
+        if response.is_success:
+            return response.json() if response.content else {}
+
+        try:
+            body = response.json()
+        except ValueError:
+            body = {}
+        error_code = body.get("error_code", "INTERNAL_ERROR")
+        message = body.get("message") or response.text or f"HTTP {response.status_code}"
+        if error_code not in ErrorCode.keys():
+            error_code = "INTERNAL_ERROR"
+        raise MlflowException(f"{method} {endpoint} failed: {message}", error_code=ErrorCode.Value(error_code))
+
+    async def get_experiment_by_name(self, name):
+        """Return the experiment as a dict, or None if it does not exist."""
+        try:
+            body = await self._call("GET", "/api/2.0/mlflow/experiments/get-by-name", params={"experiment_name": name})
+        except MlflowException as e:
+            if e.error_code == ErrorCode.Name(RESOURCE_DOES_NOT_EXIST):
+                return None
+            raise
+        return body["experiment"]
+
+    async def create_experiment(self, name, artifact_location=None):
+        """Create an experiment and return its ID."""
+        payload = {"name": name}
+        if artifact_location:
+            payload["artifact_location"] = artifact_location
+        body = await self._call("POST", "/api/2.0/mlflow/experiments/create", json=payload)
+        return body["experiment_id"]
+
+    async def get_experiment_id(self, experiment_name, use_cache=True):
+        """
+        The async counterpart of _get_experiment_id. Creates the experiment if it does
+        not exist, and shares the experiment ID cache with the synchronous loggers.
+        """
+        key = (self.tracking_uri, experiment_name)
+
+        if use_cache:
+            with _experiment_id_cache_lock:
+                cached = _experiment_id_cache.get(key)
+            if cached and cached[1] > time.monotonic():
+                return cached[0]
+
+        experiment = await self.get_experiment_by_name(experiment_name)
+        if experiment is None:
+            artifact_location = f"mlflow-artifacts:/{_convert_name_to_prefix(experiment_name)}"
+            try:
+                experiment_id = await self.create_experiment(experiment_name, artifact_location=artifact_location)
+            except MlflowException as e:
+                # Another worker created the experiment between the lookup and the create
+                if e.error_code != ErrorCode.Name(RESOURCE_ALREADY_EXISTS):
+                    raise
+                experiment = await self.get_experiment_by_name(experiment_name)
+
+        if experiment is not None:
+            experiment_id = experiment["experiment_id"]
+
+        if experiment is None or experiment.get("lifecycle_stage") == "active":
+            with _experiment_id_cache_lock:
+                _experiment_id_cache[key] = (experiment_id, time.monotonic() + EXPERIMENT_ID_CACHE_TTL)
+
+        return experiment_id
+
+    def _invalidate_experiment_id(self, experiment_name):
+        with _experiment_id_cache_lock:
+            _experiment_id_cache.pop((self.tracking_uri, experiment_name), None)
+
+    async def create_run(self, experiment_id, tags=None):
+        """
+        Start a run in the experiment.
+
+        Returns:
+            - dict: The run's info, with run_id and artifact_uri.
+        """
+        payload = {
+            "experiment_id": experiment_id,
+            "start_time": get_current_time_millis(),
+            "tags": [{"key": k, "value": str(v)} for k, v in (tags or {}).items()]
+        }
+        body = await self._call("POST", "/api/2.0/mlflow/runs/create", json=payload)
+        return body["run"]["info"]
+
+    async def update_run(self, run_id, status="FINISHED"):
+        """End the run with the given status."""
+        payload = {"run_id": run_id, "status": status, "end_time": get_current_time_millis()}
+        await self._call("POST", "/api/2.0/mlflow/runs/update", json=payload)
+
+    async def log_batch(self, run_id, metrics=None, params=None, tags=None, step=0, histories=None):
+        """
+        The async counterpart of _log_batch. Requests for the chunks that do not fit
+        in one log_batch call are sent concurrently.
+        """
+        timestamp = get_current_time_millis()
+        metric_entities = [
+            {"key": k, "value": float(v), "timestamp": timestamp, "step": step}
+            for k, v in (metrics or {}).items()
+        ]
+        for k, (steps, values) in (histories or {}).items():
+            metric_entities += [{"key": k, "value": v, "timestamp": timestamp, "step": s} for s, v in zip(steps, values)]
+        param_entities = [{"key": k, "value": str(v)} for k, v in (params or {}).items()]
+        tag_entities = [{"key": k, "value": str(v)} for k, v in (tags or {}).items()]
+
+        if not (metric_entities or param_entities or tag_entities):
+            return
+
+        await asyncio.gather(*(
+            self._call(
+                "POST", "/api/2.0/mlflow/runs/log-batch",
+                json={"run_id": run_id, "metrics": batch_metrics, "params": batch_params, "tags": batch_tags}
+            )
+            for batch_metrics, batch_params, batch_tags in _chunk_batch(metric_entities, param_entities, tag_entities)
+        ))
+
+    async def log_artifact(self, run_id, artifact_uri, local_path, artifact_path=None, uploader=None):
+        """
+        Upload a file to the run's artifacts. Files are streamed to the tracking server's
+        artifact proxy for mlflow-artifacts URIs. Otherwise, and for the synchronous
+        uploader if one is given, the upload runs in a thread.
+
+        Parameters:
+            - run_id (str): The MLflow run ID.
+            - artifact_uri (str): The run's artifact URI, as returned by create_run.
+            - local_path (str): The file to upload.
+            - artifact_path (str, optional): Directory within the run's artifacts.
+            - uploader (S3ArtifactUploader, optional): Upload straight to the artifact store.
+        """
+        parsed = urlparse(artifact_uri)
+        if uploader is not None or parsed.scheme != "mlflow-artifacts":
+            await _to_thread(_log_artifact, run_id, local_path, artifact_path, uploader)
+            return
+
+        name = "/".join(p.strip("/") for p in (parsed.path, artifact_path, os.path.basename(local_path)) if p)
+        await self._call(
+            "PUT", f"/api/2.0/mlflow-artifacts/artifacts/{quote(name)}",
+            content=_read_file(local_path),
+            headers={"Content-Length": str(os.path.getsize(local_path))}
+        )
+
+
+async def _to_thread(fn, *args, **kwargs):
+    """asyncio.to_thread, which Python 3.8 lacks: run fn on the default executor in a copy of the current context."""
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(None, functools.partial(context.run, fn, *args, **kwargs))
+
+
+async def _read_file(path):
+    """Yield the file in chunks, reading on a thread so the event loop never blocks on disk."""
+    with open(path, "rb") as f:
+        while True:
+            chunk = await _to_thread(f.read, _UPLOAD_READ_SIZE)
+            if not chunk:
+                break
+            yield chunk
+
+
+async def _start_run(client, experiment_name, tags=None):
+    """
+    Start a run in the experiment, resolving its ID again once if the cached
+    experiment was deleted or recreated.
+
+    Returns:
+        - dict: The run's info.
+    """
+    with _phase("experiment_lookup"):
+        experiment_id = await client.get_experiment_id(experiment_name)
+    try:
+        with _phase("run_start"):
+            return await client.create_run(experiment_id, tags=tags)
+    except MlflowException as e:
+        if not _stale_experiment_error(e):
+            raise
+        with _phase("experiment_lookup"):
+            client._invalidate_experiment_id(experiment_name)
+            experiment_id = await client.get_experiment_id(experiment_name)
+        with _phase("run_start"):
+            return await client.create_run(experiment_id, tags=tags)
+
+
+async def _log_metrics(
+        client,
+        run_id,
+        artifact_uri,
+        metrics,
+        dataframe_format="csv",
+        dataframe_compression=None,
+        dataframe_chunk_rows=None,
+        uploader=None
+    ):
+    """
+    The async counterpart of utils._log_metrics. Artifacts are serialized on threads,
+    and the uploads and the log_batch requests for the scalar metrics run concurrently.
+    """
+    scalar_metrics, histories, arrays, dataframes = _split_metrics(metrics)
+    extension = _dataframe_extension(dataframe_format, dataframe_compression)
+
+    with tempfile.TemporaryDirectory(prefix="squid-") as tmp_dir:
+        files = []
+        for name, df in dataframes.items():
+            if not dataframe_chunk_rows or len(df) <= dataframe_chunk_rows:
+                files.append((os.path.join(tmp_dir, name + extension), None, df))
+                continue
+            os.makedirs(os.path.join(tmp_dir, name))
+            for i, start in enumerate(range(0, len(df), dataframe_chunk_rows)):
+                files.append((
+                    os.path.join(tmp_dir, name, f"part-{i:05d}{extension}"),
+                    name,
+                    df.iloc[start:start + dataframe_chunk_rows]
+                ))
+
+        async def upload_dataframe(local_path, artifact_path, df):
+            await _to_thread(_write_dataframe, df, local_path, dataframe_format, dataframe_compression)
+            await client.log_artifact(run_id, artifact_uri, local_path, artifact_path, uploader=uploader)
+
+        async def upload_array(name, array):
+            local_path = os.path.join(tmp_dir, name + ARRAY_EXTENSION)
+            await _to_thread(_write_array, array, local_path)
+            await client.log_artifact(run_id, artifact_uri, local_path, uploader=uploader)
+
+        async def upload_artifacts():
+            with _phase("artifact_upload"):
+                await asyncio.gather(
+                    *(upload_dataframe(*f) for f in files),
+                    *(upload_array(name, array) for name, array in arrays.items())
+                )
+
+        async def log_scalars():
+            with _phase("metric_logging"):
+                await client.log_batch(run_id, metrics=scalar_metrics, histories=histories)
+
+        await asyncio.gather(upload_artifacts(), log_scalars())
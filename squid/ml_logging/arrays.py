@@ -0,0 +1,89 @@
+import os
+import sys
+import numpy as np
+from .artifacts import _is_dataframe, _log_artifact
+
+
+# 1-D arrays with up to this many elements are logged as a metric history, one
+# step per element. Larger and multi-dimensional arrays are logged as .npy artifacts.
+MAX_HISTORY_STEPS = int(os.environ.get("SQUID_ML_MAX_HISTORY_STEPS", 10_000))
+
+ARRAY_EXTENSION = ".npy"
+
+
+def _as_array(value):
+    """
+    Return value as a NumPy array if it is an array, a NumPy scalar, a pandas Series
+    or a torch or TensorFlow tensor, and None otherwise. Frameworks that were never
+    imported are not checked, since value cannot come from them.
+    """
+    if isinstance(value, (np.ndarray, np.generic)):
+        return np.asarray(value)
+
+    pd = sys.modules.get("pandas")
+    if pd is not None and isinstance(value, pd.Series):
+        return value.to_numpy()
+
+    torch = sys.modules.get("torch")
+    if torch is not None and isinstance(value, torch.Tensor):
+        return value.detach().cpu().numpy()
+
+    tf = sys.modules.get("tensorflow")
+    if tf is not None and tf.is_tensor(value):
+        return value.numpy()
+
+    return None
+
+
+def _history_steps(value, n):
+    """Steps of a metric history: the index of a Series with an integer index, else 0..n-1."""
+    pd = sys.modules.get("pandas")
+    if pd is not None and isinstance(value, pd.Series) and pd.api.types.is_integer_dtype(value.index):
+        return value.index.to_numpy(dtype=np.int64).tolist()
+    return list(range(n))
+
+
+def _split_metrics(metrics, max_history_steps=MAX_HISTORY_STEPS):
+    """
+    Sort the metrics returned by a training function by how they are logged.
+
+    Returns:
+        - tuple: (scalars, histories, arrays, dataframes). scalars maps names to floats,
+        histories maps names to (steps, values) lists, arrays maps names to the NumPy
+        arrays logged as .npy artifacts, and dataframes maps names to DataFrames.
+    """
+    scalars, histories, arrays, dataframes = {}, {}, {}, {}
+
+    for name, value in metrics.items():
+        if _is_dataframe(value):
+            dataframes[name] = value
+            continue
+
+        array = _as_array(value)
+        if array is None:
+            scalars[name] = value
+        elif array.ndim == 0 or array.size == 1:
+            scalars[name] = array.item()
+        elif array.ndim == 1 and array.size <= max_history_steps and np.issubdtype(array.dtype, np.number):
+            # One conversion for the whole array instead of a float() call per element
+            values = array.astype(np.float64, copy=False).tolist()
+            histories[name] = (_history_steps(value, len(values)), values)
+        else:
+            arrays[name] = array
+
+    return scalars, histories, arrays, dataframes
+
+
+def _write_array(array, path):
+    """Save the array in .npy format, which np.load can memory-map with mmap_mode="r"."""
+    np.save(path, np.ascontiguousarray(array), allow_pickle=array.dtype.hasobject)
+
+
+def _log_array(run_id, name, array, tmp_dir, uploader=None):
+    """
+    Log an array as the run artifact <name>.npy.
+    """
+    local_path = os.path.join(tmp_dir, name + ARRAY_EXTENSION)
+    _write_array(array, local_path)
+    _log_artifact(run_id, local_path, uploader=uploader)
+    os.remove(local_path)
@@ -0,0 +1,293 @@
+import os
+import sys
+import tempfile
+import threading
+import warnings
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+import mlflow
+from mlflow import MlflowClient
+
+
+DATAFRAME_FORMATS = ("csv", "parquet")
+
+_CSV_COMPRESSION_EXTENSIONS = {
+    "gzip": ".gz",
+    "bz2": ".bz2",
+    "zip": ".zip",
+    "xz": ".xz",
+    "zstd": ".zst"
+}
+
+# Number of chunk uploads in flight while the next chunk is being serialized.
+MAX_PARALLEL_CHUNK_UPLOADS = 4
+
+# Bucket that the bundled MLflow server proxies mlflow-artifacts:/ URIs to.
+ARTIFACT_BUCKET = "mlflow-artifacts"
+
+DEFAULT_UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+DEFAULT_UPLOAD_CONCURRENCY = 8
+
+# Runs whose artifact location an uploader remembers, least recently used first out.
+MAX_CACHED_ARTIFACT_ROOTS = 1024
+
+
+def _is_dataframe(value):
+    """
+    Check for a pandas DataFrame without importing pandas. If pandas was never 
+    imported, value cannot be a DataFrame.
+    """
+    pd = sys.modules.get("pandas")
+    return pd is not None and isinstance(value, pd.DataFrame)
+
+
+def _check_dataframe_format(dataframe_format, compression=None):
+    """
+    Validate the DataFrame artifact format and make sure its writer is installed,
+    so that a bad configuration fails when the logger is created.
+
+    Raises:
+        ValueError: If the format or the CSV compression is not supported.
+        ModuleNotFoundError: If parquet is requested but pyarrow is not installed.
+    """
+    if dataframe_format not in DATAFRAME_FORMATS:
+        raise ValueError(f"dataframe_format must be one of {DATAFRAME_FORMATS}. Provided '{dataframe_format}'")
+
+    if dataframe_format == "csv" and compression and compression not in _CSV_COMPRESSION_EXTENSIONS:
+        raise ValueError(f"CSV compression must be one of {tuple(_CSV_COMPRESSION_EXTENSIONS)}. Provided '{compression}'")
+
+    if dataframe_format == "parquet":
+        try:
+            import pyarrow
+        except ModuleNotFoundError:
+            raise ModuleNotFoundError("pyarrow is required for dataframe_format='parquet'. Install it with pip install pyarrow.")
+
+
+def _dataframe_extension(dataframe_format, compression=None):
+    if dataframe_format == "parquet":
+        return ".parquet"
+    return ".csv" + _CSV_COMPRESSION_EXTENSIONS.get(compression, "")
+
+
+def _write_dataframe(df, path, dataframe_format="csv", compression=None):
+    """
+    Serialize the DataFrame to path without its index.
+    """
+    if dataframe_format == "parquet":
+        df.to_parquet(path, index=False, compression=compression or "snappy")
+    else:
+        df.to_csv(path, index=False, compression=compression)
+
+
+def _log_dataframe(run_id, name, df, dataframe_format="csv", compression=None, chunk_rows=None, uploader=None):
+    """
+    Log a DataFrame as a run artifact. The file is written to a private temporary
+    directory, so concurrent runs never collide and the working directory is untouched.
+
+    Parameters:
+        - run_id (str): The MLflow run ID.
+        - name (str): The artifact name, without extension.
+        - df (DataFrame): The DataFrame to log.
+        - dataframe_format (str): "csv" or "parquet". Defaults to "csv".
+        - compression (str, optional): Compression codec. For CSV one of gzip, bz2,
+        zip, xz or zstd. For parquet any codec pyarrow supports. Defaults to no
+        compression for CSV and snappy for parquet.
+        - chunk_rows (int, optional): If set and the DataFrame has more rows, it is
+        logged as a directory <name>/ of part files with at most chunk_rows rows
+        each. Parts are uploaded while the next one is being written.
+        - uploader (S3ArtifactUploader, optional): Upload straight to the artifact 
+        store instead of through the tracking server.
+    """
+    client = MlflowClient(mlflow.get_tracking_uri())
+    extension = _dataframe_extension(dataframe_format, compression)
+
+    with tempfile.TemporaryDirectory(prefix="squid-") as tmp_dir:
+        if not chunk_rows or len(df) <= chunk_rows:
+            local_path = os.path.join(tmp_dir, name + extension)
+            _write_dataframe(df, local_path, dataframe_format, compression)
+            _log_artifact(run_id, local_path, uploader=uploader, client=client)
+            return
+
+        def upload(local_path):
+            _log_artifact(run_id, local_path, artifact_path=name, uploader=uploader, client=client)
+            os.remove(local_path)
+
+        with ThreadPoolExecutor(max_workers=MAX_PARALLEL_CHUNK_UPLOADS) as executor:
+            pending = []
+            for i, start in enumerate(range(0, len(df), chunk_rows)):
+                local_path = os.path.join(tmp_dir, f"part-{i:05d}{extension}")
+                _write_dataframe(df.iloc[start:start + chunk_rows], local_path, dataframe_format, compression)
+                pending.append(executor.submit(upload, local_path))
+
+                # Bound the number of serialized parts waiting on disk
+                if len(pending) > MAX_PARALLEL_CHUNK_UPLOADS:
+                    pending.pop(0).result()
+
+            for future in pending:
+                future.result()
+
+
+def _log_artifact(run_id, local_path, artifact_path=None, uploader=None, client=None):
+    """
+    Log a local file as a run artifact, straight to the artifact store if an 
+    uploader is given and can reach it, through the tracking server otherwise.
+    """
+    if uploader is not None and uploader.upload(run_id, local_path, artifact_path):
+        return
+
+    client = client or MlflowClient(mlflow.get_tracking_uri())
+    client.log_artifact(run_id, local_path, artifact_path=artifact_path)
+
+
+class S3ArtifactUploader:
+    """
+    Uploads run artifacts straight to the S3 compatible bucket behind the tracking 
+    server, instead of proxying them through the server's HTTP API.
+
+    Files larger than chunk_size are sent as multipart uploads with up to 
+    max_concurrency parts in flight. If the artifact store cannot be reached, 
+    upload() returns False so the caller falls back to the proxy, and direct 
+    uploads are not tried again by this uploader.
+
+    Only artifacts that squid logs itself are uploaded directly. Models and other 
+    artifacts logged by MLflow autologging always go through the tracking server.
+    """
+    def __init__(
+            self, 
+            endpoint_url=None, 
+            access_key=None, 
+            secret_key=None, 
+            chunk_size=DEFAULT_UPLOAD_CHUNK_SIZE, 
+            max_concurrency=DEFAULT_UPLOAD_CONCURRENCY, 
+            bucket=ARTIFACT_BUCKET,
+            prefix=None
+        ):
+        """
+        Parameters:
+            - endpoint_url (str, optional): URL of the artifact store. Defaults to 
+            SQUID_ML_ARTIFACT_STORE_URL, which squid.Server sets.
+            - access_key (str, optional): Defaults to SQUID_ML_ARTIFACT_STORE_ACCESS_KEY.
+            - secret_key (str, optional): Defaults to SQUID_ML_ARTIFACT_STORE_SECRET_KEY.
+            - chunk_size (int): Size in bytes of each part of a multipart upload, 
+            and the size above which multipart is used. Defaults to 8 MiB.
+            - max_concurrency (int): Number of parts uploaded in parallel. Defaults to 8.
+            - bucket (str): Bucket that mlflow-artifacts:/ URIs resolve to. Defaults 
+            to "mlflow-artifacts".
+            - prefix (str, optional): Key prefix that mlflow-artifacts:/ URIs resolve to, 
+            for servers started with Server(shared=True). Defaults to 
+            SQUID_ML_ARTIFACT_STORE_PREFIX, which squid.Server sets.
+        """
+        if chunk_size < 5 * 1024 * 1024:
+            raise ValueError(f"chunk_size must be at least 5 MiB, the S3 minimum part size. Provided {chunk_size}")
+        if max_concurrency < 1:
+            raise ValueError(f"max_concurrency must be at least 1. Provided {max_concurrency}")
+
+        self.endpoint_url = endpoint_url or os.environ.get("SQUID_ML_ARTIFACT_STORE_URL")
+        self.access_key = access_key or os.environ.get("SQUID_ML_ARTIFACT_STORE_ACCESS_KEY")
+        self.secret_key = secret_key or os.environ.get("SQUID_ML_ARTIFACT_STORE_SECRET_KEY")
+        self.chunk_size = chunk_size
+        self.max_concurrency = max_concurrency
+        self.bucket = bucket
+        self.prefix = (prefix if prefix is not None else os.environ.get("SQUID_ML_ARTIFACT_STORE_PREFIX", "")).strip("/")
+
+        self._init_process_state()
+
+    def _init_process_state(self):
+        self._client = None
+        self._transfer_config = None
+        self._artifact_roots = OrderedDict()
+        self._disabled = False
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for name in ("_client", "_transfer_config", "_artifact_roots", "_disabled", "_lock"):
+            del state[name]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._init_process_state()
+
+    def _s3(self):
+        """Create the boto3 client on first use. boto3 clients are thread safe."""
+        with self._lock:
+            if self._client is None:
+                import boto3
+                from boto3.s3.transfer import TransferConfig
+
+                self._client = boto3.client(
+                    "s3", 
+                    endpoint_url=self.endpoint_url, 
+                    aws_access_key_id=self.access_key, 
+                    aws_secret_access_key=self.secret_key
+                )
+                self._transfer_config = TransferConfig(
+                    multipart_threshold=self.chunk_size,
+                    multipart_chunksize=self.chunk_size,
+                    max_concurrency=self.max_concurrency,
+                    use_threads=self.max_concurrency > 1
+                )
+            return self._client
+
+    def _artifact_root(self, run_id):
+        """
+        Bucket and key prefix of the run's artifacts, or None if the run's artifact 
+        URI does not point to the artifact store.
+        """
+        with self._lock:
+            if run_id in self._artifact_roots:
+                self._artifact_roots.move_to_end(run_id)
+                return self._artifact_roots[run_id]
+
+        artifact_uri = MlflowClient(mlflow.get_tracking_uri()).get_run(run_id).info.artifact_uri
+        parsed = urlparse(artifact_uri)
+        if parsed.scheme == "mlflow-artifacts":
+            # Served with --artifacts-destination s3://<bucket>/<prefix>
+            root = (self.bucket, self._mlflow_artifacts_key(parsed.path))
+        elif parsed.scheme == "s3":
+            root = (parsed.netloc, parsed.path.strip("/"))
+        else:
+            root = None
+
+        with self._lock:
+            self._artifact_roots[run_id] = root
+            self._artifact_roots.move_to_end(run_id)
+            while len(self._artifact_roots) > MAX_CACHED_ARTIFACT_ROOTS:
+                self._artifact_roots.popitem(last=False)
+        return root
+
+    def _mlflow_artifacts_key(self, path):
+        """The bucket key that the path of an mlflow-artifacts:/ URI resolves to."""
+        return "/".join(p for p in (self.prefix, path.strip("/")) if p)
+
+    def upload(self, run_id, local_path, artifact_path=None):
+        """
+        Upload a file to the run's artifact directory.
+
+        Returns:
+            - bool: True if the file was uploaded, False if the caller should use 
+            the tracking server instead.
+        """
+        if self._disabled or not self.endpoint_url:
+            return False
+
+        root = self._artifact_root(run_id)
+        if root is None:
+            return False
+
+        bucket, prefix = root
+        key = "/".join(p for p in (prefix, artifact_path, os.path.basename(local_path)) if p)
+
+        try:
+            self._s3().upload_file(local_path, bucket, key, Config=self._transfer_config)
+        except Exception as e:
+            self._disabled = True
+            warnings.warn(
+                f"Direct upload to the artifact store at {self.endpoint_url} failed ({e!r}). "
+                "Uploading through the tracking server instead."
+            )
+            return False
+
+        return True
@@ -0,0 +1,223 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+from urllib.parse import urlparse
+import mlflow
+from mlflow import MlflowClient
+from mlflow.store.artifact.artifact_repository_registry import get_artifact_repository
+
+
+__all__ = ["download_artifacts"]
+
+
+# Directory next to the experiment directories that holds blobs named by their hash.
+CAS_DIRNAME = "squid-cas"
+
+# Runs reference a deduplicated artifact with a tag squid.ref.<artifact path>.
+REF_TAG_PREFIX = "squid.ref."
+
+# Smaller files are uploaded as usual, since the hash and the lookup cost more than they save.
+DEFAULT_DEDUP_MIN_BYTES = 1024 * 1024
+
+_HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def _hash_file(path):
+    """SHA-256 of the file, read in chunks so large files are never held in memory."""
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK_SIZE), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def _cas_root(artifact_uri, run_id):
+    """
+    The content-addressed area for a run: a squid-cas directory next to the
+    experiment directories, like mlflow-artifacts:/squid-cas for runs in
+    mlflow-artifacts:/<experiment>/<run_id>/artifacts.
+    """
+    suffix = f"/{run_id}/artifacts"
+    if not artifact_uri.endswith(suffix):
+        return None
+
+    experiment_uri = artifact_uri[:-len(suffix)]
+    if not urlparse(experiment_uri).path.strip("/"):
+        return None
+    return f"{experiment_uri.rstrip('/').rsplit('/', 1)[0]}/{CAS_DIRNAME}"
+
+
+class DedupUploader:
+    """
+    Uploads each distinct artifact content once. Files of at least min_bytes are
+    hashed, stored once under <hash[:2]>/<hash> in the content-addressed area of
+    the artifact store, and referenced from the run by a squid.ref.<artifact path>
+    tag. Use download_artifacts() to read artifacts that may be deduplicated.
+
+    Blobs are stored through the wrapped uploader's direct connection to the
+    bucket if there is one, and through MLflow's artifact repositories otherwise.
+    """
+    def __init__(self, uploader=None, min_bytes=DEFAULT_DEDUP_MIN_BYTES):
+        """
+        Parameters:
+            - uploader (S3ArtifactUploader, optional): Uploader for files below
+            min_bytes, and for blobs if it can reach the bucket.
+            - min_bytes (int): Size from which files are deduplicated. Defaults to 1 MiB.
+        """
+        self.uploader = uploader
+        self.min_bytes = min_bytes
+        self._init_process_state()
+
+    def _init_process_state(self):
+        # Blobs known to exist, as (CAS root, hash)
+        self._known_blobs = set()
+        self._artifact_uris = {}
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for name in ("_known_blobs", "_artifact_uris", "_lock"):
+            del state[name]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._init_process_state()
+
+    def _artifact_uri(self, run_id):
+        with self._lock:
+            if run_id in self._artifact_uris:
+                return self._artifact_uris[run_id]
+        artifact_uri = MlflowClient(mlflow.get_tracking_uri()).get_run(run_id).info.artifact_uri
+        with self._lock:
+            self._artifact_uris[run_id] = artifact_uri
+        return artifact_uri
+
+    def upload(self, run_id, local_path, artifact_path=None):
+        """
+        Upload the file, or only reference it if its content is already stored.
+
+        Returns:
+            - bool: True if the file was uploaded or referenced, False if the caller
+            should upload it through the tracking server.
+        """
+        if os.path.getsize(local_path) < self.min_bytes:
+            return self.uploader is not None and self.uploader.upload(run_id, local_path, artifact_path)
+
+        cas_root = _cas_root(self._artifact_uri(run_id), run_id)
+        if cas_root is None:
+            return self.uploader is not None and self.uploader.upload(run_id, local_path, artifact_path)
+
+        digest = _hash_file(local_path)
+        self._put_blob(cas_root, digest, local_path)
+
+        name = "/".join(p for p in (artifact_path, os.path.basename(local_path)) if p)
+        reference = {"uri": f"{cas_root}/{digest[:2]}/{digest}", "sha256": digest, "size": os.path.getsize(local_path)}
+        MlflowClient(mlflow.get_tracking_uri()).set_tag(run_id, REF_TAG_PREFIX + name, json.dumps(reference))
+        return True
+
+    def _put_blob(self, cas_root, digest, local_path):
+        """Store the file under its hash, unless a blob with that hash exists."""
+        key = (cas_root, digest)
+        with self._lock:
+            if key in self._known_blobs:
+                return
+
+        if not (self._put_blob_direct(cas_root, digest, local_path) or self._put_blob_repository(cas_root, digest, local_path)):
+            raise RuntimeError(f"Could not store blob {digest} in {cas_root}.")
+
+        with self._lock:
+            self._known_blobs.add(key)
+
+    def _put_blob_direct(self, cas_root, digest, local_path):
+        uploader = self.uploader
+        if uploader is None or uploader._disabled or not uploader.endpoint_url:
+            return False
+
+        parsed = urlparse(cas_root)
+        if parsed.scheme == "mlflow-artifacts":
+            bucket, prefix = uploader.bucket, uploader._mlflow_artifacts_key(parsed.path)
+        elif parsed.scheme == "s3":
+            bucket, prefix = parsed.netloc, parsed.path.strip("/")
+        else:
+            return False
+
+        blob_key = f"{prefix}/{digest[:2]}/{digest}"
+        try:
+            s3 = uploader._s3()
+            try:
+                s3.head_object(Bucket=bucket, Key=blob_key)
+            except s3.exceptions.ClientError as e:
+                if e.response.get("Error", {}).get("Code") not in ("404", "NoSuchKey", "NotFound"):
+                    raise
+                s3.upload_file(local_path, bucket, blob_key, Config=uploader._transfer_config)
+        except Exception:
+            return False
+        return True
+
+    def _put_blob_repository(self, cas_root, digest, local_path):
+        repository = get_artifact_repository(cas_root)
+        existing = {f.path for f in repository.list_artifacts(digest[:2])}
+        if f"{digest[:2]}/{digest}" in existing:
+            return True
+
+        # The blob's file name is its hash
+        with tempfile.TemporaryDirectory(prefix="squid-") as tmp_dir:
+            blob_path = os.path.join(tmp_dir, digest)
+            try:
+                os.link(local_path, blob_path)
+            except OSError:
+                shutil.copyfile(local_path, blob_path)
+            repository.log_artifact(blob_path, artifact_path=digest[:2])
+        return True
+
+
+def download_artifacts(run_id, artifact_path, dst_path):
+    """
+    Download a run artifact or directory like mlflow.artifacts.download_artifacts,
+    including files that were deduplicated into the content-addressed area.
+
+    Parameters:
+        - run_id (str): The MLflow run ID.
+        - artifact_path (str): Path of the file or directory in the run's artifacts.
+        - dst_path (str): Local directory to download to.
+
+    Returns:
+        - str: The local path of the file or directory.
+    """
+    run = MlflowClient(mlflow.get_tracking_uri()).get_run(run_id)
+    references = {
+        key[len(REF_TAG_PREFIX):]: json.loads(value)
+        for key, value in run.data.tags.items()
+        if key.startswith(REF_TAG_PREFIX)
+    }
+
+    if artifact_path in references:
+        return _download_blob(references[artifact_path], os.path.join(dst_path, artifact_path))
+
+    in_directory = {p: ref for p, ref in references.items() if p.startswith(artifact_path.rstrip("/") + "/")}
+    if not in_directory:
+        return mlflow.artifacts.download_artifacts(run_id=run_id, artifact_path=artifact_path, dst_path=dst_path)
+
+    # A directory whose large files were deduplicated, and small ones uploaded as usual
+    local_dir = os.path.join(dst_path, artifact_path)
+    os.makedirs(local_dir, exist_ok=True)
+    client = MlflowClient(mlflow.get_tracking_uri())
+    if client.list_artifacts(run_id, artifact_path):
+        mlflow.artifacts.download_artifacts(run_id=run_id, artifact_path=artifact_path, dst_path=dst_path)
+    for path, reference in in_directory.items():
+        _download_blob(reference, os.path.join(dst_path, path))
+    return local_dir
+
+
+def _download_blob(reference, local_path):
+    cas_root, prefix, digest = reference["uri"].rsplit("/", 2)
+    blob_path = f"{prefix}/{digest}"
+    os.makedirs(os.path.dirname(local_path), exist_ok=True)
+    with tempfile.TemporaryDirectory(prefix="squid-") as tmp_dir:
+        downloaded = get_artifact_repository(cas_root).download_artifacts(blob_path, dst_path=tmp_dir)
+        shutil.move(downloaded, local_path)
+    return local_path
@@ -0,0 +1,172 @@
+import atexit
+import contextvars
+import os
+import queue
+import threading
+import warnings
+import weakref
+
+
+class AsyncLoggingError(RuntimeError):
+    """
+    Raised when one or more queued logging jobs failed.
+
+    Attributes:
+        errors (list): The exceptions raised by the failed jobs, in the order they failed.
+    """
+    def __init__(self, errors):
+        self.errors = errors
+        message = f"{len(errors)} asynchronous logging job(s) failed. First error: {errors[0]!r}"
+        super().__init__(message)
+
+
+_STOP = object()
+
+# Queues that were not closed yet, closed when the interpreter exits. Weak, so that a
+# queue that goes out of scope is released, and its workers stopped by its finalizer.
+_live_queues = weakref.WeakSet()
+
+
+@atexit.register
+def _close_live_queues():
+    for logging_queue in list(_live_queues):
+        try:
+            logging_queue.close()
+        except AsyncLoggingError as e:
+            warnings.warn(str(e))
+
+
+def _work(jobs, errors, lock):
+    """Run jobs until _STOP. Workers do not reference their LoggingQueue, so it can be released."""
+    while True:
+        job = jobs.get()
+        try:
+            if job is _STOP:
+                return
+            context, fn, args, kwargs = job
+            context.run(fn, *args, **kwargs)
+        except Exception as e:
+            with lock:
+                errors.append(e)
+        finally:
+            jobs.task_done()
+
+
+def _stop_workers(jobs, num_workers):
+    """Stop the workers of a released queue once its pending jobs have run."""
+    for _ in range(num_workers):
+        jobs.put(_STOP)
+
+
+class LoggingQueue:
+    """
+    A bounded in-process queue of logging jobs, drained by a pool of worker threads.
+
+    submit() blocks while the queue is full, so a caller that produces logging
+    work faster than the tracking server accepts it is slowed down instead of
+    growing memory without bound. Failures are collected and raised from flush()
+    and close().
+    """
+    def __init__(self, max_size=1000, num_workers=2):
+        """
+        Parameters:
+            - max_size (int): Maximum number of pending jobs before submit() blocks.
+            - num_workers (int): Number of worker threads draining the queue.
+        """
+        if num_workers < 1:
+            raise ValueError(f"num_workers must be at least 1. Provided {num_workers}")
+
+        self.max_size = max_size
+        self.num_workers = num_workers
+        self._closed = False
+        self._finalizer = None
+        self._reset()
+
+        _live_queues.add(self)
+
+    def _reset(self):
+        """Create a fresh queue and worker pool, owned by the current process."""
+        self._pid = os.getpid()
+        self._queue = queue.Queue(maxsize=self.max_size)
+        self._errors = []
+        self._lock = threading.Lock()
+        self._workers = []
+
+    def _ensure_owned(self):
+        # Worker threads do not survive a fork, so a child process starts its own.
+        # Jobs queued by the parent stay with the parent.
+        if self._pid != os.getpid():
+            self._reset()
+
+    def _start_workers(self):
+        """Start the worker threads on first use."""
+        with self._lock:
+            if self._workers:
+                return
+            for i in range(self.num_workers):
+                worker = threading.Thread(
+                    target=_work,
+                    args=(self._queue, self._errors, self._lock),
+                    name=f"squid-logging-{i}",
+                    daemon=True
+                )
+                worker.start()
+                self._workers.append(worker)
+
+            # Closing at exit is left to _close_live_queues, which waits for the workers
+            self._finalizer = weakref.finalize(self, _stop_workers, self._queue, self.num_workers)
+            self._finalizer.atexit = False
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Queue fn(*args, **kwargs) to run on a worker thread. The job runs in a copy
+        of the caller's context, so context variables set by the caller are visible
+        to it. Blocks while the queue is full.
+        """
+        if self._closed:
+            raise RuntimeError("Cannot submit logging jobs to a closed LoggingQueue.")
+
+        self._ensure_owned()
+        self._start_workers()
+        self._queue.put((contextvars.copy_context(), fn, args, kwargs))
+
+    def _raise_errors(self):
+        with self._lock:
+            # Cleared in place, since the workers hold the list
+            errors = list(self._errors)
+            self._errors.clear()
+        if errors:
+            raise AsyncLoggingError(errors)
+
+    def flush(self):
+        """
+        Block until every queued job has finished.
+
+        Raises:
+            AsyncLoggingError: If any job failed since the last flush.
+        """
+        self._ensure_owned()
+        self._queue.join()
+        self._raise_errors()
+
+    def close(self):
+        """
+        Wait for pending jobs, then stop the worker threads. Further submits raise.
+
+        Raises:
+            AsyncLoggingError: If any job failed since the last flush.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        self._ensure_owned()
+
+        if self._finalizer is not None:
+            self._finalizer.detach()
+        for _ in self._workers:
+            self._queue.put(_STOP)
+        for worker in self._workers:
+            worker.join()
+
+        _live_queues.discard(self)
+        self._raise_errors()
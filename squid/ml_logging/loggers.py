@@ -1,26 +1,314 @@
-from functools import wraps
+import asyncio
+import os
+import threading
+import warnings
+import weakref
+from contextvars import ContextVar
+from functools import wraps, partial
 import mlflow
-from mlflow import MlflowClient
-from .utils import _start_run, _get_experiment_id
+from . import aio
+from .artifacts import (
+    _check_dataframe_format, _dataframe_extension, S3ArtifactUploader, 
+    DEFAULT_UPLOAD_CHUNK_SIZE, DEFAULT_UPLOAD_CONCURRENCY
+)
+from .dedup import DedupUploader, DEFAULT_DEDUP_MIN_BYTES
+from .dispatch import LoggingQueue
+from .persistence import ModelPersister, DEFAULT_MODEL_COMPRESSION
+from .memo import RunCache, _cache_key, _dataframe_tags, CACHE_KEY_TAG
+from .spool import RunSpool, _record_run, _tracking_server_available, SPOOL_DIR
+from .stream import _with_stream, _active_stream, _close_stream, MetricStream
+from .timing import RunTimings, _active_timings, _phase, _in_phase, _track_job
+from .utils import _start_run, _log_metrics, _log_batch, _set_tags, _get_estimator_tags, _get_experiment_id, _run_tags, _last_run_id
 
 
 __all__ = ["PytorchLogger", "SklearnLogger", "TensorflowLogger"]
 
 
+# Run ID of the invocation whose post-run hooks are executing. Queued jobs run in 
+# a copy of the submitting context, so they see the run they were submitted for.
+_current_run_id = ContextVar("squid_current_run_id", default=None)
+
+# Number of concurrent-mode loggers currently holding each autolog function enabled.
+_autolog_refcounts = {}
+_autolog_lock = threading.Lock()
+
+
+def _acquire_autolog(autolog, logging_kwargs):
+    """
+    Enable autologging if no other logger holds it, and take a reference.
+    """
+    with _autolog_lock:
+        if not _autolog_refcounts.get(autolog):
+            autolog(**logging_kwargs)
+        _autolog_refcounts[autolog] = _autolog_refcounts.get(autolog, 0) + 1
+
+
+def _release_autolog(autolog):
+    """
+    Drop a reference, and disable autologging once no logger holds it.
+    """
+    with _autolog_lock:
+        _autolog_refcounts[autolog] -= 1
+        if not _autolog_refcounts[autolog]:
+            del _autolog_refcounts[autolog]
+            autolog(disable=True)
+
+
+def _reset_autolog_lock():
+    # The lock may have been held by another thread when the process forked
+    global _autolog_lock
+    _autolog_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_autolog_lock)
+
+
 class MlflowLogger:
     """
     Base class for implementing autologging via mlflow.<flavor>.autolog
     """
-    def __init__(self, autolog, logging_kwargs={}):
+    def __init__(
+            self, 
+            autolog, 
+            logging_kwargs={}, 
+            batch_logging=True, 
+            async_logging=False, 
+            max_queue_size=1000, 
+            num_workers=2, 
+            spool_offline=False, 
+            spool_dir=None, 
+            dataframe_format="csv", 
+            dataframe_compression=None, 
+            dataframe_chunk_rows=None, 
+            concurrent=False, 
+            load_model=None, 
+            memoize=False, 
+            memo_max_entries=32, 
+            memo_ttl=None, 
+            direct_upload=None, 
+            upload_chunk_size=DEFAULT_UPLOAD_CHUNK_SIZE, 
+            upload_concurrency=DEFAULT_UPLOAD_CONCURRENCY, 
+            timing_log=None, 
+            timing_hook=None, 
+            stream_flush_interval=5.0, 
+            stream_downsample=None, 
+            dedup_artifacts=False, 
+            dedup_min_bytes=DEFAULT_DEDUP_MIN_BYTES, 
+            http_max_connections=aio.DEFAULT_MAX_CONNECTIONS, 
+            model_persistence=None, 
+            model_compression=DEFAULT_MODEL_COMPRESSION, 
+            skip_unchanged_models=True
+        ):
         """
         A base class to create decorators for logging model training with MLflow.
 
         Parameters:
         - autolog: The MLflow autolog function for the framework.
+        - logging_kwargs (dict): Keyword arguments passed to the autolog function.
+        - batch_logging (bool): If True, metrics and tags are sent to the tracking 
+        server in chunked log_batch calls. Set to False to log them one call at a time.
+        - async_logging (bool): If True, the returned metrics and the post-run hooks 
+        are logged by background worker threads, and the wrapped function returns 
+        as soon as training finishes. Call flush() or close() to wait for them.
+        - max_queue_size (int): Maximum number of pending logging jobs in async mode. 
+        Calls block while the queue is full.
+        - num_workers (int): Number of worker threads in async mode.
+        - spool_offline (bool): If True, runs are recorded to a local spool instead of 
+        failing when the tracking server is unreachable. Spooled runs are pushed by 
+        replay_spool(), which Server.start() calls.
+        - spool_dir (str, optional): The spool directory. Defaults to SQUID_ML_SPOOL_DIR 
+        or ~/.squid/spool.
+        - dataframe_format (str): Format of DataFrame metrics logged as artifacts, 
+        "csv" or "parquet". Defaults to "csv".
+        - dataframe_compression (str, optional): Compression codec for DataFrame artifacts, 
+        like "gzip" for CSV or "zstd" for parquet.
+        - dataframe_chunk_rows (int, optional): If set, DataFrames with more rows are 
+        logged as a directory of part files that are uploaded in parallel.
+        - concurrent (bool): If True, the decorated function can be called from several 
+        threads or processes at once. Run state is kept per invocation, and autologging 
+        is enabled on the first call and stays enabled until close() is called on every 
+        concurrent logger of the same flavor.
+        - load_model: The MLflow load_model function for the framework. Required for memoize.
+        - memoize (bool): If True, a call whose function source, array and DataFrame inputs 
+        and model hyperparameters match a finished run in the experiment returns that run's 
+        logged model and metrics instead of training again. Pass force_rerun=True as a kwarg 
+        to train anyway. The model must be logged, i.e. log_models must not be False. Input 
+        files passed as paths are matched by size and modification time. Calls with inputs 
+        whose repr includes their address are not memoized. Cache hits kept in memory 
+        return the same model object, so copy it before modifying it.
+        - memo_max_entries (int): Number of memoized results kept in memory. Defaults to 32.
+        - memo_ttl (float, optional): Seconds after which a logged run is no longer reused. 
+        Defaults to no expiry.
+        - direct_upload (bool, optional): If True, artifacts logged by squid, like DataFrame 
+        metrics and model graphs, are uploaded straight to the artifact store bucket with 
+        multipart uploads, and only fall back to the tracking server if the store cannot be 
+        reached. Models logged by autologging still go through the tracking server. 
+        Defaults to True if the Server was created with direct_artifact_uploads=True.
+        - upload_chunk_size (int): Part size in bytes for direct multipart uploads. Defaults to 8 MiB.
+        - upload_concurrency (int): Number of parts of a file uploaded in parallel. Defaults to 8.
+        - timing_log (str, optional): Log the time spent in each phase of a run, like 
+        experiment_lookup, training or artifact_upload, to the run as "tags" or "metrics" 
+        named squid.timing.<phase>. Defaults to not logging them. The timings of the latest 
+        run are always available as last_timings.
+        - timing_hook (optional): Callable receiving the RunTimings of every run once all 
+        its phases have finished, e.g. squid.ml_logging.timing.opentelemetry_hook(). In 
+        async mode it is called from a worker thread.
+        - stream_flush_interval (float): Maximum seconds between uploads of the points 
+        logged through metric_stream() inside the decorated function. Defaults to 5.
+        - stream_downsample (int or dict, optional): Window size k, or metric names mapped 
+        to window sizes. Every k consecutive points a metric stream receives are uploaded as 
+        one point with their mean value.
+        - dedup_artifacts (bool): If True, artifacts logged by squid of at least dedup_min_bytes 
+        are stored once per distinct content in a squid-cas area of the artifact store, and 
+        referenced from the run by a squid.ref.<path> tag. Read them with 
+        squid.ml_logging.dedup.download_artifacts. Defaults to False.
+        - dedup_min_bytes (int): Size from which artifacts are deduplicated. Defaults to 1 MiB.
+        - http_max_connections (int): Connections to the tracking server pooled by the 
+        async client that log_async() uses, per event loop. Defaults to 16.
+        - model_persistence (str, optional): "fast" to log the model with squid instead of 
+        autolog: torch modules as their state_dict, Keras models as their weights and other 
+        models with joblib, compressed with model_compression. Serialization and upload are 
+        timed as separate phases. Load the model with 
+        squid.ml_logging.persistence.load_persisted_model. Defaults to autolog's model logging.
+        - model_compression (int): Compression level from 0 to 9 for model_persistence="fast". 
+        Defaults to 3.
+        - skip_unchanged_models (bool): With model_persistence="fast", do not upload a model 
+        whose weights hash matches a model already logged in the experiment. The run references 
+        the earlier file instead. Defaults to True.
         """
         self.autolog = autolog
         self.logging_kwargs = logging_kwargs
-        self._latest_run_id = None
+        self.batch_logging = batch_logging
+        self.async_logging = async_logging
+        self.spool_offline = spool_offline
+        self.spool_dir = spool_dir or SPOOL_DIR
+
+        _check_dataframe_format(dataframe_format, dataframe_compression)
+        self.dataframe_format = dataframe_format
+        self.dataframe_compression = dataframe_compression
+        self.dataframe_chunk_rows = dataframe_chunk_rows
+        self.concurrent = concurrent
+        self.load_model = load_model
+        self.memoize = memoize
+        self.memo_max_entries = memo_max_entries
+        self.memo_ttl = memo_ttl
+        if self.memoize and self.load_model is None:
+            raise ValueError("load_model must be provided to use memoize=True.")
+
+        if model_persistence not in (None, "fast"):
+            raise ValueError(f"model_persistence must be None or 'fast'. Provided '{model_persistence}'")
+        if model_persistence and self.memoize:
+            raise ValueError("memoize reloads models logged by autolog, so it cannot be combined with model_persistence='fast'.")
+        self.model_persistence = model_persistence
+        if model_persistence:
+            # The model is logged by the persister instead
+            self.logging_kwargs = {**logging_kwargs, "log_models": False}
+
+        if direct_upload is None:
+            direct_upload = os.environ.get("SQUID_ML_DIRECT_UPLOADS", "").lower() == "true"
+        self.uploader = None
+        if direct_upload:
+            self.uploader = S3ArtifactUploader(chunk_size=upload_chunk_size, max_concurrency=upload_concurrency)
+        if dedup_artifacts:
+            self.uploader = DedupUploader(self.uploader, min_bytes=dedup_min_bytes)
+
+        self.persister = None
+        if model_persistence == "fast":
+            self.persister = ModelPersister(
+                compression_level=model_compression, 
+                skip_unchanged=skip_unchanged_models, 
+                uploader=self.uploader
+            )
+
+        if timing_log not in (None, "tags", "metrics"):
+            raise ValueError(f"timing_log must be None, 'tags' or 'metrics'. Provided '{timing_log}'")
+        self.timing_log = timing_log
+        self.timing_hook = timing_hook
+        self.stream_flush_interval = stream_flush_interval
+        self.stream_downsample = stream_downsample
+        self.http_max_connections = http_max_connections
+
+        self._max_queue_size = max_queue_size
+        self._num_workers = num_workers
+        self._shared_run_id = None
+        self._shared_timings = None
+
+        self._init_process_state()
+
+
+    def _init_process_state(self):
+        """
+        Create the state that cannot be shared with other processes: the logging 
+        queue, the context-local run ID and the autolog reference.
+        """
+        self._queue = None
+        if self.async_logging:
+            self._queue = LoggingQueue(max_size=self._max_queue_size, num_workers=self._num_workers)
+
+        self._run_cache = None
+        if self.memoize:
+            self._run_cache = RunCache(self.load_model, max_entries=self.memo_max_entries, ttl=self.memo_ttl)
+
+        self._run_id_var = ContextVar(f"squid_latest_run_id_{id(self)}", default=None)
+        self._timings_var = ContextVar(f"squid_latest_timings_{id(self)}", default=None)
+        self._autolog_lock = threading.Lock()
+        self._holds_autolog = False
+
+        # One pooled async client per event loop, since httpx connections are bound to their loop
+        self._async_clients = weakref.WeakKeyDictionary()
+
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for key in ("_queue", "_run_cache", "_run_id_var", "_timings_var", "_autolog_lock", "_holds_autolog", "_async_clients"):
+            del state[key]
+        state["_shared_timings"] = None
+        return state
+
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._init_process_state()
+
+
+    @property
+    def _latest_run_id(self):
+        """
+        ID of the latest run. In concurrent mode, the latest run started from the current 
+        thread or context.
+        """
+        if self.concurrent:
+            return self._run_id_var.get()
+        return self._shared_run_id
+
+
+    @_latest_run_id.setter
+    def _latest_run_id(self, run_id):
+        if self.concurrent:
+            self._run_id_var.set(run_id)
+        else:
+            self._shared_run_id = run_id
+
+
+    @property
+    def last_timings(self):
+        """
+        RunTimings of the latest run. In concurrent mode, the latest run started from 
+        the current thread or context. In async mode, check complete before reading 
+        the logging phases.
+        """
+        if self.concurrent:
+            return self._timings_var.get()
+        return self._shared_timings
+
+
+    @last_timings.setter
+    def last_timings(self, timings):
+        if self.concurrent:
+            self._timings_var.set(timings)
+        else:
+            self._shared_timings = timings
 
 
     def log(self, func):
@@ -36,26 +324,351 @@ class MlflowLogger:
             wrapped_func_name = func.__name__
             self._sanity_check(wrapped_func_name, *args, **kwargs)
 
-            # Set the experiment
             experiment_name = kwargs["experiment_name"]
-            experiment_id = _get_experiment_id(experiment_name)
-            mlflow.set_experiment(experiment_id=experiment_id)
 
-            # Enable autologging
-            self.autolog(**self.logging_kwargs)
+            if self.spool_offline and not _tracking_server_available():
+                return self._run_offline(func, args, kwargs, experiment_name)
 
+            timings = RunTimings()
+            self.last_timings = timings
+            timings_token = _active_timings.set(timings)
+            try:
+                return self._run(func, args, kwargs, experiment_name, timings)
+            finally:
+                _active_timings.reset(timings_token)
+                timings._seal(self._report_timings)
+
+        wrapper._squid_logger = self
+        return wrapper
+
+
+    def log_async(self, func):
+        """
+        The decorator for async def training functions, for pipelines running in an
+        asyncio service. The run is created, and its metrics, tags and artifacts are
+        logged, through a pooled async client for the tracking server's REST API, so
+        the event loop is never blocked by MLflow calls. Artifact uploads and metric
+        batches are sent concurrently.
+
+        Autologging is not enabled, since it records to MLflow's active run, which
+        tasks on the same event loop would share. memoize and spool_offline only apply
+        to log(). Requires an http(s) tracking URI and httpx.
+
+        Returns:
+        - A wrapped coroutine function that logs the training process with MLflow.
+        """
+
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            wrapped_func_name = func.__name__
+            self._sanity_check(wrapped_func_name, *args, **kwargs)
+
+            experiment_name = kwargs["experiment_name"]
+
+            timings = RunTimings()
+            self.last_timings = timings
+            timings_token = _active_timings.set(timings)
+            try:
+                return await self._arun(func, args, kwargs, experiment_name, timings)
+            finally:
+                _active_timings.reset(timings_token)
+                timings._seal()
+                await self._areport_timings(timings)
+
+        wrapper._squid_logger = self
+        return wrapper
+
+
+    def _async_client(self):
+        """
+        The pooled async client for the running event loop.
+        """
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            client = self._async_clients[loop] = aio.AsyncMlflowClient(max_connections=self.http_max_connections)
+        return client
+
+
+    async def _arun(self, func, args, kwargs, experiment_name, timings):
+        """
+        Run the training coroutine in an MLflow run created over REST, and log its results.
+        """
+        client = self._async_client()
+        info = await aio._start_run(client, experiment_name, tags=_run_tags.get())
+        run_id = info["run_id"]
+        timings.run_id = run_id
+        _last_run_id.set(run_id)
+
+        stream = MetricStream(
+            run_id=run_id,
+            flush_interval=self.stream_flush_interval,
+            downsample=self.stream_downsample
+        )
+        stream_token = _active_stream.set(stream)
+        try:
+            try:
+                with _phase("training"):
+                    model, metrics = await func(*args, **kwargs)
+            except BaseException as e:
+                _active_stream.reset(stream_token)
+                await aio._to_thread(_close_stream, stream, e)
+                raise
+            _active_stream.reset(stream_token)
+            await aio._to_thread(_close_stream, stream)
+
+            await aio._log_metrics(
+                client, run_id, info["artifact_uri"], metrics,
+                dataframe_format=self.dataframe_format,
+                dataframe_compression=self.dataframe_compression,
+                dataframe_chunk_rows=self.dataframe_chunk_rows,
+                uploader=self.uploader
+            )
+        except BaseException:
+            await client.update_run(run_id, status="FAILED")
+            raise
+        await client.update_run(run_id)
+
+        # Post-run hooks are synchronous, so they run on a thread
+        self._latest_run_id = run_id
+        token = _current_run_id.set(run_id)
+        try:
+            await aio._to_thread(self._dispatch, _in_phase("post_run", self.post_run), model, metrics, *args, **kwargs)
+        finally:
+            _current_run_id.reset(token)
+
+        if self.persister is not None:
+            await aio._to_thread(self._dispatch, self._persist_model, run_id, experiment_name, model)
+
+        return model, metrics
+
+
+    async def _areport_timings(self, timings):
+        """
+        The async counterpart of _report_timings.
+        """
+        try:
+            if self.timing_log == "tags" and timings.run_id:
+                await self._async_client().log_batch(timings.run_id, tags=timings.to_tags())
+            elif self.timing_log == "metrics" and timings.run_id:
+                await self._async_client().log_batch(timings.run_id, metrics=timings.to_metrics())
+
+            if self.timing_hook is not None:
+                self.timing_hook(timings)
+        except Exception as e:
+            warnings.warn(f"Reporting the timings of run {timings.run_id} failed: {e!r}")
+
+
+    def _run(self, func, args, kwargs, experiment_name, timings):
+        """
+        Run the training function in an MLflow run and log its results, timing each phase.
+        """
+        cache_key = None
+        if self._run_cache is not None:
+            with _phase("cache_lookup"):
+                cached = None
+                try:
+                    cache_key = _cache_key(func, args, kwargs)
+                except TypeError as e:
+                    warnings.warn(f"Training without memoization: {e}")
+                if cache_key is not None and not kwargs.get("force_rerun"):
+                    cached = self._run_cache.get(cache_key, _get_experiment_id(experiment_name))
+            if cached is not None:
+                model, metrics, self._latest_run_id = cached
+                timings.run_id = self._latest_run_id
+                return model, metrics
+
+        # Enable autologging
+        with _phase("autolog_setup"):
+            self._enable_autolog()
+
+        try:
             # Run the training function
-            model, metrics, run_id = _start_run(func, *args, **kwargs)
+            streaming_func = _with_stream(
+                func, 
+                flush_interval=self.stream_flush_interval, 
+                downsample=self.stream_downsample
+            )
+            model, metrics, run_id = _start_run(
+                streaming_func, args, kwargs, 
+                experiment_name=experiment_name, 
+                log_metrics=partial(self._dispatch, self._log_metrics)
+            )
+            timings.run_id = run_id
+
+            if cache_key is not None:
+                self._dispatch(_in_phase("cache_update", self._remember_run), cache_key, model, metrics, run_id)
 
             # Post-run hooks
             self._latest_run_id = run_id
-            self.post_run(model, metrics, *args, **kwargs)
-
+            token = _current_run_id.set(run_id)
+            try:
+                self._dispatch(_in_phase("post_run", self.post_run), model, metrics, *args, **kwargs)
+            finally:
+                _current_run_id.reset(token)
+
+            if self.persister is not None:
+                self._dispatch(self._persist_model, run_id, experiment_name, model)
+        finally:
             # Disable autologging
+            with _phase("autolog_setup"):
+                self._disable_autolog()
+
+        return model, metrics
+
+
+    def _report_timings(self, timings):
+        """
+        Log the run's timings as configured by timing_log, and pass them to timing_hook. 
+        Failures are reported as warnings, so that they never fail a finished run.
+        """
+        try:
+            if self.timing_log == "tags" and timings.run_id:
+                _set_tags(timings.run_id, timings.to_tags(), batch_logging=self.batch_logging)
+            elif self.timing_log == "metrics" and timings.run_id:
+                _log_batch(timings.run_id, metrics=timings.to_metrics())
+
+            if self.timing_hook is not None:
+                self.timing_hook(timings)
+        except Exception as e:
+            warnings.warn(f"Reporting the timings of run {timings.run_id} failed: {e!r}")
+
+
+    def _persist_model(self, run_id, experiment_name, model):
+        """
+        Log the model with the persister, in the experiment the run belongs to.
+        """
+        self.persister.persist(run_id, _get_experiment_id(experiment_name), model)
+
+
+    def _remember_run(self, cache_key, model, metrics, run_id):
+        """
+        Tag the run with its cache key so that later calls with the same inputs reuse it.
+        """
+        tags = {CACHE_KEY_TAG: cache_key}
+        tags.update(_dataframe_tags(
+            metrics, 
+            _dataframe_extension(self.dataframe_format, self.dataframe_compression), 
+            self.dataframe_chunk_rows
+        ))
+        _set_tags(run_id, tags, batch_logging=self.batch_logging)
+        self._run_cache.put(cache_key, model, metrics, run_id)
+
+
+    def clear_cache(self):
+        """
+        Drop the memoized results kept in memory. Logged runs are still found by their cache key.
+        """
+        if self._run_cache is not None:
+            self._run_cache.clear()
+
+
+    def _enable_autolog(self):
+        """
+        Enable autologging for a call. Concurrent loggers take a shared reference once 
+        instead of toggling autologging on every call.
+        """
+        if not self.concurrent:
+            self.autolog(**self.logging_kwargs)
+            return
+
+        with self._autolog_lock:
+            if not self._holds_autolog:
+                _acquire_autolog(self.autolog, self.logging_kwargs)
+                self._holds_autolog = True
+
+
+    def _disable_autolog(self):
+        if not self.concurrent:
             self.autolog(disable=True)
-            return model, metrics
 
-        return wrapper
+
+    def _run_offline(self, func, args, kwargs, experiment_name):
+        """
+        Run the training function without a tracking server, recording the run to the spool.
+        """
+        spool = RunSpool(self.spool_dir, experiment_name)
+        try:
+            model, metrics = func(*args, **kwargs)
+        except BaseException:
+            spool.end(status="FAILED")
+            raise
+
+        _record_run(spool, model, metrics, self.dataframe_format, self.dataframe_compression)
+        spool.end()
+
+        self._latest_run_id = None
+        return model, metrics
+
+
+    def _dispatch(self, fn, *args, **kwargs):
+        """
+        Run a logging call immediately, or queue it for the workers in async mode.
+        """
+        job = _track_job(fn)
+        if self._queue is not None:
+            self._queue.submit(job, *args, **kwargs)
+        else:
+            job(*args, **kwargs)
+
+
+    def _get_run_id(self):
+        """
+        Return the ID of the run that the current post-run hooks belong to.
+        """
+        return _current_run_id.get() or self._latest_run_id
+
+
+    def flush(self):
+        """
+        Block until all queued logging jobs have finished. No-op unless async_logging=True.
+
+        Raises:
+        - AsyncLoggingError: If any queued job failed.
+        """
+        if self._queue is not None:
+            self._queue.flush()
+
+
+    def close(self):
+        """
+        Wait for queued logging jobs and stop the worker threads, which also happens at 
+        interpreter exit. In concurrent mode, also release this logger's hold on autologging.
+
+        Raises:
+        - AsyncLoggingError: If any queued job failed.
+        """
+        if self._queue is not None:
+            self._queue.close()
+
+        with self._autolog_lock:
+            if self._holds_autolog:
+                _release_autolog(self.autolog)
+                self._holds_autolog = False
+
+
+    async def aclose(self):
+        """
+        Close the async client of the running event loop, and then the logger as close() does.
+        """
+        client = self._async_clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+        await aio._to_thread(self.close)
+
+
+    def _log_metrics(self, run_id, metrics):
+        """
+        Log the metrics returned by the wrapped function to the run.
+        """
+        _log_metrics(
+            run_id, metrics, 
+            batch_logging=self.batch_logging, 
+            dataframe_format=self.dataframe_format, 
+            dataframe_compression=self.dataframe_compression, 
+            dataframe_chunk_rows=self.dataframe_chunk_rows, 
+            uploader=self.uploader
+        )
 
 
     def _sanity_check(self, wrapped_func_name, *args, **kwargs):
@@ -83,23 +696,70 @@ class PytorchLogger(MlflowLogger):
     """
     Class for logging Pytorch models via mlflow.pytorch.autolog.
     """
-    def __init__(self, save_graph=False, logging_kwargs={}):
+    def __init__(self, save_graph=False, logging_kwargs={}, **kwargs):
         """
         A class for creating Pytorch-specific decorators for logging with MLflow.
+
+        Parameters:
+        - save_graph (bool): If True, log the model graph rendered by torchview after each run. 
+        Graphs are rendered by a background thread, and reused for runs of the same architecture 
+        and input shape. Call flush() or close() to wait for them.
+        - logging_kwargs (dict): Keyword arguments passed to mlflow.pytorch.autolog.
+        - kwargs: Options passed to MlflowLogger, like batch_logging or async_logging.
         """
         import mlflow.pytorch
 
+        self.save_graph = save_graph
         super().__init__(
             autolog=mlflow.pytorch.autolog, 
-            logging_kwargs=logging_kwargs
+            logging_kwargs=logging_kwargs, 
+            load_model=mlflow.pytorch.load_model, 
+            **kwargs
             )
-        self.save_graph = save_graph
 
         if self.save_graph: 
-            from .utils import _save_pytorch_model_graph
             from torchview import draw_graph
 
 
+    def _init_process_state(self):
+        super()._init_process_state()
+        self._graph_queue = None
+        if self.save_graph:
+            self._graph_queue = LoggingQueue(max_size=self._max_queue_size, num_workers=1)
+
+
+    def __getstate__(self):
+        state = super().__getstate__()
+        del state["_graph_queue"]
+        return state
+
+
+    def flush(self):
+        """
+        Block until all queued logging jobs and model graphs have finished.
+
+        Raises:
+        - AsyncLoggingError: If any queued job or graph failed.
+        """
+        super().flush()
+        if self._graph_queue is not None:
+            self._graph_queue.flush()
+
+
+    def close(self):
+        """
+        Wait for queued logging jobs and model graphs, and stop the worker threads.
+
+        Raises:
+        - AsyncLoggingError: If any queued job or graph failed.
+        """
+        try:
+            super().close()
+        finally:
+            if self._graph_queue is not None:
+                self._graph_queue.close()
+
+
     def _sanity_check(self, wrapped_func_name, *args, **kwargs):
         super()._sanity_check(wrapped_func_name, *args, **kwargs)
         if self.save_graph:
@@ -115,20 +775,19 @@ class PytorchLogger(MlflowLogger):
         - model: The trained PyTorch model.
         - metrics (dict): The logged metrics.
         """
-        # Save the model graph only if save_graph is True
-        mlflow_client = MlflowClient(mlflow.get_tracking_uri())
-
-        estimator_tags = {
-            "estimator_class": str(model.__class__).split("'")[1], 
-            "estimator_name": model.__class__.__name__
-        }
-
-        for k, v in estimator_tags.items():
-            mlflow_client.set_tag(run_id=self._latest_run_id, key=k, value=v)
+        run_id = self._get_run_id()
+        _set_tags(run_id, _get_estimator_tags(model), batch_logging=self.batch_logging)
 
+        # Save the model graph only if save_graph is True. Rendering is off the critical path.
         if self.save_graph:
             from .utils import _save_pytorch_model_graph
-            _save_pytorch_model_graph(model, input_shape=kwargs["input_shape"], run_id=self._latest_run_id)
+            self._graph_queue.submit(
+                _track_job(_in_phase("model_graph", _save_pytorch_model_graph)), 
+                model, 
+                input_shape=kwargs["input_shape"], 
+                run_id=run_id, 
+                uploader=self.uploader
+            )
 
 
 
@@ -136,15 +795,21 @@ class SklearnLogger(MlflowLogger):
     """
     Class for logging sklearn models via mlflow.sklearn.autolog.
     """
-    def __init__(self, logging_kwargs={}):
+    def __init__(self, logging_kwargs={}, **kwargs):
         """
         A class for creating Scikit-learn-specific decorators for logging with MLflow.
+
+        Parameters:
+        - logging_kwargs (dict): Keyword arguments passed to mlflow.sklearn.autolog.
+        - kwargs: Options passed to MlflowLogger, like batch_logging or async_logging.
         """    
         import mlflow.sklearn
     
         super().__init__(
             autolog=mlflow.sklearn.autolog, 
-            logging_kwargs=logging_kwargs
+            logging_kwargs=logging_kwargs, 
+            load_model=mlflow.sklearn.load_model, 
+            **kwargs
             )
 
 
@@ -152,10 +817,19 @@ class TensorflowLogger(MlflowLogger):
     """
     Class for logging TensorFlow models via mlflow.tensorflow.autolog.
     """
-    def __init__(self, logging_kwargs={}):
+    def __init__(self, logging_kwargs={}, **kwargs):
+        """
+        A class for creating TensorFlow-specific decorators for logging with MLflow.
+
+        Parameters:
+        - logging_kwargs (dict): Keyword arguments passed to mlflow.tensorflow.autolog.
+        - kwargs: Options passed to MlflowLogger, like batch_logging or async_logging.
+        """
         import mlflow.tensorflow
 
         super().__init__(
             autolog=mlflow.tensorflow.autolog, 
-            logging_kwargs=logging_kwargs
+            logging_kwargs=logging_kwargs, 
+            load_model=mlflow.tensorflow.load_model, 
+            **kwargs
         )
\ No newline at end of file
@@ -0,0 +1,259 @@
+import hashlib
+import inspect
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+import mlflow
+from mlflow import MlflowClient
+from .dedup import download_artifacts
+from .persistence import _keras_model, _torch_module, _weights_hash
+
+
+CACHE_KEY_TAG = "squid.cache_key"
+CACHE_DATAFRAMES_TAG = "squid.cache_dataframes"
+CACHE_HISTORIES_TAG = "squid.cache_histories"
+
+# Keyword arguments that control the decorator rather than the training itself.
+_IGNORED_KWARGS = ("force_rerun",)
+
+# Reprs that include the object's address, like <object at 0x7f...>, differ on every call.
+_ADDRESS_REPR = re.compile(r" at 0x[0-9a-fA-F]+>")
+
+
+def _fingerprint_path(path, hasher):
+    """
+    Hash a file, or every file under a directory, by path, size and modification
+    time, so that a rewritten input file changes the key without reading its contents.
+    """
+    hasher.update(os.path.abspath(path).encode())
+    if os.path.isdir(path):
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                _fingerprint_path(os.path.join(root, name), hasher)
+        return
+    stat = os.stat(path)
+    hasher.update(f"{stat.st_size}:{stat.st_mtime_ns}".encode())
+
+
+def _fingerprint(value, hasher):
+    """
+    Feed a stable representation of value into hasher. Arrays and DataFrames are
+    hashed from their memory buffers, so large inputs are never pickled or copied
+    into Python objects. Paths to existing files are hashed with the files' size
+    and modification time.
+
+    Raises:
+        - TypeError: If value has no stable representation, e.g. its repr includes
+        its address.
+    """
+    np = sys.modules.get("numpy")
+    pd = sys.modules.get("pandas")
+    torch = sys.modules.get("torch")
+
+    if torch is not None and isinstance(value, torch.Tensor):
+        value = value.detach().cpu().numpy()
+
+    if pd is not None and isinstance(value, (pd.DataFrame, pd.Series)):
+        hasher.update(type(value).__name__.encode())
+        if isinstance(value, pd.DataFrame):
+            hasher.update(repr(list(value.columns)).encode())
+        hasher.update(repr(value.dtypes if isinstance(value, pd.DataFrame) else value.dtype).encode())
+        _fingerprint(pd.util.hash_pandas_object(value, index=True).to_numpy(), hasher)
+    elif np is not None and isinstance(value, np.ndarray):
+        hasher.update(f"ndarray{value.dtype.str}{value.shape}".encode())
+        if value.dtype.hasobject:
+            hasher.update(repr(value.tolist()).encode())
+        else:
+            hasher.update(np.ascontiguousarray(value).data)
+    elif isinstance(value, dict):
+        hasher.update(b"dict")
+        for k in sorted(value, key=repr):
+            _fingerprint(k, hasher)
+            _fingerprint(value[k], hasher)
+    elif isinstance(value, (list, tuple)):
+        hasher.update(f"{type(value).__name__}{len(value)}".encode())
+        for v in value:
+            _fingerprint(v, hasher)
+    elif isinstance(value, os.PathLike) or (isinstance(value, str) and os.path.isfile(value)):
+        hasher.update(b"path")
+        _fingerprint_path(os.fspath(value), hasher)
+    elif inspect.isfunction(value) or inspect.isclass(value):
+        hasher.update(f"{value.__module__}.{value.__qualname__}".encode())
+    elif callable(getattr(value, "get_params", None)):
+        # scikit-learn style estimators: the class and hyperparameters define the model
+        hasher.update(str(value.__class__).encode())
+        _fingerprint(value.get_params(deep=False), hasher)
+    elif _torch_module(value):
+        # The architecture, and the weights the training starts from
+        hasher.update(repr(value).encode())
+        hasher.update(_weights_hash(value).encode())
+    elif _keras_model(value):
+        hasher.update(value.to_json().encode())
+        hasher.update(_weights_hash(value).encode())
+    else:
+        text = repr(value)
+        if _ADDRESS_REPR.search(text):
+            raise TypeError(f"{type(value).__name__} inputs cannot be memoized, as their repr is not stable: {text}")
+        hasher.update(str(value.__class__).encode())
+        hasher.update(text.encode())
+
+
+def _cache_key(func, args, kwargs):
+    """
+    Hash the wrapped function's source and its inputs into a cache key.
+
+    Raises:
+        - TypeError: If an input has no stable representation.
+    """
+    hasher = hashlib.blake2b(digest_size=20)
+
+    try:
+        hasher.update(inspect.getsource(func).encode())
+    except (OSError, TypeError):
+        hasher.update(func.__qualname__.encode())
+
+    _fingerprint(list(args), hasher)
+    _fingerprint({k: v for k, v in kwargs.items() if k not in _IGNORED_KWARGS}, hasher)
+
+    return hasher.hexdigest()
+
+
+class RunCache:
+    """
+    Finds previously logged runs by cache key, and keeps the most recently used
+    results in memory. Hits on the same in-memory entry return the same model object,
+    so callers that modify it should copy it first.
+    """
+    def __init__(self, load_model, max_entries=32, ttl=None):
+        """
+        Parameters:
+            - load_model: Callable loading a model from a model URI, like mlflow.sklearn.load_model.
+            - max_entries (int): Number of results kept in memory. The least recently
+            used entry is evicted first.
+            - ttl (float, optional): Seconds after which a logged run no longer counts
+            as a cache hit. Defaults to no expiry.
+        """
+        self.load_model = load_model
+        self.max_entries = max_entries
+        self.ttl = ttl
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, experiment_id):
+        """
+        Return (model, metrics, run_id) for the latest finished run with this key,
+        or None.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and not self._expired(entry[3]):
+                self._entries.move_to_end(key)
+                return entry[:3]
+
+        client = MlflowClient(mlflow.get_tracking_uri())
+        runs = client.search_runs(
+            experiment_ids=[experiment_id],
+            filter_string=f"tags.`{CACHE_KEY_TAG}` = '{key}' and attributes.status = 'FINISHED'",
+            order_by=["attributes.start_time DESC"],
+            max_results=1
+        )
+        if not runs or self._expired(runs[0].info.start_time / 1000):
+            return None
+
+        run = runs[0]
+        try:
+            model = self.load_model(f"runs:/{run.info.run_id}/model")
+        except Exception:
+            # The model was not logged, e.g. with log_models=False
+            return None
+
+        metrics = dict(run.data.metrics)
+        metrics.update(_load_histories(client, run))
+        metrics.update(_load_dataframes(run))
+
+        self.put(key, model, metrics, run.info.run_id, run.info.start_time / 1000)
+        return model, metrics, run.info.run_id
+
+    def put(self, key, model, metrics, run_id, start_time=None):
+        with self._lock:
+            self._entries[key] = (model, metrics, run_id, start_time or time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _expired(self, start_time):
+        return self.ttl is not None and time.time() - start_time > self.ttl
+
+
+def _dataframe_tags(metrics, extension, chunk_rows=None):
+    """
+    Tags mapping the DataFrame and array metrics of a run to their artifact paths, 
+    and listing its metric histories, so a cache hit can restore them.
+    """
+    from .arrays import _split_metrics, ARRAY_EXTENSION
+
+    _, histories, arrays, dataframes = _split_metrics(metrics)
+
+    files = {}
+    for name, df in dataframes.items():
+        chunked = chunk_rows and len(df) > chunk_rows
+        files[name] = name if chunked else name + extension
+    for name in arrays:
+        files[name] = name + ARRAY_EXTENSION
+
+    tags = {}
+    if files:
+        tags[CACHE_DATAFRAMES_TAG] = json.dumps(files)
+    if histories:
+        tags[CACHE_HISTORIES_TAG] = json.dumps(list(histories))
+    return tags
+
+
+def _load_histories(client, run):
+    """Restore metric histories as arrays ordered by step."""
+    import numpy as np
+
+    histories = {}
+    for name in json.loads(run.data.tags.get(CACHE_HISTORIES_TAG, "[]")):
+        points = sorted(client.get_metric_history(run.info.run_id, name), key=lambda m: m.step)
+        histories[name] = np.array([m.value for m in points])
+    return histories
+
+
+def _load_dataframes(run):
+    files = json.loads(run.data.tags.get(CACHE_DATAFRAMES_TAG, "{}"))
+    if not files:
+        return {}
+
+    import numpy as np
+    import pandas as pd
+
+    dataframes = {}
+    with tempfile.TemporaryDirectory(prefix="squid-") as tmp_dir:
+        for name, artifact_path in files.items():
+            local_path = download_artifacts(run.info.run_id, artifact_path, tmp_dir)
+            if local_path.endswith(".npy"):
+                dataframes[name] = np.load(local_path, allow_pickle=False)
+                continue
+            if os.path.isdir(local_path):
+                # Chunked DataFrames are logged as a directory of part files
+                parts = [os.path.join(local_path, f) for f in sorted(os.listdir(local_path))]
+            else:
+                parts = [local_path]
+            dataframes[name] = pd.concat(
+                [pd.read_parquet(part) if part.endswith(".parquet") else pd.read_csv(part) for part in parts], 
+                ignore_index=True
+            )
+
+    return dataframes
@@ -0,0 +1,226 @@
+import gzip
+import hashlib
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import mlflow
+from mlflow import MlflowClient
+from .artifacts import _log_artifact
+from .dedup import download_artifacts
+from .timing import _phase
+
+
+__all__ = ["load_persisted_model"]
+
+
+# Compression level for models logged with model_persistence="fast", from 0 (none) to 9.
+DEFAULT_MODEL_COMPRESSION = 3
+
+MODEL_ARTIFACT_PATH = "model"
+
+# Hash of the model's weights, the run holding the model file, and the file's artifact path.
+MODEL_HASH_TAG = "squid.model_hash"
+MODEL_REF_TAG = "squid.model_ref"
+MODEL_FILE_TAG = "squid.model_file"
+
+
+def _torch_module(model):
+    torch = sys.modules.get("torch")
+    return torch is not None and isinstance(model, torch.nn.Module)
+
+
+def _keras_model(model):
+    tf = sys.modules.get("tensorflow")
+    return tf is not None and isinstance(model, tf.keras.Model)
+
+
+def _weights_hash(model):
+    """
+    Hash of the model's learned state: the state_dict of a torch module, the weights
+    of a Keras model, and the joblib hash of any other model, like a scikit-learn estimator.
+    """
+    hasher = hashlib.sha256()
+    if _torch_module(model):
+        import torch
+
+        for name, tensor in sorted(model.state_dict().items()):
+            tensor = tensor.detach().cpu().contiguous()
+            hasher.update(f"{name}:{tensor.dtype}:{tuple(tensor.shape)}".encode())
+            hasher.update(tensor.reshape(-1).view(torch.uint8).numpy().tobytes())
+    elif _keras_model(model):
+        for weights in model.get_weights():
+            hasher.update(f"{weights.dtype}:{weights.shape}".encode())
+            hasher.update(weights.tobytes())
+    else:
+        import joblib
+
+        hasher.update(joblib.hash(model).encode())
+    return hasher.hexdigest()
+
+
+def _gzip_file(path, compression_level):
+    """Replace the file with a gzip copy, and return the new path."""
+    gzip_path = path + ".gz"
+    with open(path, "rb") as src, gzip.open(gzip_path, "wb", compresslevel=compression_level) as dst:
+        shutil.copyfileobj(src, dst)
+    os.remove(path)
+    return gzip_path
+
+
+def _serialize_model(model, directory, compression_level=DEFAULT_MODEL_COMPRESSION):
+    """
+    Write the model to directory. Torch modules are saved as their state_dict, Keras
+    models as their weights, and other models with joblib. A compression level of 0
+    writes the files uncompressed.
+
+    Returns:
+        - str: The path of the model file.
+    """
+    if _torch_module(model):
+        import torch
+
+        path = os.path.join(directory, "model.pt")
+        torch.save(model.state_dict(), path)
+    elif _keras_model(model):
+        path = os.path.join(directory, "model.weights.h5")
+        model.save_weights(path)
+    else:
+        import joblib
+
+        path = os.path.join(directory, "model.joblib")
+        joblib.dump(model, path, compress=compression_level)
+        return path
+
+    if compression_level:
+        path = _gzip_file(path, compression_level)
+    return path
+
+
+class ModelPersister:
+    """
+    Logs models without MLflow's model format, for runs where serializing and uploading
+    the full model through autolog dominates. Models whose weights hash matches a model
+    already logged in the experiment are not uploaded again. The run references the
+    existing file with a squid.model_ref tag instead.
+
+    Serialization and upload are timed as the model_serialization and model_upload phases.
+    """
+    def __init__(self, compression_level=DEFAULT_MODEL_COMPRESSION, skip_unchanged=True, uploader=None):
+        """
+        Parameters:
+            - compression_level (int): gzip or joblib compression level from 0 to 9.
+            Defaults to 3.
+            - skip_unchanged (bool): If True, do not upload a model whose weights were
+            already logged in the experiment. Defaults to True.
+            - uploader (S3ArtifactUploader, optional): Upload straight to the artifact store.
+        """
+        if not 0 <= compression_level <= 9:
+            raise ValueError(f"compression_level must be between 0 and 9. Provided {compression_level}")
+
+        self.compression_level = compression_level
+        self.skip_unchanged = skip_unchanged
+        self.uploader = uploader
+        self._init_process_state()
+
+    def _init_process_state(self):
+        # (experiment ID, weights hash) -> (run ID, artifact path) of the logged model
+        self._logged = {}
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_logged"], state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._init_process_state()
+
+    def persist(self, run_id, experiment_id, model):
+        """
+        Log the model to the run, or reference an identical model logged before.
+        """
+        from .utils import _set_tags
+
+        with _phase("model_serialization"):
+            digest = _weights_hash(model)
+
+        logged = self._find_logged(experiment_id, digest) if self.skip_unchanged else None
+        if logged is None:
+            with tempfile.TemporaryDirectory(prefix="squid-") as tmp_dir:
+                with _phase("model_serialization"):
+                    local_path = _serialize_model(model, tmp_dir, self.compression_level)
+                with _phase("model_upload"):
+                    _log_artifact(run_id, local_path, artifact_path=MODEL_ARTIFACT_PATH, uploader=self.uploader)
+            logged = (run_id, f"{MODEL_ARTIFACT_PATH}/{os.path.basename(local_path)}")
+            with self._lock:
+                self._logged[(experiment_id, digest)] = logged
+
+        _set_tags(run_id, {MODEL_HASH_TAG: digest, MODEL_REF_TAG: logged[0], MODEL_FILE_TAG: logged[1]})
+
+    def _find_logged(self, experiment_id, digest):
+        with self._lock:
+            if (experiment_id, digest) in self._logged:
+                return self._logged[(experiment_id, digest)]
+
+        runs = MlflowClient(mlflow.get_tracking_uri()).search_runs(
+            experiment_ids=[experiment_id],
+            filter_string=f"tags.`{MODEL_HASH_TAG}` = '{digest}'",
+            max_results=1
+        )
+        if not runs:
+            return None
+
+        tags = runs[0].data.tags
+        logged = (tags[MODEL_REF_TAG], tags[MODEL_FILE_TAG])
+        with self._lock:
+            self._logged[(experiment_id, digest)] = logged
+        return logged
+
+
+def load_persisted_model(run_id, model=None):
+    """
+    Load a model logged with model_persistence="fast", following the reference to an
+    identical model logged by an earlier run.
+
+    Parameters:
+        - run_id (str): The MLflow run ID.
+        - model (optional): For torch and Keras models, a model of the same architecture
+        to load the weights into. Without it, a torch state_dict is returned.
+
+    Returns:
+        - The model, or the torch state_dict.
+
+    Raises:
+        - ValueError: If the run has no model logged this way, or Keras weights are
+        loaded without a model.
+    """
+    tags = MlflowClient(mlflow.get_tracking_uri()).get_run(run_id).data.tags
+    if MODEL_REF_TAG not in tags:
+        raise ValueError(f"Run {run_id} has no model logged with model_persistence='fast'.")
+
+    with tempfile.TemporaryDirectory(prefix="squid-") as tmp_dir:
+        local_path = download_artifacts(tags[MODEL_REF_TAG], tags[MODEL_FILE_TAG], tmp_dir)
+        if local_path.endswith(".gz"):
+            with gzip.open(local_path, "rb") as src, open(local_path[:-3], "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            local_path = local_path[:-3]
+
+        if local_path.endswith(".joblib"):
+            import joblib
+            return joblib.load(local_path)
+
+        if local_path.endswith(".pt"):
+            import torch
+            state_dict = torch.load(local_path, map_location="cpu")
+            if model is None:
+                return state_dict
+            model.load_state_dict(state_dict)
+            return model
+
+        if model is None:
+            raise ValueError("A model of the same architecture is required to load Keras weights.")
+        model.load_weights(local_path)
+        return model
@@ -0,0 +1,268 @@
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+import mlflow
+from mlflow import MlflowClient
+from mlflow.entities import ViewType
+
+
+__all__ = ["query_runs"]
+
+
+# Directory for query results that later calls refresh incrementally.
+QUERY_CACHE_DIR = os.environ.get(
+    "SQUID_ML_QUERY_CACHE_DIR",
+    os.path.join(os.path.expanduser("~"), ".squid", "queries")
+)
+
+# Runs per search_runs request.
+SEARCH_PAGE_SIZE = 1000
+
+# Run IDs per request when refreshing runs that were still running.
+MAX_RUN_IDS_PER_FILTER = 100
+
+# Runs that ended this long before the previous query are fetched again, as loggers
+# can still write metrics and tags, like squid.timing.*, once a run has ended.
+LATE_WRITE_WINDOW_MS = 10 * 60 * 1000
+
+OUTPUTS = ("pandas", "arrow")
+
+
+def query_runs(
+        experiment_name,
+        metrics=None,
+        params=None,
+        tags=(),
+        filter_string="",
+        output="pandas",
+        cache=True,
+        cache_dir=None,
+        max_workers=8
+    ):
+    """
+    Fetch the runs of an experiment as a table, with one row per run.
+
+    Runs are fetched in parallel: the experiment's start time range is split into
+    max_workers windows, and the pages of each window are fetched by their own
+    thread. Only the requested metrics, params and tags are kept. With cache=True,
+    the table is stored on disk as Parquet, and repeated queries only fetch runs
+    started since the last one, along with runs that were still running or ended
+    shortly before it. Runs deleted after they were cached stay in the table until
+    the cache file is removed.
+
+    Parameters:
+        - experiment_name (str): The MLflow experiment name.
+        - metrics (list, optional): Metric names to return. Defaults to every metric.
+        - params (list, optional): Param names to return. Defaults to every param.
+        - tags (list): Tag names to return. Defaults to none.
+        - filter_string (str): An MLflow search filter, like "metrics.accuracy > 0.9".
+        - output (str): "pandas" for a DataFrame or "arrow" for a pyarrow Table.
+        Defaults to "pandas".
+        - cache (bool): If True, reuse and refresh the on-disk cache. Defaults to True.
+        - cache_dir (str, optional): Defaults to SQUID_ML_QUERY_CACHE_DIR or ~/.squid/queries.
+        - max_workers (int): Number of start time windows fetched in parallel. Defaults to 8.
+
+    Returns:
+        - DataFrame or pyarrow.Table: Columns run_id, run_name, status, start_time and
+        end_time, followed by metrics.<name>, params.<name> and tags.<name> columns
+        like mlflow.search_runs. Rows are ordered by start time, latest first.
+
+    Raises:
+        - ValueError: If the experiment does not exist or output is not supported.
+        - ModuleNotFoundError: If output="arrow" and pyarrow is not installed.
+    """
+    import pandas as pd
+
+    if output not in OUTPUTS:
+        raise ValueError(f"output must be one of {OUTPUTS}. Provided '{output}'")
+
+    experiment = mlflow.get_experiment_by_name(experiment_name)
+    if experiment is None:
+        raise ValueError(f"Experiment '{experiment_name}' does not exist.")
+    experiment_id = experiment.experiment_id
+    projection = _Projection(metrics, params, tags)
+    client = MlflowClient(mlflow.get_tracking_uri())
+
+    cache_path = None
+    cached = None
+    if cache:
+        cache_path = _cache_path(cache_dir or QUERY_CACHE_DIR, experiment_id, filter_string, projection)
+        cached = _read_cache(cache_path)
+
+    queried_at = int(time.time() * 1000)
+    if cached is None:
+        rows = _fetch_rows(client, experiment_id, filter_string, projection, None, max_workers)
+        df = pd.DataFrame(rows)
+    else:
+        df, since, running, previous_query = cached
+        # Runs starting in the same millisecond as the newest cached run are fetched again
+        rows = _fetch_rows(client, experiment_id, filter_string, projection, since, max_workers)
+        rows += _fetch_run_ids(client, experiment_id, filter_string, projection, running)
+        ended_since = _and(filter_string, f"attributes.end_time >= {previous_query - LATE_WRITE_WINDOW_MS}")
+        rows += _search(client, experiment_id, ended_since, projection)
+        if rows:
+            # A run can match more than one of the refresh searches
+            fresh = pd.DataFrame(rows).drop_duplicates("run_id", keep="last")
+            df = pd.concat([df[~df["run_id"].isin(fresh["run_id"])], fresh], ignore_index=True)
+
+    if df.empty:
+        df = pd.DataFrame(columns=list(_BASE_COLUMNS))
+    df = df.sort_values("start_time", ascending=False, kind="stable", ignore_index=True)
+    df = df[list(_BASE_COLUMNS) + sorted(c for c in df.columns if c not in _BASE_COLUMNS)]
+
+    if cache_path is not None:
+        _write_cache(cache_path, df, queried_at)
+
+    result = df.assign(
+        start_time=pd.to_datetime(df["start_time"], unit="ms", utc=True),
+        end_time=pd.to_datetime(df["end_time"], unit="ms", utc=True)
+    )
+    if output == "arrow":
+        try:
+            import pyarrow as pa
+        except ModuleNotFoundError:
+            raise ModuleNotFoundError("pyarrow is required for output='arrow'. Install it with pip install pyarrow.")
+        return pa.Table.from_pandas(result, preserve_index=False)
+    return result
+
+
+_BASE_COLUMNS = ("run_id", "run_name", "status", "start_time", "end_time")
+
+
+class _Projection:
+    """The metrics, params and tags kept from each run. None keeps all of them."""
+    def __init__(self, metrics, params, tags):
+        self.metrics = None if metrics is None else sorted(metrics)
+        self.params = None if params is None else sorted(params)
+        self.tags = None if tags is None else sorted(tags)
+
+    def key(self):
+        return {"metrics": self.metrics, "params": self.params, "tags": self.tags}
+
+    def row(self, run):
+        info, data = run.info, run.data
+        row = {
+            "run_id": info.run_id,
+            "run_name": info.run_name,
+            "status": info.status,
+            "start_time": info.start_time,
+            "end_time": info.end_time
+        }
+        for prefix, values, names in (
+            ("metrics", data.metrics, self.metrics),
+            ("params", data.params, self.params),
+            ("tags", data.tags, self.tags)
+        ):
+            for name in (values if names is None else names):
+                row[f"{prefix}.{name}"] = values.get(name)
+        return row
+
+
+def _search(client, experiment_id, filter_string, projection, order_by=None, max_results=None):
+    """Fetch every page of a search, or only the first max_results runs."""
+    rows = []
+    page_token = None
+    while True:
+        page = client.search_runs(
+            experiment_ids=[experiment_id],
+            filter_string=filter_string,
+            run_view_type=ViewType.ACTIVE_ONLY,
+            max_results=max_results or SEARCH_PAGE_SIZE,
+            order_by=order_by,
+            page_token=page_token
+        )
+        rows += [projection.row(run) for run in page]
+        page_token = page.token
+        if max_results or not page_token:
+            return rows
+
+
+def _and(*filters):
+    return " and ".join(f for f in filters if f)
+
+
+def _fetch_rows(client, experiment_id, filter_string, projection, since, max_workers):
+    """
+    Fetch the runs started at or after since, in parallel start time windows.
+    """
+    base_filter = _and(filter_string, since is not None and f"attributes.start_time >= {since}")
+
+    def boundary(direction):
+        rows = _search(client, experiment_id, base_filter, projection, [f"attributes.start_time {direction}"], max_results=1)
+        return rows[0]["start_time"] if rows else None
+
+    first, last = boundary("ASC"), boundary("DESC")
+    if first is None:
+        return []
+
+    n_windows = max(1, min(max_workers, last - first + 1))
+    width = (last - first + 1) / n_windows
+    edges = [first + round(i * width) for i in range(n_windows)] + [last + 1]
+    windows = [
+        _and(base_filter, f"attributes.start_time >= {start}", f"attributes.start_time < {end}")
+        for start, end in zip(edges, edges[1:])
+        if start < end
+    ]
+
+    with ThreadPoolExecutor(max_workers=len(windows)) as executor:
+        pages = executor.map(lambda f: _search(client, experiment_id, f, projection), windows)
+        return [row for rows in pages for row in rows]
+
+
+def _fetch_run_ids(client, experiment_id, filter_string, projection, run_ids):
+    """Fetch the given runs again, e.g. those that were still running when cached."""
+    rows = []
+    for i in range(0, len(run_ids), MAX_RUN_IDS_PER_FILTER):
+        ids = ", ".join(f"'{run_id}'" for run_id in run_ids[i:i + MAX_RUN_IDS_PER_FILTER])
+        rows += _search(client, experiment_id, _and(filter_string, f"attributes.run_id IN ({ids})"), projection)
+    return rows
+
+
+def _cache_path(cache_dir, experiment_id, filter_string, projection):
+    key = json.dumps({
+        "tracking_uri": mlflow.get_tracking_uri(),
+        "experiment_id": experiment_id,
+        "filter_string": filter_string,
+        **projection.key()
+    }, sort_keys=True)
+    return os.path.join(cache_dir, hashlib.sha256(key.encode()).hexdigest() + ".parquet")
+
+
+# Parquet metadata key of the time the cached table was queried, in milliseconds.
+_QUERIED_AT_KEY = b"squid.queried_at"
+
+
+def _read_cache(path):
+    """
+    Return (table, newest start time, IDs of unfinished runs, time of the query), or
+    None if there is no usable cache.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    try:
+        table = pq.read_table(path)
+        queried_at = int(table.schema.metadata[_QUERIED_AT_KEY])
+    except (OSError, ValueError, KeyError, TypeError, pa.ArrowException):
+        return None
+
+    df = table.to_pandas()
+    if df.empty:
+        return df, None, [], queried_at
+    running = df.loc[df["status"].isin(("RUNNING", "SCHEDULED")), "run_id"].tolist()
+    return df, int(df["start_time"].max()), running, queried_at
+
+
+def _write_cache(path, df, queried_at):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    table = table.replace_schema_metadata({**(table.schema.metadata or {}), _QUERIED_AT_KEY: str(queried_at).encode()})
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    pq.write_table(table, tmp_path)
+    os.replace(tmp_path, path)
@@ -0,0 +1,342 @@
+import glob
+import json
+import os
+import shutil
+import tempfile
+import time
+import uuid
+from contextlib import suppress
+from concurrent.futures import ThreadPoolExecutor
+import requests
+import mlflow
+from mlflow import MlflowClient
+from mlflow.entities import Metric, Param, RunTag
+from ..server import utils as server_utils
+from .artifacts import _write_dataframe, _dataframe_extension
+from .arrays import _split_metrics, _write_array, ARRAY_EXTENSION
+from .utils import _chunk_batch, _get_experiment_id, _get_estimator_tags
+
+
+__all__ = ["replay_spool"]
+
+
+# Default directory for runs recorded while the tracking server is unreachable.
+SPOOL_DIR = os.environ.get(
+    "SQUID_ML_SPOOL_DIR",
+    os.path.join(os.path.expanduser("~"), ".squid", "spool")
+)
+
+SPOOL_ID_TAG = "squid.spool_id"
+
+
+def _tracking_server_available(timeout=2.0):
+    """
+    Check whether the tracking server answers its health endpoint. Tracking URIs
+    that are not HTTP(S), like local file or database stores, are always available.
+    If a TrackingServerDiscovery configured the URI, the server is resolved again
+    before it is reported unavailable.
+    """
+    tracking_uri = mlflow.get_tracking_uri()
+    if not tracking_uri.startswith(("http://", "https://")):
+        return True
+
+    discovery = server_utils._active_discovery
+    if discovery is not None and discovery.tracking_uri == tracking_uri.rstrip("/"):
+        return discovery.available()
+
+    try:
+        response = server_utils.get_http_session().get(tracking_uri.rstrip("/") + "/health", timeout=timeout)
+    except requests.RequestException:
+        return False
+
+    return response.ok
+
+
+class RunSpool:
+    """
+    An append-only JSON-lines file that records a single run while the tracking
+    server is unreachable. Artifacts are copied next to it, in a directory
+    named after the spool ID.
+    """
+    def __init__(self, directory, experiment_name):
+        """
+        Parameters:
+            - directory (str): The spool directory.
+            - experiment_name (str): The experiment the run belongs to.
+        """
+        os.makedirs(directory, exist_ok=True)
+
+        self.spool_id = uuid.uuid4().hex
+        self.path = os.path.join(directory, f"{self.spool_id}.jsonl")
+        self.artifact_dir = os.path.join(directory, self.spool_id)
+
+        self._append({
+            "type": "run",
+            "spool_id": self.spool_id,
+            "experiment_name": experiment_name,
+            "start_time": _now_millis()
+        })
+
+    def _append(self, record):
+        with open(self.path, "a") as f:
+            f.write(json.dumps(record) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def log_params(self, params):
+        if params:
+            self._append({"type": "params", "values": {k: str(v) for k, v in params.items()}})
+
+    def log_metrics(self, metrics, step=0):
+        if metrics:
+            values = {k: float(v) for k, v in metrics.items()}
+            self._append({"type": "metrics", "values": values, "step": step, "timestamp": _now_millis()})
+
+    def log_history(self, key, steps, values):
+        self._append({"type": "history", "key": key, "steps": steps, "values": values, "timestamp": _now_millis()})
+
+    def set_tags(self, tags):
+        if tags:
+            self._append({"type": "tags", "values": {k: str(v) for k, v in tags.items()}})
+
+    def log_artifact(self, local_path, artifact_path=None):
+        """Copy the file into the spool and record a reference to it."""
+        os.makedirs(self.artifact_dir, exist_ok=True)
+        filename = os.path.basename(local_path)
+        shutil.copyfile(local_path, os.path.join(self.artifact_dir, filename))
+        self._append({"type": "artifact", "filename": filename, "artifact_path": artifact_path})
+
+    def end(self, status="FINISHED"):
+        self._append({"type": "end", "status": status, "end_time": _now_millis()})
+
+
+def _now_millis():
+    return int(time.time() * 1000)
+
+
+def _record_run(spool, model, metrics, dataframe_format="csv", dataframe_compression=None):
+    """
+    Record everything the decorator would have logged for a finished run.
+    """
+    spool.set_tags({**_get_estimator_tags(model), "squid.spooled": "true"})
+
+    # Autologging is unavailable offline, so keep at least the estimator's own params
+    if callable(getattr(model, "get_params", None)):
+        spool.log_params(model.get_params(deep=False))
+
+    scalar_metrics, histories, arrays, dataframes = _split_metrics(metrics)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        extension = _dataframe_extension(dataframe_format, dataframe_compression)
+        for metric_name, df in dataframes.items():
+            local_path = os.path.join(tmp_dir, metric_name + extension)
+            _write_dataframe(df, local_path, dataframe_format, dataframe_compression)
+            spool.log_artifact(local_path)
+        for metric_name, array in arrays.items():
+            local_path = os.path.join(tmp_dir, metric_name + ARRAY_EXTENSION)
+            _write_array(array, local_path)
+            spool.log_artifact(local_path)
+
+    spool.log_metrics(scalar_metrics)
+    for metric_name, (steps, values) in histories.items():
+        spool.log_history(metric_name, steps, values)
+
+
+def replay_spool(spool_dir=None, max_workers=4):
+    """
+    Push runs recorded in the spool directory to the current tracking server.
+
+    Replay is idempotent and resumable: each run is tagged with its spool ID, and
+    records are pushed in batches, each followed by a checkpoint. An interrupted 
+    replay continues from the last checkpoint without creating duplicate runs. Only
+    the metrics of the batch that was interrupted may be logged twice. Runs that are
+    still being recorded are skipped.
+
+    Parameters:
+        - spool_dir (str, optional): The spool directory. Defaults to SQUID_ML_SPOOL_DIR
+        or ~/.squid/spool.
+        - max_workers (int): Number of runs replayed concurrently. Defaults to 4.
+
+    Returns:
+        - list: IDs of the runs that were replayed.
+    """
+    spool_dir = spool_dir or SPOOL_DIR
+    spool_files = sorted(glob.glob(os.path.join(spool_dir, "*.jsonl")))
+    if not spool_files:
+        return []
+
+    client = MlflowClient(mlflow.get_tracking_uri())
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        run_ids = list(executor.map(lambda path: _replay_file(client, path), spool_files))
+
+    return [run_id for run_id in run_ids if run_id]
+
+
+def _has_pending_runs(spool_dir=None):
+    return bool(glob.glob(os.path.join(spool_dir or SPOOL_DIR, "*.jsonl")))
+
+
+def _replay_file(client, path):
+    """
+    Replay a single spool file. Returns the run ID, or None if the file was skipped.
+    """
+    base = path[:-len(".jsonl")]
+    lock_path = base + ".lock"
+    checkpoint_path = base + ".checkpoint"
+
+    # Another process is already replaying this run
+    lock_fd = _try_lock(lock_path)
+    if lock_fd is None:
+        return None
+
+    try:
+        # Replayed by another process since the file was listed
+        if not os.path.exists(path):
+            return None
+
+        records = _read_records(path)
+
+        # The run is still being recorded, or the file was truncated mid-write
+        if not records or records[-1]["type"] != "end":
+            return None
+
+        header = records[0]
+        run_id, n_replayed = None, 1
+        if os.path.exists(checkpoint_path):
+            with open(checkpoint_path) as f:
+                checkpoint = json.load(f)
+            run_id, n_replayed = checkpoint["run_id"], checkpoint["n_replayed"]
+
+        if run_id is None:
+            run_id = _get_or_create_run(client, header)
+            _write_checkpoint(checkpoint_path, run_id, n_replayed)
+
+        metrics, params, tags = [], [], []
+        for i, record in enumerate(records[n_replayed:], start=n_replayed):
+            if record["type"] == "metrics":
+                metrics += [
+                    Metric(k, v, record["timestamp"], record["step"])
+                    for k, v in record["values"].items()
+                ]
+            elif record["type"] == "history":
+                metrics += [
+                    Metric(record["key"], v, record["timestamp"], s)
+                    for s, v in zip(record["steps"], record["values"])
+                ]
+            elif record["type"] == "params":
+                params += [Param(k, v) for k, v in record["values"].items()]
+            elif record["type"] == "tags":
+                tags += [RunTag(k, v) for k, v in record["values"].items()]
+            elif record["type"] == "artifact":
+                if _flush_entities(client, run_id, metrics, params, tags):
+                    _write_checkpoint(checkpoint_path, run_id, i)
+                metrics, params, tags = [], [], []
+                local_path = os.path.join(base, record["filename"])
+                client.log_artifact(run_id, local_path, artifact_path=record["artifact_path"])
+                _write_checkpoint(checkpoint_path, run_id, i + 1)
+            elif record["type"] == "end":
+                if _flush_entities(client, run_id, metrics, params, tags):
+                    _write_checkpoint(checkpoint_path, run_id, i)
+                client.set_terminated(run_id, status=record["status"], end_time=record["end_time"])
+
+        for leftover in (path, checkpoint_path):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+        shutil.rmtree(base, ignore_errors=True)
+
+        return run_id
+    finally:
+        _unlock(lock_fd, lock_path)
+
+
+def _try_lock(lock_path):
+    """
+    Take an exclusive lock on lock_path without waiting. The OS releases the lock
+    when the process exits, so a replay that was killed never leaves a stale lock.
+
+    Returns:
+        - int: The locked file descriptor, or None if another process holds the lock.
+    """
+    lock_fd = os.open(lock_path, os.O_CREAT | os.O_WRONLY)
+    if not server_utils._lock_fd(lock_fd, blocking=False):
+        os.close(lock_fd)
+        return None
+
+    # The holder removes the file before releasing the lock. A lock on a file that was
+    # removed in between is not the current lock.
+    try:
+        current = os.stat(lock_path).st_ino == os.fstat(lock_fd).st_ino
+    except FileNotFoundError:
+        current = False
+    if not current:
+        os.close(lock_fd)
+        return None
+    return lock_fd
+
+
+def _unlock(lock_fd, lock_path):
+    """
+    Release a lock taken by _try_lock and remove its file. On POSIX the file is removed
+    before the lock is released, so that _try_lock can tell a removed file. Windows
+    cannot remove an open file, and a process that locks it afterwards finds the spool
+    file gone.
+    """
+    if os.name == "nt":
+        os.close(lock_fd)
+        with suppress(OSError):
+            os.remove(lock_path)
+    else:
+        with suppress(FileNotFoundError):
+            os.remove(lock_path)
+        os.close(lock_fd)
+
+
+def _read_records(path):
+    """
+    Read the records of a spool file, stopping at the first incomplete line.
+    """
+    records = []
+    with open(path) as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                break
+    return records
+
+
+def _get_or_create_run(client, header):
+    """
+    Return the run previously created for this spool, or create it.
+    """
+    experiment_id = _get_experiment_id(header["experiment_name"])
+
+    existing_runs = client.search_runs(
+        experiment_ids=[experiment_id],
+        filter_string=f"tags.`{SPOOL_ID_TAG}` = '{header['spool_id']}'",
+        max_results=1
+    )
+    if existing_runs:
+        return existing_runs[0].info.run_id
+
+    run = client.create_run(
+        experiment_id,
+        start_time=header["start_time"],
+        tags={SPOOL_ID_TAG: header["spool_id"]}
+    )
+    return run.info.run_id
+
+
+def _flush_entities(client, run_id, metrics, params, tags):
+    """Push the entities in batches. Returns whether there was anything to push."""
+    if not (metrics or params or tags):
+        return False
+    for batch_metrics, batch_params, batch_tags in _chunk_batch(metrics, params, tags):
+        client.log_batch(run_id, metrics=batch_metrics, params=batch_params, tags=batch_tags)
+    return True
+
+
+def _write_checkpoint(checkpoint_path, run_id, n_replayed):
+    tmp_path = checkpoint_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"run_id": run_id, "n_replayed": n_replayed}, f)
+    os.replace(tmp_path, checkpoint_path)
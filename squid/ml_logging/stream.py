@@ -0,0 +1,269 @@
+import asyncio
+import threading
+import time
+import warnings
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+from functools import wraps
+import mlflow
+from mlflow import MlflowClient
+from mlflow.entities import Metric
+from .utils import _chunk_batch, _last_run_id, MAX_METRICS_PER_BATCH
+
+
+__all__ = ["metric_stream", "MetricStream"]
+
+
+# Uploads that may be in flight before log() waits for the oldest one. On an event
+# loop, log() never waits, and alog() waits on a thread instead.
+MAX_PENDING_UPLOADS = 2
+
+# The stream of the decorated run executing in the current context.
+_active_stream = ContextVar("squid_active_stream", default=None)
+
+
+def metric_stream():
+    """
+    Return the metric stream of the decorated run executing in the current context.
+    Call this from inside a function decorated with a squid logger's log().
+
+    Raises:
+        - RuntimeError: If no decorated run is executing.
+    """
+    stream = _active_stream.get()
+    if stream is None:
+        raise RuntimeError("metric_stream() can only be called from inside a function decorated with a squid logger.")
+    return stream
+
+
+class _Series:
+    """
+    Points of one metric in array-backed buffers, with the running window of a
+    downsampled metric.
+    """
+    __slots__ = ("steps", "values", "timestamps", "window", "window_sum", "window_count", "window_step")
+
+    def __init__(self, window=1):
+        self.steps = array("q")
+        self.values = array("d")
+        self.timestamps = array("q")
+        self.window = window
+        self.window_sum = 0.0
+        self.window_count = 0
+        self.window_step = 0
+
+    def add(self, step, value, timestamp):
+        """Buffer a point. Returns the number of points added to the buffer."""
+        if self.window == 1:
+            self._append(step, value, timestamp)
+            return 1
+
+        self.window_sum += value
+        self.window_count += 1
+        self.window_step = step
+        if self.window_count < self.window:
+            return 0
+        return self.close_window(timestamp)
+
+    def close_window(self, timestamp):
+        """Buffer the mean of the current window at its last step."""
+        if not self.window_count:
+            return 0
+        self._append(self.window_step, self.window_sum / self.window_count, timestamp)
+        self.window_sum = 0.0
+        self.window_count = 0
+        return 1
+
+    def _append(self, step, value, timestamp):
+        self.steps.append(step)
+        self.values.append(value)
+        self.timestamps.append(timestamp)
+
+    def drain(self, key):
+        points = [
+            Metric(key, value, timestamp, step)
+            for step, value, timestamp in zip(self.steps, self.values, self.timestamps)
+        ]
+        del self.steps[:], self.values[:], self.timestamps[:]
+        return points
+
+
+class MetricStream:
+    """
+    Buffers step-wise metrics of a run and uploads them in log_batch calls on a
+    background thread, so that a training loop can log every step cheaply.
+
+    Points are flushed when flush_every points are buffered, when flush_interval
+    seconds have passed since the last flush, and when the run ends. Uploads keep
+    the order in which points were logged.
+    """
+    def __init__(self, run_id=None, flush_interval=5.0, flush_every=MAX_METRICS_PER_BATCH, downsample=None):
+        """
+        Parameters:
+            - run_id (str, optional): The MLflow run ID. Defaults to the run started
+            in the current context.
+            - flush_interval (float): Maximum seconds between uploads. Defaults to 5.
+            - flush_every (int): Number of buffered points that triggers an upload.
+            Defaults to 1000, the size of one log_batch request.
+            - downsample (int or dict, optional): Window size k, or metric names mapped
+            to window sizes. Every k consecutive points of a metric are uploaded as a
+            single point with their mean value, at the step of the last one.
+        """
+        self.run_id = run_id
+        self.flush_interval = flush_interval
+        self.flush_every = flush_every
+        self.downsample = downsample or {}
+
+        self._series = {}
+        self._buffered = 0
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._executor = None
+        self._pending = []
+        self._closed = False
+
+    def _window(self, key):
+        if isinstance(self.downsample, int):
+            return self.downsample
+        return self.downsample.get(key, 1)
+
+    def log(self, step, **values):
+        """
+        Buffer one point per metric at the given step, like stream.log(epoch, loss=0.3, accuracy=0.9).
+        Values can be numbers or any object float() accepts, like a NumPy scalar or a
+        one-element tensor.
+        """
+        if self._buffer(step, values):
+            self.flush()
+
+    async def alog(self, step, **values):
+        """
+        The counterpart of log() for coroutines decorated with log_async(). Waiting for
+        uploads the server has not accepted yet happens on a thread, so the event loop
+        keeps running.
+        """
+        if self._buffer(step, values):
+            from .aio import _to_thread
+
+            await _to_thread(self.flush)
+
+    def _buffer(self, step, values):
+        """Buffer the points. Returns whether a flush is due."""
+        if self._closed:
+            raise RuntimeError("Cannot log to a closed MetricStream.")
+        if self.run_id is None:
+            self.run_id = _last_run_id.get()
+
+        timestamp = time.time_ns() // 1_000_000
+        with self._lock:
+            for key, value in values.items():
+                series = self._series.get(key)
+                if series is None:
+                    series = self._series[key] = _Series(self._window(key))
+                self._buffered += series.add(step, float(value), timestamp)
+            return (
+                self._buffered >= self.flush_every
+                or time.monotonic() - self._last_flush >= self.flush_interval
+            )
+
+    def flush(self, wait=False):
+        """
+        Upload the buffered points on the background thread.
+
+        Parameters:
+            - wait (bool): If True, block until every upload has finished and raise
+            the first upload error.
+        """
+        # Held from draining to submitting, so that uploads keep the logging order
+        with self._flush_lock:
+            with self._lock:
+                points = []
+                for key, series in self._series.items():
+                    points.extend(series.drain(key))
+                self._buffered = 0
+                self._last_flush = time.monotonic()
+
+            if points:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="squid-stream")
+                self._pending.append(self._executor.submit(_upload, self.run_id, points))
+
+                # Bound the memory held by uploads the server has not accepted yet,
+                # unless that would block an event loop
+                while len(self._pending) > MAX_PENDING_UPLOADS and not _on_event_loop():
+                    self._pending.pop(0).result()
+
+            if wait:
+                while self._pending:
+                    self._pending.pop(0).result()
+
+    def close(self):
+        """
+        Upload the remaining points, including incomplete downsampling windows, and
+        wait for every upload. Called when the decorated function returns.
+        """
+        if self._closed:
+            return
+        self._closed = True
+
+        timestamp = time.time_ns() // 1_000_000
+        with self._lock:
+            for series in self._series.values():
+                series.close_window(timestamp)
+
+        try:
+            self.flush(wait=True)
+        finally:
+            if self._executor is not None:
+                self._executor.shutdown()
+
+
+def _on_event_loop():
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+def _close_stream(stream, error=None):
+    """
+    Close the stream. While error is being raised, a failed upload is only a warning,
+    so that it does not replace the error.
+    """
+    if error is None:
+        stream.close()
+        return
+    try:
+        stream.close()
+    except Exception as e:
+        warnings.warn(f"Uploading streamed metrics failed: {e!r}")
+
+
+def _upload(run_id, points):
+    client = MlflowClient(mlflow.get_tracking_uri())
+    for batch_metrics, _, _ in _chunk_batch(points, [], []):
+        client.log_batch(run_id, metrics=batch_metrics)
+
+
+def _with_stream(func, **stream_kwargs):
+    """
+    Wrap func so that metric_stream() returns a stream for the run while it executes.
+    The stream is closed, and its points uploaded, before the run ends.
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        stream = MetricStream(run_id=_last_run_id.get(), **stream_kwargs)
+        token = _active_stream.set(stream)
+        try:
+            result = func(*args, **kwargs)
+        except BaseException as e:
+            _active_stream.reset(token)
+            _close_stream(stream, e)
+            raise
+        _active_stream.reset(token)
+        _close_stream(stream)
+        return result
+    return wrapper
@@ -0,0 +1,163 @@
+import itertools
+import random
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import mlflow
+from mlflow import MlflowClient
+from mlflow.utils.mlflow_tags import MLFLOW_PARENT_RUN_ID
+from .artifacts import _is_dataframe
+from .utils import _get_experiment_id, _log_batch, _run_tags, _run_params, _last_run_id
+
+
+__all__ = ["run_sweep"]
+
+
+EXECUTORS = ("thread", "process")
+
+
+def run_sweep(
+        pipeline,
+        param_space,
+        experiment_name,
+        *args,
+        search="grid",
+        n_trials=None,
+        executor="thread",
+        max_workers=4,
+        seed=None,
+        run_name=None,
+        **kwargs
+    ):
+    """
+    Run a decorated pipeline once per point of a parameter space, in parallel.
+
+    Every trial is logged as a child run of a new parent run. Trial parameters are
+    passed to the pipeline as keyword arguments, next to args, kwargs and
+    experiment_name, and are logged to the child run in a single batch when it
+    starts. Params that autolog logs later under the same name keep the trial's value.
+
+    Parameters:
+        - pipeline: A function decorated with a squid logger's log().
+        - param_space (dict): Parameter names mapped to candidate values. For
+        search="grid", each value is a list. For search="random", a value is a list
+        to sample from, a callable taking a random.Random instance, or a distribution
+        with an rvs(random_state=...) method, like those in scipy.stats.
+        - experiment_name (str): The MLflow experiment name.
+        - args: Positional arguments passed to every trial.
+        - search (str): "grid" for every combination, or "random" for n_trials samples.
+        Defaults to "grid".
+        - n_trials (int, optional): Number of trials. Required for random search. For
+        grid search, only the first n_trials combinations are run.
+        - executor (str): "thread" or "process". Defaults to "thread". Process pools
+        need a pipeline and arguments that can be pickled, so the pipeline must be
+        defined at module level.
+        - max_workers (int): Number of trials run at the same time. Defaults to 4.
+        - seed (int, optional): Seed for random search.
+        - run_name (str, optional): Name of the parent run.
+        - kwargs: Keyword arguments passed to every trial.
+
+    Returns:
+        - DataFrame: One row per trial with the run ID, the trial parameters, the
+        scalar metrics returned by the pipeline and any error raised by the trial.
+    """
+    import pandas as pd
+
+    logger = getattr(pipeline, "_squid_logger", None)
+    if logger is None:
+        raise ValueError("pipeline must be decorated with a squid logger's log() to be used in a sweep.")
+    if executor not in EXECUTORS:
+        raise ValueError(f"executor must be one of {EXECUTORS}. Provided '{executor}'")
+    if executor == "thread" and max_workers > 1 and not logger.concurrent:
+        raise ValueError("Running trials on parallel threads requires a logger created with concurrent=True.")
+
+    trials = _generate_trials(param_space, search, n_trials, seed)
+
+    tracking_uri = mlflow.get_tracking_uri()
+    client = MlflowClient(tracking_uri)
+    experiment_id = _get_experiment_id(experiment_name)
+    parent_run = client.create_run(experiment_id, run_name=run_name, tags={"squid.sweep": "true"})
+    parent_run_id = parent_run.info.run_id
+    _log_batch(parent_run_id, params={"search": search, "n_trials": len(trials)})
+
+    pool_class = ThreadPoolExecutor if executor == "thread" else ProcessPoolExecutor
+    pool = pool_class(
+        max_workers=max_workers,
+        initializer=_init_worker,
+        initargs=(tracking_uri, experiment_name)
+    )
+
+    status = "FAILED"
+    try:
+        with pool:
+            futures = [
+                pool.submit(_run_trial, pipeline, parent_run_id, trial, experiment_name, args, kwargs)
+                for trial in trials
+            ]
+            rows = [future.result() for future in futures]
+        status = "FINISHED"
+    finally:
+        client.set_terminated(parent_run_id, status=status)
+
+    return pd.DataFrame(rows)
+
+
+def _generate_trials(param_space, search, n_trials, seed):
+    """
+    Expand the parameter space into a list of parameter dicts, one per trial.
+    """
+    if search == "grid":
+        names = list(param_space)
+        combinations = itertools.product(*(param_space[name] for name in names))
+        trials = [dict(zip(names, values)) for values in combinations]
+        return trials[:n_trials] if n_trials else trials
+
+    if search == "random":
+        if not n_trials:
+            raise ValueError("n_trials must be specified for search='random'.")
+        rng = random.Random(seed)
+        return [
+            {name: _sample(space, rng) for name, space in param_space.items()}
+            for _ in range(n_trials)
+        ]
+
+    raise ValueError(f"search must be 'grid' or 'random'. Provided '{search}'")
+
+
+def _sample(space, rng):
+    if hasattr(space, "rvs"):
+        return space.rvs(random_state=rng.randrange(2**32))
+    if callable(space):
+        return space(rng)
+    return rng.choice(list(space))
+
+
+def _init_worker(tracking_uri, experiment_name):
+    """
+    Set up each worker once, so that trials do not repeat the connection setup
+    and the experiment lookup.
+    """
+    mlflow.set_tracking_uri(tracking_uri)
+    _get_experiment_id(experiment_name)
+
+
+def _run_trial(pipeline, parent_run_id, trial, experiment_name, args, kwargs):
+    """
+    Run a single trial as a child run of the sweep's parent run.
+    """
+    _run_tags.set({MLFLOW_PARENT_RUN_ID: parent_run_id})
+    _run_params.set(trial)
+    _last_run_id.set(None)
+
+    row = {"run_id": None, **trial}
+    try:
+        _, metrics = pipeline(*args, **kwargs, **trial, experiment_name=experiment_name)
+    except Exception as e:
+        row["run_id"] = _last_run_id.get()
+        row["error"] = repr(e)
+        return row
+
+    row["run_id"] = _last_run_id.get()
+    for metric_name, metric_val in metrics.items():
+        if not _is_dataframe(metric_val):
+            row[metric_name] = metric_val
+
+    return row
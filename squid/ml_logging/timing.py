@@ -0,0 +1,206 @@
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+
+__all__ = ["RunTimings", "opentelemetry_hook"]
+
+
+# Phases of a decorated run, in the order they happen.
+PHASES = (
+    "cache_lookup",
+    "autolog_setup",
+    "experiment_lookup",
+    "run_start",
+    "training",
+    "metric_logging",
+    "artifact_upload",
+    "cache_update",
+    "post_run",
+    "model_serialization",
+    "model_upload",
+    "model_graph"
+)
+
+TIMING_TAG_PREFIX = "squid.timing."
+
+# Timings of the decorated run executing in the current context. Queued logging
+# jobs run in a copy of the submitting context, so they record into the same run.
+_active_timings = ContextVar("squid_active_timings", default=None)
+
+
+class RunTimings:
+    """
+    Seconds spent in each phase of a decorated run, measured with time.perf_counter.
+
+    In async mode, the logging phases are recorded by the worker threads, and the
+    timings are complete once every job queued for the run has finished.
+
+    Attributes:
+        run_id (str): The MLflow run ID, or None if the run was not started.
+        phases (dict): Phase names mapped to seconds. A phase entered more than once,
+            like autolog_setup, adds up.
+        spans (list): (phase, start, end) tuples on the perf_counter clock, in the
+            order the phases finished.
+        complete (bool): Whether every phase of the run has finished.
+    """
+    def __init__(self):
+        self.run_id = None
+        self.phases = {}
+        self.spans = []
+        self.complete = False
+
+        self._started = time.perf_counter()
+        self._started_wall_ns = time.time_ns()
+        self._finished = None
+        self._pending_jobs = 0
+        self._sealed = False
+        self._on_complete = None
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        phases = ", ".join(f"{phase}={seconds:.4f}s" for phase, seconds in self.phases.items())
+        return f"RunTimings(run_id={self.run_id!r}, total={self.total:.4f}s, {phases})"
+
+    @property
+    def total(self):
+        """Seconds from the call of the decorated function until the last phase finished."""
+        finished = self._finished if self._finished is not None else time.perf_counter()
+        return finished - self._started
+
+    def add(self, phase, start, end):
+        with self._lock:
+            self.phases[phase] = self.phases.get(phase, 0.0) + end - start
+            self.spans.append((phase, start, end))
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, start, time.perf_counter())
+
+    def to_dict(self):
+        return {"run_id": self.run_id, "total": self.total, **self.phases}
+
+    def to_tags(self):
+        """The phases and the total as run tags, like squid.timing.training."""
+        return {f"{TIMING_TAG_PREFIX}{name}": f"{seconds:.6f}" for name, seconds in self._with_total().items()}
+
+    def to_metrics(self):
+        """The phases and the total as run metrics, like squid.timing.training."""
+        return {f"{TIMING_TAG_PREFIX}{name}": seconds for name, seconds in self._with_total().items()}
+
+    def wall_time_ns(self, perf_counter_value):
+        """Convert a perf_counter value of a span to nanoseconds since the epoch."""
+        return self._started_wall_ns + int((perf_counter_value - self._started) * 1e9)
+
+    def _with_total(self):
+        return {**self.phases, "total": self.total}
+
+    def _job_started(self):
+        with self._lock:
+            self._pending_jobs += 1
+
+    def _job_finished(self):
+        with self._lock:
+            self._pending_jobs -= 1
+            done = self._sealed and self._pending_jobs == 0
+        if done:
+            self._finish()
+
+    def _seal(self, on_complete=None):
+        """
+        Mark that no more jobs will be queued for the run. on_complete is called with
+        the timings once the pending jobs have finished, or right away if there are none.
+        """
+        with self._lock:
+            self._sealed = True
+            self._on_complete = on_complete
+            done = self._pending_jobs == 0
+        if done:
+            self._finish()
+
+    def _finish(self):
+        self._finished = time.perf_counter()
+        self.complete = True
+        if self._on_complete is not None:
+            self._on_complete(self)
+
+
+@contextmanager
+def _phase(name):
+    """Time the block as a phase of the run in the current context, if there is one."""
+    timings = _active_timings.get()
+    if timings is None:
+        yield
+        return
+
+    with timings.phase(name):
+        yield
+
+
+def _in_phase(name, fn):
+    """Wrap fn so that each call is timed as a phase of the run in the current context."""
+    def timed(*args, **kwargs):
+        with _phase(name):
+            return fn(*args, **kwargs)
+    return timed
+
+
+def _track_job(fn):
+    """
+    Wrap a logging job so the run's timings are only complete once it has finished.
+    Must be called in the context that submits the job.
+    """
+    timings = _active_timings.get()
+    if timings is None:
+        return fn
+
+    timings._job_started()
+
+    def job(*args, **kwargs):
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            timings._job_finished()
+    return job
+
+
+def opentelemetry_hook(tracer=None):
+    """
+    Create a timing hook that exports each run as an OpenTelemetry span, with one
+    child span per phase.
+
+    Parameters:
+        - tracer (opentelemetry.trace.Tracer, optional): Defaults to the tracer of
+        the globally configured provider.
+
+    Returns:
+        - A callable to pass as timing_hook to a logger.
+    """
+    from opentelemetry import trace
+
+    tracer = tracer or trace.get_tracer("squid")
+
+    def hook(timings):
+        attributes = {"mlflow.run_id": timings.run_id or ""}
+        root = tracer.start_span(
+            "squid.run",
+            start_time=timings.wall_time_ns(timings._started),
+            attributes=attributes
+        )
+        context = trace.set_span_in_context(root)
+        for name, start, end in timings.spans:
+            span = tracer.start_span(
+                f"squid.{name}",
+                context=context,
+                start_time=timings.wall_time_ns(start),
+                attributes=attributes
+            )
+            span.end(end_time=timings.wall_time_ns(end))
+        root.end(end_time=timings.wall_time_ns(timings._finished))
+
+    return hook
@@ -1,27 +1,247 @@
+import hashlib
 import os
-from pandas import DataFrame
+import shutil
+import tempfile
+import threading
+import time
+from contextvars import ContextVar
 import mlflow
+from mlflow import MlflowClient
+from mlflow.entities import Metric, Param, RunTag
+from mlflow.exceptions import MlflowException
+from mlflow.protos.databricks_pb2 import RESOURCE_ALREADY_EXISTS, RESOURCE_DOES_NOT_EXIST, INVALID_PARAMETER_VALUE, ErrorCode
+from mlflow.utils.time import get_current_time_millis
+from .artifacts import _log_dataframe, _log_artifact
+from .arrays import _split_metrics, _log_array
+from .timing import _phase
 
 
-def _start_run(func, *args, **kwargs):
+# Limits enforced by the tracking server on a single log_batch request
+# (see mlflow.utils.validation).
+MAX_METRICS_PER_BATCH = 1000
+MAX_PARAMS_TAGS_PER_BATCH = 100
+MAX_ENTITIES_PER_BATCH = 1000
+
+# Seconds for which a resolved experiment ID is reused without asking the tracking server.
+EXPERIMENT_ID_CACHE_TTL = float(os.environ.get("SQUID_ML_EXPERIMENT_CACHE_TTL", 300))
+
+# (tracking URI, experiment name) -> (experiment ID, expiry on the monotonic clock)
+_experiment_id_cache = {}
+_experiment_id_cache_lock = threading.Lock()
+
+# (tracking URI, experiment name) -> lock held while the experiment is looked up or created
+_experiment_name_locks = {}
+
+# Rendered model graphs, keyed by a hash of the architecture and the input shape.
+GRAPH_CACHE_DIR = os.environ.get("SQUID_ML_GRAPH_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".squid", "graphs"))
+
+# Extra tags for runs started in the current context, like the parent run of a sweep trial.
+_run_tags = ContextVar("squid_run_tags", default=None)
+
+# Params for runs started in the current context, like the parameters of a sweep trial.
+# They are logged before training, so that autologged params with the same name never
+# change them.
+_run_params = ContextVar("squid_run_params", default=None)
+
+# ID of the last run started in the current context.
+_last_run_id = ContextVar("squid_last_run_id", default=None)
+
+
+def _start_run(func, args, kwargs, experiment_name=None, log_metrics=None):
     """
     Start an MLflow run and log any metrics returned by func.
+
+    Parameters:
+        - func: The wrapped training function.
+        - args (tuple): Positional arguments for func.
+        - kwargs (dict): Keyword arguments for func.
+        - experiment_name (str, optional): The experiment to start the run in. 
+        Defaults to the active experiment.
+        - log_metrics: Callable taking (run_id, metrics) that logs the returned 
+        metrics. Defaults to _log_metrics.
     """
-    with mlflow.start_run() as run:
+    if log_metrics is None:
+        log_metrics = _log_metrics
+
+    with _start_mlflow_run(experiment_name) as run:
         run_id = run.info.run_id
-        model, metrics = func(*args, **kwargs)
-        for metric_name, metric_val in metrics.items():
-            if isinstance(metric_val, DataFrame):
-                filename = metric_name + ".csv"
-                metric_val.to_csv(filename, index=False)
-                mlflow.log_artifact(filename)
-                os.remove(filename)
-            else:
-                mlflow.log_metric(metric_name, metric_val)
+        _last_run_id.set(run_id)
+        params = _run_params.get()
+        if params:
+            _log_batch(run_id, params=params)
+        with _phase("training"):
+            model, metrics = func(*args, **kwargs)
+        log_metrics(run_id, metrics)
 
     return model, metrics, run_id
 
 
+def _start_mlflow_run(experiment_name=None):
+    """
+    Start an MLflow run in the experiment, using the cached experiment ID when 
+    possible. If the cached experiment was deleted or recreated, the cache entry 
+    is dropped and the ID is resolved again once.
+    """
+    tags = _run_tags.get()
+    if experiment_name is None:
+        with _phase("run_start"):
+            return mlflow.start_run(tags=tags)
+
+    with _phase("experiment_lookup"):
+        experiment_id = _get_experiment_id(experiment_name)
+    try:
+        with _phase("run_start"):
+            return mlflow.start_run(experiment_id=experiment_id, tags=tags)
+    except MlflowException as e:
+        if not _stale_experiment_error(e):
+            raise
+        with _phase("experiment_lookup"):
+            _invalidate_experiment_id(experiment_name)
+            experiment_id = _get_experiment_id(experiment_name)
+        with _phase("run_start"):
+            return mlflow.start_run(experiment_id=experiment_id, tags=tags)
+
+
+def _stale_experiment_error(e):
+    """
+    Whether starting a run failed because the cached experiment no longer exists or was
+    deleted, so that resolving the ID again can help. Other errors are not retried.
+    """
+    return e.error_code in (ErrorCode.Name(RESOURCE_DOES_NOT_EXIST), ErrorCode.Name(INVALID_PARAMETER_VALUE))
+
+
+def _log_metrics(
+        run_id, 
+        metrics, 
+        batch_logging=True, 
+        dataframe_format="csv", 
+        dataframe_compression=None, 
+        dataframe_chunk_rows=None, 
+        uploader=None
+    ):
+    """
+    Log the metrics returned by a training function to the run. DataFrames and 
+    large arrays are logged as artifacts. Small 1-D arrays, Series and tensors are 
+    logged as a metric history with one step per element, and everything else as 
+    a scalar metric.
+
+    Parameters:
+        - run_id (str): The MLflow run ID.
+        - metrics (dict): The metrics returned by the training function.
+        - batch_logging (bool): If True, scalar metrics are sent in chunked 
+        log_batch calls. Otherwise, log_metric is called once per metric.
+        - dataframe_format (str): "csv" or "parquet". Defaults to "csv".
+        - dataframe_compression (str, optional): Compression codec for DataFrame artifacts.
+        - dataframe_chunk_rows (int, optional): Split DataFrames with more rows into 
+        part files that are uploaded in parallel.
+        - uploader (S3ArtifactUploader, optional): Upload DataFrame and array artifacts 
+        straight to the artifact store.
+    """
+    scalar_metrics, histories, arrays, dataframes = _split_metrics(metrics)
+
+    with _phase("artifact_upload"):
+        for metric_name, df in dataframes.items():
+            _log_dataframe(
+                run_id, metric_name, df, 
+                dataframe_format=dataframe_format, 
+                compression=dataframe_compression, 
+                chunk_rows=dataframe_chunk_rows, 
+                uploader=uploader
+            )
+        if arrays:
+            with tempfile.TemporaryDirectory(prefix="squid-") as tmp_dir:
+                for metric_name, array in arrays.items():
+                    _log_array(run_id, metric_name, array, tmp_dir, uploader=uploader)
+
+    with _phase("metric_logging"):
+        if batch_logging:
+            _log_batch(run_id, metrics=scalar_metrics, histories=histories)
+        else:
+            client = MlflowClient(mlflow.get_tracking_uri())
+            for metric_name, metric_val in scalar_metrics.items():
+                client.log_metric(run_id, metric_name, metric_val)
+            for metric_name, (steps, values) in histories.items():
+                for step, value in zip(steps, values):
+                    client.log_metric(run_id, metric_name, value, step=step)
+
+
+def _set_tags(run_id, tags, batch_logging=True):
+    """
+    Set tags on the run, either in chunked log_batch calls or one set_tag call per tag.
+    """
+    if batch_logging:
+        _log_batch(run_id, tags=tags)
+    else:
+        client = MlflowClient(mlflow.get_tracking_uri())
+        for k, v in tags.items():
+            client.set_tag(run_id=run_id, key=k, value=v)
+
+
+def _get_estimator_tags(model):
+    """
+    Tags describing the class of the trained model.
+    """
+    return {
+        "estimator_class": str(model.__class__).split("'")[1], 
+        "estimator_name": model.__class__.__name__
+    }
+
+
+def _log_batch(run_id, metrics=None, params=None, tags=None, step=0, histories=None):
+    """
+    Log metrics, params and tags to the run using as few log_batch calls as 
+    the server's batch limits allow.
+
+    Parameters:
+        - run_id (str): The MLflow run ID.
+        - metrics (dict, optional): Metric names mapped to scalar values.
+        - params (dict, optional): Param names mapped to values.
+        - tags (dict, optional): Tag names mapped to values.
+        - step (int): The step recorded for every metric. Defaults to 0.
+        - histories (dict, optional): Metric names mapped to (steps, values) lists, 
+        logged as one point per step.
+    """
+    timestamp = get_current_time_millis()
+    metric_entities = [Metric(k, float(v), timestamp, step) for k, v in (metrics or {}).items()]
+    for k, (steps, values) in (histories or {}).items():
+        metric_entities += [Metric(k, v, timestamp, s) for s, v in zip(steps, values)]
+    param_entities = [Param(k, str(v)) for k, v in (params or {}).items()]
+    tag_entities = [RunTag(k, str(v)) for k, v in (tags or {}).items()]
+
+    if not (metric_entities or param_entities or tag_entities):
+        return
+
+    client = MlflowClient(mlflow.get_tracking_uri())
+    for batch_metrics, batch_params, batch_tags in _chunk_batch(metric_entities, param_entities, tag_entities):
+        client.log_batch(run_id, metrics=batch_metrics, params=batch_params, tags=batch_tags)
+
+
+def _chunk_batch(metrics, params, tags):
+    """
+    Split metric, param and tag entities into chunks that each fit in a single 
+    log_batch request. Params and tags share one budget, and every chunk stays 
+    within the total entity limit.
+
+    Yields:
+        - tuple: (metrics, params, tags) lists for one log_batch call.
+    """
+    m = p = t = 0
+    while m < len(metrics) or p < len(params) or t < len(tags):
+        n_params = min(len(params) - p, MAX_PARAMS_TAGS_PER_BATCH)
+        n_tags = min(len(tags) - t, MAX_PARAMS_TAGS_PER_BATCH - n_params)
+        n_metrics = min(
+            len(metrics) - m, 
+            MAX_METRICS_PER_BATCH, 
+            MAX_ENTITIES_PER_BATCH - n_params - n_tags
+        )
+
+        yield metrics[m:m + n_metrics], params[p:p + n_params], tags[t:t + n_tags]
+
+        m += n_metrics
+        p += n_params
+        t += n_tags
+
+
 def _convert_name_to_prefix(experiment_name: str):
     """
     Convert experiment_name into a valid prefix that can be used in a MinIO server.
@@ -31,38 +251,137 @@ def _convert_name_to_prefix(experiment_name: str):
     return ''.join(['-' if not c.isalnum() else c for c in experiment_name])
 
 
-def _get_experiment_id(experiment_name: str):
+def _get_experiment_id(experiment_name: str, use_cache=True):
     """
     Retrieve the experiment ID for the experiment name. Create 
     a new experiment if it does not exist.
 
+    IDs of active experiments are cached per tracking URI for 
+    EXPERIMENT_ID_CACHE_TTL seconds.
+
     Parameters:
         - experiment_name (str): The MLflow experiment name.
+        - use_cache (bool): If False, always ask the tracking server. Defaults to True.
     """
-    artifact_location = _convert_name_to_prefix(experiment_name)
+    key = (mlflow.get_tracking_uri(), experiment_name)
+
+    if use_cache:
+        experiment_id = _cached_experiment_id(key)
+        if experiment_id is not None:
+            return experiment_id
+
+    with _experiment_id_cache_lock:
+        name_lock = _experiment_name_locks.setdefault(key, threading.Lock())
+
+    # File stores do not enforce unique names, so threads calling for a new name at the
+    # same time must not each create the experiment
+    with name_lock:
+        if use_cache:
+            experiment_id = _cached_experiment_id(key)
+            if experiment_id is not None:
+                return experiment_id
+
+        artifact_location = _convert_name_to_prefix(experiment_name)
 
-    try:
         experiment = mlflow.get_experiment_by_name(experiment_name)
-        experiment_id = experiment.experiment_id
-    except AttributeError:
-        experiment_id = mlflow.create_experiment(experiment_name, artifact_location=f"mlflow-artifacts:/{artifact_location}")
+        if experiment is None:
+            try:
+                experiment_id = mlflow.create_experiment(experiment_name, artifact_location=f"mlflow-artifacts:/{artifact_location}")
+            except MlflowException as e:
+                # Another worker created the experiment between the lookup and the create
+                if e.error_code != ErrorCode.Name(RESOURCE_ALREADY_EXISTS):
+                    raise
+                experiment = mlflow.get_experiment_by_name(experiment_name)
+
+        if experiment is not None:
+            experiment_id = experiment.experiment_id
+
+        # Deleted experiments are not cached, so that a restore or a recreate is picked up
+        if experiment is None or experiment.lifecycle_stage == "active":
+            with _experiment_id_cache_lock:
+                _experiment_id_cache[key] = (experiment_id, time.monotonic() + EXPERIMENT_ID_CACHE_TTL)
 
     return experiment_id
 
 
-def _save_pytorch_model_graph(model, input_shape, run_id):
+def _cached_experiment_id(key):
+    """The cached experiment ID, or None if it is missing or expired."""
+    with _experiment_id_cache_lock:
+        cached = _experiment_id_cache.get(key)
+    if cached and cached[1] > time.monotonic():
+        return cached[0]
+    return None
+
+
+def _invalidate_experiment_id(experiment_name=None):
+    """
+    Drop cached experiment IDs for the current tracking URI. Call this after 
+    deleting or renaming an experiment outside of squid.
+
+    Parameters:
+        - experiment_name (str, optional): The experiment to drop. Drops every 
+        experiment for the tracking URI if not provided.
+    """
+    tracking_uri = mlflow.get_tracking_uri()
+    with _experiment_id_cache_lock:
+        for key in list(_experiment_id_cache):
+            if key[0] == tracking_uri and experiment_name in (None, key[1]):
+                del _experiment_id_cache[key]
+
+
+def _graph_cache_key(model, input_shape):
+    """
+    Hash of the model architecture and the input shape. torch modules print 
+    their layers and sub-modules, so the repr identifies the architecture.
+    """
+    hasher = hashlib.blake2b(digest_size=16)
+    hasher.update(f"{model.__class__.__module__}.{model.__class__.__qualname__}".encode())
+    hasher.update(repr(model).encode())
+    hasher.update(repr(tuple(input_shape)).encode())
+    return hasher.hexdigest()
+
+
+def _render_pytorch_model_graph(model, input_shape, cache_dir=None):
+    """
+    Render the model graph with torchview, or reuse the image rendered for the same 
+    architecture and input shape.
+
+    Returns:
+        - str: Path of the cached PNG image.
+    """
+    cache_dir = cache_dir or GRAPH_CACHE_DIR
+    cached_path = os.path.join(cache_dir, _graph_cache_key(model, input_shape) + ".png")
+    if os.path.exists(cached_path):
+        return cached_path
+
     from torchview import draw_graph
-    
-    filename = model.__class__.__name__
-    model_graph = draw_graph(
-        model, 
-        input_size=input_shape, 
-        device="meta", 
-        expand_nested=True, 
-        save_graph=True, 
-        filename=filename
-    )
-    image_name = filename + ".png"
-    mlflow.log_artifact(image_name, run_id=run_id)
-    os.remove(image_name)
-    os.remove(filename)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    # Render inside the cache directory, as os.replace cannot move files across filesystems
+    with tempfile.TemporaryDirectory(prefix=".squid-", dir=cache_dir) as tmp_dir:
+        draw_graph(
+            model, 
+            input_size=input_shape, 
+            device="meta", 
+            expand_nested=True, 
+            save_graph=True, 
+            filename="graph", 
+            directory=tmp_dir
+        )
+        # Atomic, so that concurrent renders of the same architecture never expose a partial file
+        os.replace(os.path.join(tmp_dir, "graph.png"), cached_path)
+
+    return cached_path
+
+
+def _save_pytorch_model_graph(model, input_shape, run_id, uploader=None, cache_dir=None):
+    """
+    Log the model graph as the artifact <ClassName>.png. Nothing is written to the 
+    working directory.
+    """
+    cached_path = _render_pytorch_model_graph(model, input_shape, cache_dir)
+
+    with tempfile.TemporaryDirectory(prefix="squid-") as tmp_dir:
+        image_path = os.path.join(tmp_dir, model.__class__.__name__ + ".png")
+        shutil.copyfile(cached_path, image_path)
+        _log_artifact(run_id, image_path, uploader=uploader)
@@ -1,14 +1,10 @@
-# !/bin/sh
-# echo "Waiting for MinIO to start..."
-
-# until curl -s http://localhost:9000/minio/health/live; do
-#     echo "MinIO not ready yet, waiting..."
-#     sleep 5
-# done
-
-sleep 5
-
-mc alias set minioserver http://artifact-store:9000 ${MINIO_ROOT_USER} ${MINIO_ROOT_PASSWORD}
+#!/bin/sh
+# The setup container only starts once the artifact store reports healthy, 
+# so a short retry loop covers the remaining startup race.
+until mc alias set minioserver http://artifact-store:9000 ${MINIO_ROOT_USER} ${MINIO_ROOT_PASSWORD}; do
+    echo "MinIO not ready yet, waiting..."
+    sleep 1
+done
 
 # Create the mlflow bucket
-mc mb minioserver/mlflow-artifacts
+mc mb --ignore-existing minioserver/mlflow-artifacts
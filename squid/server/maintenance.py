@@ -0,0 +1,261 @@
+import json
+import time
+from dataclasses import dataclass
+
+
+# Tag that protects a run from retention policies.
+KEEP_TAG = "squid.keep"
+
+# Tag marking runs whose metric histories were downsampled, so that reruns skip them.
+DOWNSAMPLED_TAG = "squid.downsampled"
+
+# Tables of the MLflow schema that grow with every run.
+MLFLOW_TABLES = ("metrics", "latest_metrics", "params", "tags", "runs")
+
+DATABASE = "mlflow_db"
+
+_DAY_MS = 24 * 60 * 60 * 1000
+
+
+@dataclass(frozen=True)
+class RetentionPolicy:
+    """
+    Which runs of an experiment to keep. Runs outside the policy are soft-deleted,
+    and removed for good by Server.purge_deleted_runs(). Runs tagged squid.keep=true
+    are always kept.
+
+    Attributes:
+        max_age_days (float, optional): Delete runs that started longer ago.
+        max_runs (int, optional): Keep only the latest max_runs runs.
+    """
+    max_age_days: float = None
+    max_runs: int = None
+
+    def __post_init__(self):
+        if self.max_age_days is None and self.max_runs is None:
+            raise ValueError("A RetentionPolicy needs max_age_days, max_runs or both.")
+        if self.max_age_days is not None and self.max_age_days <= 0:
+            raise ValueError(f"max_age_days must be positive. Provided {self.max_age_days}")
+        if self.max_runs is not None and self.max_runs < 0:
+            raise ValueError(f"max_runs must not be negative. Provided {self.max_runs}")
+
+    def expired(self, runs, now_ms):
+        """
+        The runs outside the policy, from runs ordered by start time, latest first.
+        """
+        return self._split(runs, now_ms)[0]
+
+    def _split(self, runs, now_ms, kept=0, protected=()):
+        """
+        Split runs, ordered by start time, latest first, and following kept runs that 
+        count toward max_runs, into the IDs of expired runs and of runs that are kept.
+        Protected runs are neither.
+        """
+        cutoff = None if self.max_age_days is None else now_ms - self.max_age_days * _DAY_MS
+        expired = []
+        kept_ids = []
+        for run in runs:
+            if run.data.tags.get(KEEP_TAG, "").lower() == "true" or run.info.run_id in protected:
+                continue
+            too_old = cutoff is not None and run.info.start_time < cutoff
+            too_many = self.max_runs is not None and kept >= self.max_runs
+            if too_old or too_many:
+                expired.append(run.info.run_id)
+            else:
+                kept += 1
+                kept_ids.append(run.info.run_id)
+        return expired, kept_ids
+
+
+def apply_retention(policies, batch_size=100):
+    """
+    Soft-delete the runs outside each experiment's retention policy, through the
+    tracking server's API. Runs holding a model file that other runs reference, when
+    logged with model_persistence="fast", are kept as well. Runs are fetched one page
+    of batch_size runs at a time,
+    and the page's expired runs are deleted before the next page is fetched. A rerun
+    selects what is left, so an interrupted run resumes.
+
+    Parameters:
+        - policies (dict): Experiment names mapped to a RetentionPolicy. The key "*"
+        applies to every experiment without a policy of its own.
+        - batch_size (int): Runs per page. Defaults to 100.
+
+    Returns:
+        - dict: Experiment names mapped to the number of runs deleted.
+    """
+    import mlflow
+    from mlflow import MlflowClient
+    from mlflow.entities import ViewType
+
+    client = MlflowClient(mlflow.get_tracking_uri())
+    now_ms = int(time.time() * 1000)
+
+    deleted = {}
+    for experiment in client.search_experiments(view_type=ViewType.ACTIVE_ONLY):
+        policy = policies.get(experiment.name, policies.get("*"))
+        if policy is None:
+            continue
+
+        referenced = _referenced_model_runs(client, experiment.experiment_id)
+        deleted[experiment.name] = 0
+        kept = 0
+        page_kept = set()
+        page_token = None
+        while True:
+            page = client.search_runs(
+                experiment_ids=[experiment.experiment_id],
+                run_view_type=ViewType.ACTIVE_ONLY,
+                order_by=["attributes.start_time DESC"],
+                max_results=batch_size,
+                page_token=page_token
+            )
+            # Runs kept on an earlier pass over this page are already counted
+            run_ids, kept_ids = policy._split(
+                [r for r in page if r.info.run_id not in page_kept], now_ms, kept, protected=referenced
+            )
+            kept += len(kept_ids)
+            page_kept.update(kept_ids)
+
+            for run_id in run_ids:
+                client.delete_run(run_id)
+            deleted[experiment.name] += len(run_ids)
+
+            # Page tokens are offsets, so once runs are deleted, later runs move into this page
+            if run_ids:
+                continue
+            page_token = page.token
+            page_kept = set()
+            if not page_token:
+                break
+
+    return deleted
+
+
+def _referenced_model_runs(client, experiment_id):
+    """IDs of the runs whose model file other active runs of the experiment reference."""
+    from mlflow.entities import ViewType
+    from ..ml_logging.persistence import MODEL_REF_TAG
+
+    referenced = set()
+    page_token = None
+    while True:
+        page = client.search_runs(
+            experiment_ids=[experiment_id],
+            filter_string=f"tags.`{MODEL_REF_TAG}` LIKE '%'",
+            run_view_type=ViewType.ACTIVE_ONLY,
+            max_results=1000,
+            page_token=page_token
+        )
+        for run in page:
+            ref = run.data.tags.get(MODEL_REF_TAG)
+            if ref and ref != run.info.run_id:
+                referenced.add(ref)
+        page_token = page.token
+        if not page_token:
+            return referenced
+
+
+def deleted_runs_sql(older_than_days, batch_size, after=None):
+    """
+    Soft-deleted runs to purge, as (deleted_time, run_uuid) rows. Runs holding a model file
+    that active runs reference are left alone.
+
+    Args:
+        after (tuple, optional): The last (deleted_time, run_uuid) row of the previous batch.
+            Only runs after it are returned, so runs that could not be purged are not
+            selected again.
+    """
+    from ..ml_logging.persistence import MODEL_REF_TAG
+
+    cutoff = int(time.time() * 1000 - older_than_days * _DAY_MS)
+    resume = ""
+    if after is not None:
+        deleted_time, run_uuid = after
+        resume = f"AND (coalesce(deleted_time, 0), run_uuid) > ({int(deleted_time)}, {_sql_literal(run_uuid)}) "
+    return (
+        "SELECT coalesce(deleted_time, 0), run_uuid FROM runs "
+        f"WHERE lifecycle_stage = 'deleted' AND coalesce(deleted_time, 0) <= {cutoff} "
+        f"{resume}"
+        "AND run_uuid NOT IN ("
+        "SELECT t.value FROM tags t JOIN runs r ON r.run_uuid = t.run_uuid "
+        f"WHERE t.key = '{MODEL_REF_TAG}' AND t.value IS NOT NULL AND r.lifecycle_stage = 'active'"
+        ") "
+        f"ORDER BY coalesce(deleted_time, 0), run_uuid LIMIT {int(batch_size)}"
+    )
+
+
+def remaining_runs_sql(run_ids):
+    """The runs among run_ids that are still in the backend store."""
+    return f"SELECT run_uuid FROM runs WHERE run_uuid IN ({', '.join(_sql_literal(r) for r in run_ids)})"
+
+
+def _sql_literal(value):
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def referenced_blobs_sql():
+    """The squid.ref.* tags of every run left in the backend store, deleted or not."""
+    from ..ml_logging.dedup import REF_TAG_PREFIX
+
+    return f"SELECT value FROM tags WHERE key LIKE '{REF_TAG_PREFIX}%'"
+
+
+def referenced_blobs(rows):
+    """
+    Hashes of the blobs referenced by the tag values of referenced_blobs_sql(), from
+    rows split on "|" by psql.
+    """
+    referenced = set()
+    for row in rows:
+        try:
+            referenced.add(json.loads("|".join(row))["sha256"])
+        except (ValueError, KeyError, TypeError):
+            continue
+    return referenced
+
+
+def downsample_sql(older_than_days, keep_every, batch_size):
+    """
+    A single statement, and so a single transaction, that thins the metric histories
+    of one batch of finished runs to every keep_every-th step plus the last step, and
+    tags the runs as done. Returns the number of runs and of deleted points.
+    """
+    cutoff = int(time.time() * 1000 - older_than_days * _DAY_MS)
+    keep_every = int(keep_every)
+    return f"""
+WITH batch AS (
+    SELECT r.run_uuid FROM runs r
+    WHERE r.status IN ('FINISHED', 'FAILED', 'KILLED') AND r.end_time < {cutoff}
+    AND NOT EXISTS (SELECT 1 FROM tags t WHERE t.run_uuid = r.run_uuid AND t.key = '{DOWNSAMPLED_TAG}')
+    ORDER BY r.end_time
+    LIMIT {int(batch_size)}
+),
+last_steps AS (
+    SELECT run_uuid, key, max(step) AS last_step FROM metrics
+    WHERE run_uuid IN (SELECT run_uuid FROM batch)
+    GROUP BY run_uuid, key
+),
+deleted AS (
+    DELETE FROM metrics m USING last_steps l
+    WHERE m.run_uuid = l.run_uuid AND m.key = l.key
+    AND m.step % {keep_every} <> 0 AND m.step <> l.last_step
+    RETURNING 1
+),
+marked AS (
+    INSERT INTO tags (key, value, run_uuid)
+    SELECT '{DOWNSAMPLED_TAG}', '{keep_every}', run_uuid FROM batch
+    RETURNING 1
+)
+SELECT (SELECT count(*) FROM marked), (SELECT count(*) FROM deleted)
+"""
+
+
+def vacuum_sql(table, reindex=False):
+    """Statements that reclaim dead rows, refresh planner statistics and rebuild indexes without locking writes."""
+    if table not in MLFLOW_TABLES:
+        raise ValueError(f"table must be one of {MLFLOW_TABLES}. Provided '{table}'")
+    statements = [f"VACUUM (ANALYZE) {table}"]
+    if reindex:
+        statements.append(f"REINDEX TABLE CONCURRENTLY {table}")
+    return statements
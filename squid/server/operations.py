@@ -1,10 +1,34 @@
+import hashlib
+import json
 import os
+import socket
 import sys
+import time
+import warnings
+from contextlib import contextmanager
 from importlib.metadata import version, PackageNotFoundError
 from pathlib import Path
-from python_on_whales import DockerClient
-import mlflow
 import re
+import requests
+from . import maintenance
+from .profiles import get_profile
+from .utils import _lock_fd
+
+
+SERVICES = ("backend-store", "pooler", "artifact-store", "artifact-store-setup", "mlflow")
+
+# Compose project of the Postgres and MinIO containers that shared-mode projects use.
+SHARED_PROJECT_NAME = "squid-shared"
+SHARED_SERVICES = ("backend-store", "pooler", "artifact-store", "artifact-store-setup")
+
+# Ports allocated to shared-mode projects, so that each keeps its ports across restarts.
+SHARED_PORTS_FILE = os.environ.get(
+    "SQUID_ML_SHARED_PORTS_FILE",
+    os.path.join(os.path.expanduser("~"), ".squid", "shared-ports.json")
+)
+
+IMAGE_NAME = "mlflow_server"
+DOCKERFILE_HASH_LABEL = "squid.dockerfile_hash"
 
 
 class Server:
@@ -21,37 +45,88 @@ class Server:
         ui_port (int): Port number for the MLflow UI.
         artifact_store_port (int): Port number for the artifact store.
         console_port (int): Port number for the console.
+        profile (ServerProfile): Performance settings for MLflow, Postgres and the connection pooler.
+        direct_artifact_uploads (bool): Whether loggers upload artifacts straight to the artifact store.
+        shared (bool): Whether the project uses the Postgres and MinIO containers shared by all projects.
     """
-    def __init__(self, project_name=None, ui_port=5001, artifact_store_port=5002, console_port=5003) -> None:
+    def __init__(self, project_name=None, ui_port=None, artifact_store_port=None, console_port=None, profile=None, direct_artifact_uploads=False, shared=False) -> None:
         """
         Initialize the Server instance.
 
         Args:
             project_name (str, optional): Name of the project. Defaults to current working directory name if not provided.
-            ui_port (int, optional): Port for the MLflow UI. Defaults to 5001.
-            artifact_store_port (int, optional): Port for the artifact store. Defaults to 5002.
-            console_port (int, optional): Port for the console. Defaults to 5003.
+            ui_port (int, optional): Port for the MLflow UI. Defaults to 5001, or a free port 
+                allocated to the project in shared mode.
+            artifact_store_port (int, optional): Port for the artifact store. Defaults to 5002, or the 
+                port of the shared artifact store in shared mode.
+            console_port (int, optional): Port for the console. Defaults to 5003, or the port of the 
+                shared console in shared mode.
+            profile (str or ServerProfile, optional): A preset from squid.server.profiles.PROFILES, 
+                'laptop', 'team' or 'shared', or a custom ServerProfile. Defaults to 'laptop', or 
+                'shared' in shared mode.
+            direct_artifact_uploads (bool, optional): If True, loggers created in this process upload 
+                artifacts straight to the MinIO bucket with parallel multipart uploads, instead of 
+                through the MLflow server. Defaults to False.
+            shared (bool, optional): If True, the project stores its runs in its own database of a 
+                Postgres container shared by every project on the host, and its artifacts under its own 
+                prefix of a shared MinIO bucket. The project only runs an MLflow container of its own, 
+                so starting it takes seconds once the shared containers are up. Defaults to False.
+
+        Raises:
+            ValueError: If the profile preset is unknown.
         """
 
         if not project_name:
             project_name = os.path.basename(os.getcwd())
 
         self.project_name = project_name
-        self.ui_port = ui_port
-        self.artifact_store_port = artifact_store_port
-        self.console_port = console_port
+        self.shared = shared
+        if shared:
+            self.ui_port = ui_port or _allocate_port(f"{project_name}:mlflow")
+            self.artifact_store_port = artifact_store_port or _allocate_port(f"{SHARED_PROJECT_NAME}:artifact-store")
+            self.console_port = console_port or _allocate_port(f"{SHARED_PROJECT_NAME}:console")
+        else:
+            self.ui_port = ui_port or 5001
+            self.artifact_store_port = artifact_store_port or 5002
+            self.console_port = console_port or 5003
+        self.profile = get_profile(profile or ("shared" if shared else "laptop"))
+        self.direct_artifact_uploads = direct_artifact_uploads
+
+        # The project's database, and its prefix in the artifact bucket. Cleaning up the name 
+        # maps different names to the same one, so a hash of the name keeps projects apart.
+        self._database = maintenance.DATABASE
+        self._artifact_prefix = ""
+        if shared:
+            name_hash = hashlib.sha256(project_name.encode()).hexdigest()[:8]
+            self._database = "mlflow_" + re.sub(r"[^a-z0-9_]", "_", project_name.lower())[:40] + "_" + name_hash
+            self._artifact_prefix = re.sub(r"[^a-z0-9-]", "-", project_name.lower())[:40] + "-" + name_hash
 
-        mlflow.set_tracking_uri(f"http://localhost:{self.ui_port}")
+        self._set_tracking_uri()
 
         self._set_project_name()
         self._set_ports()
+        self._set_profile()
+        self._set_artifact_store_access()
+        self._set_shared_storage()
 
         self._python = ""
         self._mlflow = ""
 
-        self._docker_client = self._create_docker_client()
+        self._docker = None
+        self._shared_docker = None
+
+    @staticmethod
+    def _infra_dir() -> Path:
+        return Path(__file__).resolve().parent / "infra"
 
-    def _create_docker_client(self) -> DockerClient:
+    @property
+    def _docker_client(self):
+        """The Docker client, created on the first lifecycle call."""
+        if self._docker is None:
+            self._docker = self._create_docker_client()
+        return self._docker
+
+    def _create_docker_client(self) -> "DockerClient":
         """
         Create a Docker client configured with the project's docker-compose file.
 
@@ -59,8 +134,10 @@ class Server:
             DockerClient: A Docker client instance configured for the project.
         """
 
-        server_dir = Path(__file__).resolve().parent
-        docker_compose_file = server_dir / "infra" / "docker-compose.yaml"
+        from python_on_whales import DockerClient
+
+        compose_file = "docker-compose.project.yaml" if self.shared else "docker-compose.yaml"
+        docker_compose_file = self._infra_dir() / compose_file
         docker = DockerClient(
             compose_files=[docker_compose_file], 
             compose_project_name=self.project_name
@@ -68,12 +145,58 @@ class Server:
 
         return docker
 
+    @property
+    def _shared_docker_client(self):
+        """The Docker client for the shared Postgres and MinIO containers."""
+        if self._shared_docker is None:
+            from python_on_whales import DockerClient
+
+            self._shared_docker = DockerClient(
+                compose_files=[self._infra_dir() / "docker-compose.shared.yaml"], 
+                compose_project_name=SHARED_PROJECT_NAME
+            )
+        return self._shared_docker
+
+    def _set_tracking_uri(self):
+        """
+        Point MLflow at the server. The environment variable is read when mlflow is 
+        imported, so mlflow is only configured directly if it was already imported.
+        """
+        tracking_uri = f"http://localhost:{self.ui_port}"
+        os.environ["MLFLOW_TRACKING_URI"] = tracking_uri
+        if "mlflow" in sys.modules:
+            sys.modules["mlflow"].set_tracking_uri(tracking_uri)
+
     def _set_ports(self):
         """Set environment variables for the ports used by the MLflow UI, artifact store, and console."""
         os.environ["SQUID_ML_UI_PORT"] = str(self.ui_port)
         os.environ["SQUID_ML_ARTIFACT_STORE_PORT"] = str(self.artifact_store_port)
         os.environ["SQUID_ML_CONSOLE_PORT"] = str(self.console_port)
 
+    def _set_profile(self):
+        """Set environment variables for the MLflow, Postgres and pooler performance settings."""
+        os.environ.update(self.profile.to_env())
+
+    def _set_artifact_store_access(self):
+        """
+        Set environment variables through which loggers reach the artifact store directly. 
+        The credentials are read from the infra .env file unless already set in the environment.
+        """
+        env_file = _read_env_file(self._infra_dir() / ".env")
+        for name in ("ARTIFACT_STORE_ACCESS_KEY", "ARTIFACT_STORE_SECRET_KEY"):
+            value = os.environ.get(name, env_file.get(name))
+            if value is not None:
+                os.environ[f"SQUID_ML_{name}"] = value
+
+        os.environ["SQUID_ML_ARTIFACT_STORE_URL"] = f"http://localhost:{self.artifact_store_port}"
+        os.environ["SQUID_ML_DIRECT_UPLOADS"] = str(self.direct_artifact_uploads).lower()
+
+    def _set_shared_storage(self):
+        """Set environment variables for the project's database and artifact prefix."""
+        os.environ["SQUID_ML_DATABASE"] = self._database
+        os.environ["SQUID_ML_ARTIFACT_PREFIX"] = self._artifact_prefix
+        os.environ["SQUID_ML_ARTIFACT_STORE_PREFIX"] = self._artifact_prefix
+
     def _set_versions(self, python_: str, mlflow_: str):
         """
         Validate and set Python and MLflow versions as environment variables.
@@ -94,26 +217,84 @@ class Server:
         self._python = python_
         os.environ["SQUID_ML_MLFLOW_VERSION"] = mlflow_
         self._mlflow = mlflow_
+        os.environ["SQUID_ML_IMAGE_TAG"] = self._image_tag()
+        os.environ["SQUID_ML_DOCKERFILE_HASH"] = self._dockerfile_hash()
+
+    def _image_tag(self) -> str:
+        """Tag of the mlflow_server image for the current versions, like 'py3.10-mlflow2.18.0'."""
+        if not (self._python and self._mlflow):
+            return "latest"
+        return f"py{self._python}-mlflow{self._mlflow}"
+
+    def _dockerfile_hash(self) -> str:
+        """Hash of the mlflow_server Dockerfile, stored as an image label to detect changes."""
+        dockerfile = self._infra_dir() / "mlflow_server" / "Dockerfile"
+        return hashlib.sha256(dockerfile.read_bytes()).hexdigest()[:16]
+
+    def _image_up_to_date(self) -> bool:
+        """Check whether an image for the current versions exists and was built from the current Dockerfile."""
+        image_name = f"{IMAGE_NAME}:{self._image_tag()}"
+        if not self._docker_client.image.exists(image_name):
+            return False
+
+        labels = self._docker_client.image.inspect(image_name).config.labels or {}
+        return labels.get(DOCKERFILE_HASH_LABEL) == self._dockerfile_hash()
+
+    def _latest_image_versions(self):
+        """
+        Find the most recently built version-tagged mlflow_server image.
+
+        Returns:
+            tuple: (python_version, mlflow_version), or None if there is no such image.
+        """
+        tag_pattern = re.compile(rf"^{IMAGE_NAME}:py(\d+\.\d+)-mlflow(\d+\.\d+\.\d+)$")
+
+        candidates = []
+        for image in self._docker_client.image.list(IMAGE_NAME):
+            for repo_tag in image.repo_tags:
+                match = tag_pattern.match(repo_tag)
+                if match:
+                    candidates.append((image.created, match.groups()))
+
+        if not candidates:
+            return None
+        return max(candidates)[1]
     
     def _set_project_name(self):
         """Set the project name as an environment variable."""
         os.environ["SQUID_ML_PROJECT_NAME"] = self.project_name
 
 
-    def start(self, quiet=True, use_current_env=False, python_version="", mlflow_version=""):
+    def start(self, quiet=True, use_current_env=False, python_version="", mlflow_version="", replay_spooled_runs=True, spool_dir=None, timeout=180):
         """
-        Start the MLflow server using Docker Compose.
+        Start the MLflow server using Docker Compose, and wait until it accepts requests.
+
+        The mlflow_server image is tagged by version, like mlflow_server:py3.10-mlflow2.18.0, 
+        and only built if no image exists for the versions or the Dockerfile changed. Without 
+        versions, the most recently built image is reused, or an untagged mlflow_server:latest 
+        image if no tagged image exists. Existing containers of the project 
+        are restarted instead of recreated when they already run that image.
 
         Args:
             quiet (bool, optional): Whether to suppress Docker build and compose output. Defaults to True.
             use_current_env (bool, optional): If True, use the current environment's Python and MLflow versions. Defaults to False.
             python_version (str, optional): Python version in the format '<major>.<minor>'. Required if not using current env. Defaults to "".
             mlflow_version (str, optional): MLflow version in the format '<major>.<minor>.<patch>'. Required if not using current env. Defaults to "".
+            replay_spooled_runs (bool, optional): If True, push runs that loggers spooled while the server was unreachable. Defaults to True.
+            spool_dir (str, optional): The spool directory to replay. Defaults to SQUID_ML_SPOOL_DIR or ~/.squid/spool.
+            timeout (int, optional): Seconds to wait for all services to become ready. Defaults to 180.
+
+        Returns:
+            dict: Seconds from the start of the call until each service was ready, plus "compose" for 
+            the time spent in Docker Compose and "total".
 
         Raises:
             ModuleNotFoundError: If use_current_env=True but MLflow is not installed.
             ValueError: If required versions are missing or in the wrong format.
+            TimeoutError: If a service is not ready within timeout seconds.
         """
+        started_at = time.monotonic()
+
         if use_current_env: 
             try:
                 mlflow_version = version("mlflow")
@@ -124,20 +305,160 @@ class Server:
             v_info = sys.version_info
             python_version = f"{v_info.major}.{v_info.minor}"
 
-        self._set_versions(python_=python_version, mlflow_=mlflow_version)
-
-        if not self._docker_client.image.exists("mlflow_server") and not (python_version and mlflow_version) and not use_current_env:
-            message = "Docker image mlflow_server not found. Please use use_current_enviroment=True or specify python_version <major.minor> and mlflow_version <major.minor.patch> to proceed."
-            raise ValueError(message)
-        elif use_current_env or (python_version and mlflow_version):
-            self._docker_client.compose.build(quiet=quiet)
-        elif not use_current_env and (python_version or mlflow_version):
+        if not use_current_env and bool(python_version) != bool(mlflow_version):
             argument = "python_version" if python_version else "mlflow_version"
             message = f"Both python_version and mlflow_version must be provided for building the image. Only {argument} was provided."
             raise ValueError(message)
 
-        # TODO: Change to docker compose start if the project already exists. 
-        self._docker_client.compose.up(detach=True, quiet=quiet)
+        untagged_image = False
+        if not (python_version and mlflow_version):
+            # Reuse the most recently built image
+            latest_versions = self._latest_image_versions()
+            if latest_versions is not None:
+                python_version, mlflow_version = latest_versions
+            elif self._docker_client.image.exists(f"{IMAGE_NAME}:latest"):
+                # Built before images were tagged by version, so it is reused as is
+                untagged_image = True
+            else:
+                message = "Docker image mlflow_server not found. Please use use_current_enviroment=True or specify python_version <major.minor> and mlflow_version <major.minor.patch> to proceed."
+                raise ValueError(message)
+
+        self._set_versions(python_=python_version, mlflow_=mlflow_version)
+
+        if self.shared:
+            self._start_shared_storage(quiet=quiet, timeout=timeout)
+
+        # Only rebuild when the versions or the Dockerfile changed
+        built = False
+        if not untagged_image and not self._image_up_to_date():
+            self._docker_client.compose.build(quiet=quiet)
+            built = True
+
+        if not built and self._containers_reusable():
+            self._docker_client.compose.start()
+        else:
+            self._docker_client.compose.up(detach=True, quiet=quiet)
+
+        timings = {"compose": time.monotonic() - started_at}
+        timings.update(self._wait_until_ready(started_at, timeout))
+        timings["total"] = time.monotonic() - started_at
+        self.startup_timings = timings
+
+        if replay_spooled_runs:
+            # The server is up, so a failed replay must not fail start(). Runs stay spooled.
+            try:
+                self._replay_spool(spool_dir)
+            except Exception as e:
+                warnings.warn(f"Replaying spooled runs failed, and they stay spooled: {e!r}")
+
+        return timings
+
+    def _containers_reusable(self):
+        """
+        Check whether every service of the project already has a container, running or stopped, 
+        and the MLflow container runs the image for the current versions.
+        """
+        containers = {c.name: c for c in self._docker_client.compose.ps(all=True)}
+        services = ("mlflow",) if self.shared else SERVICES
+        if not all(self._container_name(service) in containers for service in services):
+            return False
+
+        mlflow_container = containers[self._container_name("mlflow")]
+        return mlflow_container.config.image == f"{IMAGE_NAME}:{self._image_tag()}"
+
+    def _container_name(self, service):
+        if self.shared and service in SHARED_SERVICES:
+            return f"{SHARED_PROJECT_NAME}-mlops-{service}"
+        suffix = "ui" if service == "mlflow" else service
+        return f"{self.project_name}-mlops-{suffix}"
+
+    def _start_shared_storage(self, quiet=True, timeout=180):
+        """
+        Start the shared Postgres and MinIO containers unless they are running, and create 
+        the project's database. The bucket is shared, and a prefix needs no setup.
+        """
+        running = {c.name for c in self._shared_docker_client.compose.ps() if c.state.running}
+        if not all(self._container_name(s) in running for s in ("backend-store", "pooler", "artifact-store")):
+            self._shared_docker_client.compose.up(detach=True, quiet=quiet)
+
+        deadline = time.monotonic() + timeout
+        delay = 0.1
+        while not self._backend_store_ready():
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"The shared backend store was not ready within {timeout}s.")
+            time.sleep(delay)
+            delay = min(delay * 1.5, 2.0)
+
+        if not self._psql(f"SELECT 1 FROM pg_database WHERE datname = '{self._database}'", database="postgres"):
+            self._psql(f'CREATE DATABASE "{self._database}"', database="postgres")
+
+    def _wait_until_ready(self, started_at, timeout=180):
+        """
+        Poll each service with exponential backoff until it is ready.
+
+        Args:
+            started_at (float): time.monotonic() value that the timings are measured from.
+            timeout (int, optional): Seconds after started_at to give up. Defaults to 180.
+
+        Returns:
+            dict: Seconds from started_at until each service was ready.
+
+        Raises:
+            TimeoutError: If a service is not ready in time.
+        """
+        checks = {
+            "backend-store": self._backend_store_ready,
+            "artifact-store": lambda: _http_ok(f"http://localhost:{self.artifact_store_port}/minio/health/live"),
+            "mlflow": lambda: _http_ok(f"http://localhost:{self.ui_port}/health")
+        }
+
+        deadline = started_at + timeout
+        timings = {}
+        for service, is_ready in checks.items():
+            delay = 0.1
+            while not is_ready():
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"Service {service} of project {self.project_name} was not ready within {timeout}s.")
+                time.sleep(delay)
+                delay = min(delay * 1.5, 2.0)
+            timings[service] = time.monotonic() - started_at
+
+        return timings
+
+    def _backend_store_ready(self):
+        """Check the Postgres container's health check, which runs pg_isready."""
+        try:
+            container = self._docker_client.container.inspect(self._container_name("backend-store"))
+        except Exception:
+            return False
+
+        health = container.state.health
+        return health is not None and health.status == "healthy"
+
+    def _replay_spool(self, spool_dir=None, timeout=120):
+        """
+        Wait for the tracking server to accept requests, then replay spooled runs.
+
+        Args:
+            spool_dir (str, optional): The spool directory. Defaults to SQUID_ML_SPOOL_DIR or ~/.squid/spool.
+            timeout (int, optional): Seconds to wait for the tracking server. Defaults to 120.
+
+        Returns:
+            list: IDs of the replayed runs.
+        """
+        from ..ml_logging.spool import replay_spool, _has_pending_runs, _tracking_server_available
+
+        if not _has_pending_runs(spool_dir):
+            return []
+
+        deadline = time.monotonic() + timeout
+        while not _tracking_server_available():
+            if time.monotonic() > deadline:
+                warnings.warn(f"Tracking server did not come up within {timeout}s. Spooled runs were not replayed.")
+                return []
+            time.sleep(1)
+
+        return replay_spool(spool_dir)
 
     def stop(self):
         """Stop the running MLflow server containers without removing them."""
@@ -149,12 +470,305 @@ class Server:
 
         Args:
             quiet (bool, optional): Whether to suppress Docker compose output. Defaults to True.
-            delete_all_data (bool, optional): If True, delete associated volumes (all stored data). Defaults to False.
+            delete_all_data (bool, optional): If True, delete associated volumes (all stored data). 
+                In shared mode, drop the project's database, delete its artifacts and free its UI port 
+                instead, and keep the shared containers running. Defaults to False.
         """
         self._set_versions(python_=self._python, mlflow_=self._mlflow)
 
+        if self.shared and delete_all_data:
+            self._psql(f'DROP DATABASE IF EXISTS "{self._database}" WITH (FORCE)', database="postgres")
+            self._mc(f"mc rm -r --force local/mlflow-artifacts/{self._artifact_prefix}")
+
         self._docker_client.compose.down(
+            remove_orphans=True, 
+            volumes=delete_all_data and not self.shared, 
+            quiet=quiet
+            )
+
+        if self.shared and delete_all_data:
+            _release_port(f"{self.project_name}:mlflow")
+
+    def down_shared(self, quiet=True, delete_all_data=False):
+        """
+        Stop and remove the Postgres and MinIO containers shared by all projects. Projects 
+        still running lose their backend and artifact stores.
+
+        Args:
+            quiet (bool, optional): Whether to suppress Docker compose output. Defaults to True.
+            delete_all_data (bool, optional): If True, delete the shared volumes, and so the data 
+                of every project. Defaults to False.
+        """
+        self._shared_docker_client.compose.down(
             remove_orphans=True, 
             volumes=delete_all_data, 
             quiet=quiet
             )
+
+
+    def _credential(self, name):
+        """A credential of the infra .env file, unless overridden in the environment."""
+        return os.environ.get(name, _read_env_file(self._infra_dir() / ".env").get(name))
+
+    def _mc(self, script, *args):
+        """
+        Run a shell script of mc commands in the artifact store container, with the alias 
+        local pointing at the store. The credentials never appear on a command line.
+
+        Returns:
+            str: The output of the script.
+        """
+        return self._docker_client.container.execute(
+            self._container_name("artifact-store"),
+            [
+                "sh", "-c", 
+                'mc alias set local http://localhost:9000 "$MINIO_ROOT_USER" "$MINIO_ROOT_PASSWORD" > /dev/null && ' + script, 
+                "sh", *args
+            ]
+        )
+
+    def _psql(self, sql, database=None):
+        """
+        Run a statement with psql in the backend store container.
+
+        Args:
+            sql (str): The statement.
+            database (str, optional): Defaults to the project's database.
+
+        Returns:
+            list: The result rows, as lists of strings.
+        """
+        output = self._docker_client.container.execute(
+            self._container_name("backend-store"),
+            ["psql", "-U", self._credential("DB_USERNAME"), "-d", database or self._database, "-tA", "-v", "ON_ERROR_STOP=1", "-c", sql]
+        )
+        return [line.split("|") for line in (output or "").splitlines() if line]
+
+    def apply_retention(self, policies, batch_size=100):
+        """
+        Soft-delete the runs outside each experiment's retention policy. Runs tagged
+        squid.keep=true are kept. Safe to run while the server is up, and to rerun if
+        interrupted.
+
+        Args:
+            policies (dict): Experiment names mapped to a squid.server.maintenance.RetentionPolicy.
+                The key "*" applies to every other experiment.
+            batch_size (int, optional): Runs fetched and deleted per page. Defaults to 100.
+
+        Returns:
+            dict: Experiment names mapped to the number of runs deleted.
+        """
+        return maintenance.apply_retention(policies, batch_size=batch_size)
+
+    def purge_deleted_runs(self, older_than_days=0, batch_size=100):
+        """
+        Permanently delete soft-deleted runs and their artifacts with mlflow gc, which runs
+        in the MLflow container. Runs are purged in batches, so an interrupted purge resumes
+        with the runs that are left. Runs that mlflow gc leaves in the backend store are not
+        tried again in the same call, and a warning lists them.
+
+        Args:
+            older_than_days (float, optional): Only purge runs deleted at least this long ago.
+                Defaults to 0.
+            batch_size (int, optional): Runs per mlflow gc call. Defaults to 100.
+
+        Returns:
+            int: The number of purged runs.
+        """
+        # The password is passed through the environment, where ps and docker events cannot see it
+        backend_store_uri = f"postgresql://{self._credential('DB_USERNAME')}@backend-store:5432/{self._database}"
+        artifacts_destination = "/".join(p for p in ("s3://mlflow-artifacts", self._artifact_prefix) if p)
+
+        purged = 0
+        left = []
+        after = None
+        while True:
+            rows = self._psql(maintenance.deleted_runs_sql(older_than_days, batch_size, after=after))
+            if not rows:
+                break
+            after = rows[-1]
+            run_ids = [run_id for _, run_id in rows]
+
+            self._docker_client.container.execute(
+                self._container_name("mlflow"),
+                [
+                    "mlflow", "gc",
+                    "--backend-store-uri", backend_store_uri,
+                    "--artifacts-destination", artifacts_destination,
+                    "--run-ids", ",".join(run_ids)
+                ],
+                envs={"PGPASSWORD": self._credential("DB_PASSWORD")}
+            )
+            remaining = [row[0] for row in self._psql(maintenance.remaining_runs_sql(run_ids))]
+            purged += len(run_ids) - len(remaining)
+            left.extend(remaining)
+
+        if left:
+            warnings.warn(f"mlflow gc left {len(left)} deleted runs in the backend store: {', '.join(left[:10])}")
+        return purged
+
+    def downsample_metrics(self, older_than_days=30, keep_every=10, batch_size=50):
+        """
+        Thin the metric histories of runs that finished long ago to every keep_every-th step,
+        plus the last step of each metric. Each batch of runs is thinned in one transaction
+        and tagged squid.downsampled, so the operation is safe while the server is up and
+        resumes where it stopped.
+
+        Args:
+            older_than_days (float, optional): Only downsample runs that ended at least this
+                long ago. Defaults to 30.
+            keep_every (int, optional): Step interval of the points that are kept. Defaults to 10.
+            batch_size (int, optional): Runs per transaction. Defaults to 50.
+
+        Returns:
+            dict: "runs" and "points", the numbers of runs downsampled and points deleted.
+        """
+        if keep_every < 2:
+            raise ValueError(f"keep_every must be at least 2. Provided {keep_every}")
+
+        totals = {"runs": 0, "points": 0}
+        while True:
+            (runs, points), = self._psql(maintenance.downsample_sql(older_than_days, keep_every, batch_size))
+            if not int(runs):
+                return totals
+            totals["runs"] += int(runs)
+            totals["points"] += int(points)
+
+    def sweep_artifact_blobs(self, min_age_hours=24, batch_size=500):
+        """
+        Delete the deduplicated artifact blobs in squid-cas that no run references any more. 
+        Purging runs removes their squid.ref.* tags, but not the blobs they pointed to. Blobs 
+        referenced by any run left in the backend store, deleted or not, are kept, and so are 
+        blobs younger than min_age_hours, whose runs may not have tagged them yet. Run it after 
+        purge_deleted_runs().
+
+        A run that reuses a blob while it is being swept can lose it, so sweep when few 
+        runs log deduplicated artifacts.
+
+        Args:
+            min_age_hours (int, optional): Only delete blobs stored at least this long ago. 
+                Defaults to 24.
+            batch_size (int, optional): Blobs per mc rm call. Defaults to 500.
+
+        Returns:
+            int: The number of deleted blobs.
+        """
+        from ..ml_logging.dedup import CAS_DIRNAME
+
+        referenced = maintenance.referenced_blobs(self._psql(maintenance.referenced_blobs_sql()))
+
+        cas_dir = "/".join(p for p in ("local/mlflow-artifacts", self._artifact_prefix, CAS_DIRNAME) if p)
+        # mc find fails if nothing was ever deduplicated
+        listing = self._mc(f'mc find "$1" --older-than {int(min_age_hours)}h 2> /dev/null || true', cas_dir)
+        unreferenced = [
+            path for path in listing.splitlines()
+            if path.strip() and path.strip().rsplit("/", 1)[-1] not in referenced
+        ]
+
+        for i in range(0, len(unreferenced), batch_size):
+            self._mc('mc rm "$@" > /dev/null', *[path.strip() for path in unreferenced[i:i + batch_size]])
+        return len(unreferenced)
+
+    def vacuum(self, tables=maintenance.MLFLOW_TABLES, reindex=False):
+        """
+        Reclaim the space of deleted rows, refresh the planner statistics and optionally rebuild
+        the indexes of the MLflow tables, one table at a time. Neither VACUUM nor a concurrent
+        reindex blocks the MLflow server's reads and writes. Run it after purging or downsampling.
+
+        Args:
+            tables (tuple, optional): Tables to process. Defaults to the tables that grow with every run.
+            reindex (bool, optional): Also rebuild the indexes. Defaults to False.
+
+        Returns:
+            dict: Seconds spent on each table.
+        """
+        timings = {}
+        for table in tables:
+            started_at = time.monotonic()
+            for statement in maintenance.vacuum_sql(table, reindex=reindex):
+                self._psql(statement)
+            timings[table] = time.monotonic() - started_at
+        return timings
+
+
+@contextmanager
+def _locked_ports(ports_file=None):
+    """
+    Hold an exclusive lock on the ports file across processes, and yield its contents. 
+    Changes to the yielded dict are written back when the block exits.
+    """
+    ports_file = ports_file or SHARED_PORTS_FILE
+    os.makedirs(os.path.dirname(ports_file), exist_ok=True)
+    with open(f"{ports_file}.lock", "w") as lock:
+        _lock_fd(lock.fileno())
+        try:
+            with open(ports_file) as f:
+                ports = json.load(f)
+        except (OSError, ValueError):
+            ports = {}
+        before = dict(ports)
+
+        yield ports
+
+        if ports != before:
+            tmp_path = f"{ports_file}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(ports, f, indent=2, sort_keys=True)
+            os.replace(tmp_path, ports_file)
+
+
+def _allocate_port(key, ports_file=None):
+    """
+    The port allocated to key, like "<project>:mlflow". A new key gets a free port that 
+    no other key holds, and keeps it across restarts.
+
+    Args:
+        key (str): What the port is for.
+        ports_file (str, optional): Defaults to SQUID_ML_SHARED_PORTS_FILE or ~/.squid/shared-ports.json.
+
+    Returns:
+        int: The port.
+    """
+    with _locked_ports(ports_file) as ports:
+        if key in ports:
+            return ports[key]
+
+        taken = set(ports.values())
+        while True:
+            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+                sock.bind(("127.0.0.1", 0))
+                port = sock.getsockname()[1]
+            if port not in taken:
+                break
+
+        ports[key] = port
+        return port
+
+
+def _release_port(key, ports_file=None):
+    """Free the port allocated to key, if any."""
+    with _locked_ports(ports_file) as ports:
+        ports.pop(key, None)
+
+
+def _read_env_file(path):
+    """Parse the KEY=VALUE lines of a dotenv file."""
+    values = {}
+    if not path.exists():
+        return values
+
+    for line in path.read_text().splitlines():
+        line = line.strip()
+        if not line or line.startswith("#") or "=" not in line:
+            continue
+        key, value = line.split("=", 1)
+        values[key.strip()] = value.strip().strip("'\"")
+    return values
+
+
+def _http_ok(url, timeout=1.0):
+    """Check whether a GET request to url succeeds."""
+    try:
+        return requests.get(url, timeout=timeout).ok
+    except requests.RequestException:
+        return False
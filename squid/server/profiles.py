@@ -0,0 +1,95 @@
+from dataclasses import dataclass, asdict
+
+
+@dataclass(frozen=True)
+class ServerProfile:
+    """
+    Performance settings for the MLflow server, the Postgres backend store and the
+    PgBouncer connection pooler between them.
+
+    Attributes:
+        mlflow_workers (int): Number of gunicorn worker processes serving MLflow.
+        mlflow_threads (int): Number of threads per gunicorn worker.
+        mlflow_timeout (int): Seconds before gunicorn kills a worker stuck on a request.
+        postgres_shared_buffers (str): Postgres shared_buffers, e.g. '128MB'.
+        postgres_work_mem (str): Postgres work_mem per sort or hash operation, e.g. '4MB'.
+        postgres_max_connections (int): Postgres max_connections.
+        pooler_pool_mode (str): PgBouncer pool mode, 'transaction' or 'session'.
+        pooler_pool_size (int): Server connections PgBouncer keeps open to Postgres.
+        pooler_max_client_connections (int): Client connections PgBouncer accepts from MLflow.
+    """
+    mlflow_workers: int = 2
+    mlflow_threads: int = 2
+    mlflow_timeout: int = 120
+    postgres_shared_buffers: str = "128MB"
+    postgres_work_mem: str = "4MB"
+    postgres_max_connections: int = 50
+    pooler_pool_mode: str = "transaction"
+    pooler_pool_size: int = 10
+    pooler_max_client_connections: int = 100
+
+    def __post_init__(self):
+        if self.pooler_pool_mode not in ("transaction", "session"):
+            raise ValueError(f"pooler_pool_mode must be 'transaction' or 'session'. Provided '{self.pooler_pool_mode}'")
+        if self.pooler_pool_size >= self.postgres_max_connections:
+            raise ValueError(
+                f"pooler_pool_size ({self.pooler_pool_size}) must be smaller than postgres_max_connections "
+                f"({self.postgres_max_connections}) to leave room for maintenance connections."
+            )
+
+    def to_env(self):
+        """
+        Environment variables read by the bundled docker-compose file.
+
+        Returns:
+            dict: Variable names mapped to string values.
+        """
+        return {f"SQUID_ML_{name.upper()}": str(value) for name, value in asdict(self).items()}
+
+
+PROFILES = {
+    # A single user on a laptop: few processes, small memory footprint.
+    "laptop": ServerProfile(),
+    # Dozens of concurrent training jobs logging to a shared server.
+    "team": ServerProfile(
+        mlflow_workers=8,
+        mlflow_threads=4,
+        mlflow_timeout=300,
+        postgres_shared_buffers="1GB",
+        postgres_work_mem="16MB",
+        postgres_max_connections=200,
+        pooler_pool_size=40,
+        pooler_max_client_connections=1000
+    ),
+    # Many projects on one host with Server(shared=True). The Postgres settings apply to
+    # the shared instance, and each project runs a single MLflow worker.
+    "shared": ServerProfile(
+        mlflow_workers=1,
+        mlflow_threads=4,
+        postgres_shared_buffers="512MB",
+        postgres_work_mem="8MB",
+        postgres_max_connections=200,
+        pooler_pool_size=40,
+        pooler_max_client_connections=1000
+    )
+}
+
+
+def get_profile(profile):
+    """
+    Resolve a profile name or instance to a ServerProfile.
+
+    Args:
+        profile (str or ServerProfile): A preset name from PROFILES, or a custom profile.
+
+    Returns:
+        ServerProfile: The resolved profile.
+
+    Raises:
+        ValueError: If the preset name is unknown.
+    """
+    if isinstance(profile, ServerProfile):
+        return profile
+    if profile not in PROFILES:
+        raise ValueError(f"profile must be one of {tuple(PROFILES)} or a ServerProfile. Provided '{profile}'")
+    return PROFILES[profile]
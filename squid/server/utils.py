@@ -1,22 +1,284 @@
 import os
-import boto3
+import sys
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 
-def get_tracking_server_ip(instance_id):
+# Seconds for which a resolved tracking server address is reused without asking EC2.
+DISCOVERY_TTL = float(os.environ.get("SQUID_ML_DISCOVERY_TTL", 300))
+
+# Keep-alive connections per host, and retries of failed requests, of the shared HTTP session.
+DEFAULT_POOL_SIZE = int(os.environ.get("SQUID_ML_HTTP_POOL_SIZE", 10))
+DEFAULT_MAX_RETRIES = int(os.environ.get("SQUID_ML_HTTP_MAX_RETRIES", 3))
+
+# instance ID -> (public IP, expiry on the monotonic clock)
+_endpoint_cache = {}
+_endpoint_cache_lock = threading.Lock()
+
+# (pool size, max retries) -> requests.Session, shared by every logger in the process
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+# The discovery that configured the tracking URI of this process, if any.
+_active_discovery = None
+
+
+def get_http_session(pool_size=DEFAULT_POOL_SIZE, max_retries=DEFAULT_MAX_RETRIES):
+    """
+    Return the process-wide keep-alive session for the pool size and retries, so
+    that connections to the tracking server are reused instead of opened per request.
+
+    Parameters:
+        - pool_size (int): Connections kept open per host. Defaults to 10.
+        - max_retries (int): Retries of failed connections, and of 429 and 5xx responses
+        to idempotent requests, with exponential backoff. Defaults to 3.
+    """
+    key = (pool_size, max_retries)
+    with _sessions_lock:
+        session = _sessions.get(key)
+        if session is None:
+            retry = Retry(
+                total=max_retries,
+                backoff_factor=0.5,
+                status_forcelist=(429, 500, 502, 503, 504),
+                raise_on_status=False
+            )
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+            session = requests.Session()
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _sessions[key] = session
+    return session
+
+
+def _lock_fd(fd, blocking=True):
+    """
+    Take an exclusive lock on an open file. The lock is released when the file is closed,
+    or when the process exits. Uses flock on POSIX and msvcrt.locking on Windows.
+
+    Parameters:
+        - fd (int): The file descriptor.
+        - blocking (bool): Wait for the lock if another process holds it. Defaults to True.
+
+    Returns:
+        - bool: True if the lock was taken, False if blocking is False and another
+        process holds it.
+    """
+    if os.name == "nt":
+        import msvcrt
+
+        # Locks the first byte, which may lie past the end of an empty file
+        os.lseek(fd, 0, os.SEEK_SET)
+        while True:
+            try:
+                msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+                return True
+            except OSError:
+                if not blocking:
+                    return False
+                time.sleep(0.05)
+
+    import fcntl
+
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return False
+    return True
+
+
+def _describe_public_ip(instance_id):
+    import boto3
+
     ec2_client = boto3.client(
-        "ec2", 
-        aws_access_key_id=os.environ["AWS_ACCESS_KEY_ID"], 
+        "ec2",
+        aws_access_key_id=os.environ["AWS_ACCESS_KEY_ID"],
         aws_secret_access_key=os.environ["AWS_SECRET_ACCESS_KEY"],
         region_name=os.environ["AWS_DEFAULT_REGION"]
     )
-    
+
     response = ec2_client.describe_instances(InstanceIds=[instance_id])
 
     reservation = response["Reservations"][0]
     instance = reservation["Instances"][0]
-    public_ip = instance.get("PublicIpAddress", None)
+    return instance.get("PublicIpAddress", None)
+
+
+def get_tracking_server_ip(instance_id, use_cache=True, ttl=None):
+    """
+    Return the public IP of the EC2 instance running the tracking server. Resolved
+    addresses are cached for DISCOVERY_TTL seconds.
+
+    Parameters:
+        - instance_id (str): The EC2 instance ID.
+        - use_cache (bool): If False, always ask EC2. Defaults to True.
+        - ttl (float, optional): Seconds to cache the address for. Defaults to DISCOVERY_TTL.
+
+    Raises:
+        - ValueError: If the instance has no public IP, e.g. because it is stopped.
+    """
+    if use_cache:
+        with _endpoint_cache_lock:
+            cached = _endpoint_cache.get(instance_id)
+        if cached and cached[1] > time.monotonic():
+            return cached[0]
+
+    public_ip = _describe_public_ip(instance_id)
 
     if not public_ip:
+        with _endpoint_cache_lock:
+            _endpoint_cache.pop(instance_id, None)
         raise ValueError("Tracking server seems to be down!")
 
+    with _endpoint_cache_lock:
+        _endpoint_cache[instance_id] = (public_ip, time.monotonic() + (DISCOVERY_TTL if ttl is None else ttl))
     return public_ip
+
+
+class TrackingServerDiscovery:
+    """
+    Finds a tracking server running on an EC2 instance and points MLflow at it.
+
+    The address is cached for ttl seconds. Requests sent through request() and
+    available() resolve it again when the server cannot be reached, e.g. after the
+    instance was restarted with a new public IP. MLflow's own requests do not, so
+    call refresh() when they fail to connect. Requests go through a keep-alive
+    session shared by every logger in the process.
+    """
+    def __init__(
+            self,
+            instance_id,
+            port=5000,
+            scheme="http",
+            ttl=DISCOVERY_TTL,
+            pool_size=DEFAULT_POOL_SIZE,
+            max_retries=DEFAULT_MAX_RETRIES,
+            timeout=2.0
+        ):
+        """
+        Parameters:
+            - instance_id (str): The EC2 instance running the tracking server. The AWS
+            credentials and region are read from AWS_ACCESS_KEY_ID, AWS_SECRET_ACCESS_KEY
+            and AWS_DEFAULT_REGION.
+            - port (int): Port of the MLflow UI. Defaults to 5000.
+            - scheme (str): "http" or "https". Defaults to "http".
+            - ttl (float): Seconds to reuse a resolved address. Defaults to 300, or
+            SQUID_ML_DISCOVERY_TTL.
+            - pool_size (int): Keep-alive connections to the server. Defaults to 10.
+            - max_retries (int): Retries of failed requests. Defaults to 3.
+            - timeout (float): Seconds to wait for the health check. Defaults to 2.
+        """
+        self.instance_id = instance_id
+        self.port = port
+        self.scheme = scheme
+        self.ttl = ttl
+        self.pool_size = pool_size
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.tracking_uri = None
+        self._lock = threading.Lock()
+
+    @property
+    def session(self):
+        return get_http_session(self.pool_size, self.max_retries)
+
+    def resolve(self, force=False):
+        """
+        Return the tracking URI of the server, from the cache unless force is True.
+        """
+        ip = get_tracking_server_ip(self.instance_id, use_cache=not force, ttl=self.ttl)
+        return f"{self.scheme}://{ip}:{self.port}"
+
+    def configure(self):
+        """
+        Resolve the server and point MLflow at it. MLflow's own requests are made with
+        the same retries and pool size.
+
+        MLflow reads its pool size only when it creates its cached session, so any
+        session it made before is dropped and the next MLflow request opens a new one.
+        MLflow's own requests are not resolved again when the server moves, only the
+        ones sent through request(); call refresh() to repoint MLflow.
+
+        Returns:
+            - str: The tracking URI.
+        """
+        global _active_discovery
+
+        tracking_uri = self.resolve()
+        with self._lock:
+            self.tracking_uri = tracking_uri
+        _configure_mlflow_http(self.pool_size, self.max_retries)
+        _set_tracking_uri(tracking_uri)
+        _active_discovery = self
+        return tracking_uri
+
+    def refresh(self):
+        """
+        Resolve the server again, bypassing the cache, and reconfigure MLflow if its
+        address changed.
+
+        Returns:
+            - bool: True if the address changed.
+        """
+        try:
+            tracking_uri = self.resolve(force=True)
+        except ValueError:
+            return False
+
+        with self._lock:
+            changed = tracking_uri != self.tracking_uri
+            self.tracking_uri = tracking_uri
+        if changed:
+            _set_tracking_uri(tracking_uri)
+        return changed
+
+    def request(self, method, path, **kwargs):
+        """
+        Send a request to the server through the shared session. If the server cannot
+        be reached, its address is resolved again and the request retried once.
+        """
+        if self.tracking_uri is None:
+            self.configure()
+
+        kwargs.setdefault("timeout", self.timeout)
+        try:
+            return self.session.request(method, self.tracking_uri + path, **kwargs)
+        except requests.ConnectionError:
+            if not self.refresh():
+                raise
+            return self.session.request(method, self.tracking_uri + path, **kwargs)
+
+    def available(self):
+        """Check whether the server answers its health endpoint."""
+        try:
+            return self.request("GET", "/health").ok
+        except (requests.RequestException, ValueError):
+            return False
+
+
+def _set_tracking_uri(tracking_uri):
+    """
+    Point MLflow at the tracking URI. The environment variable is read when mlflow is
+    imported, so mlflow is only configured directly if it was already imported.
+    """
+    os.environ["MLFLOW_TRACKING_URI"] = tracking_uri
+    if "mlflow" in sys.modules:
+        sys.modules["mlflow"].set_tracking_uri(tracking_uri)
+
+
+def _configure_mlflow_http(pool_size, max_retries):
+    """
+    Size MLflow's HTTP session. MLflow reads the pool size once, when it creates its
+    cached session, so sessions it already created are dropped to apply the new size.
+    """
+    os.environ["MLFLOW_HTTP_REQUEST_MAX_RETRIES"] = str(max_retries)
+    os.environ["MLFLOW_HTTP_POOL_CONNECTIONS"] = str(pool_size)
+    os.environ["MLFLOW_HTTP_POOL_MAXSIZE"] = str(pool_size)
+
+    request_utils = sys.modules.get("mlflow.utils.request_utils")
+    get_session = getattr(request_utils, "_get_request_session", None)
+    if hasattr(get_session, "cache_clear"):
+        get_session.cache_clear()
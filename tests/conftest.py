@@ -0,0 +1,13 @@
+import pytest
+import mlflow
+from squid.ml_logging import utils
+
+
+@pytest.fixture
+def local_tracking_uri(tmp_path):
+    """Point MLflow at a local file store for the duration of the test."""
+    previous_uri = mlflow.get_tracking_uri()
+    mlflow.set_tracking_uri((tmp_path / "mlruns").as_uri())
+    yield
+    utils._invalidate_experiment_id()
+    mlflow.set_tracking_uri(previous_uri)
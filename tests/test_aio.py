@@ -0,0 +1,124 @@
+import asyncio
+import json
+from functools import partial
+import numpy as np
+import pytest
+from mlflow.exceptions import MlflowException
+from squid.ml_logging import aio, utils
+from squid.ml_logging.loggers import MlflowLogger
+
+
+httpx = pytest.importorskip("httpx")
+
+
+def fake_autolog(disable=False, **kwargs):
+    pass
+
+
+class FakeTrackingServer:
+    """Answers the REST endpoints used by AsyncMlflowClient, and records the calls."""
+    def __init__(self):
+        self.experiments = {}
+        self.runs = {}
+        self.batches = []
+        self.artifacts = {}
+
+    def handle(self, request):
+        path = request.url.path
+        body = json.loads(request.content) if request.method == "POST" else None
+
+        if path.endswith("/experiments/get-by-name"):
+            name = request.url.params["experiment_name"]
+            if name not in self.experiments:
+                return httpx.Response(404, json={"error_code": "RESOURCE_DOES_NOT_EXIST", "message": "not found"})
+            return httpx.Response(200, json={"experiment": {
+                "experiment_id": self.experiments[name], "lifecycle_stage": "active"
+            }})
+        if path.endswith("/experiments/create"):
+            self.experiments[body["name"]] = str(len(self.experiments) + 1)
+            return httpx.Response(200, json={"experiment_id": self.experiments[body["name"]]})
+        if path.endswith("/runs/create"):
+            run_id = f"run{len(self.runs)}"
+            self.runs[run_id] = {"status": "RUNNING", "tags": body["tags"]}
+            return httpx.Response(200, json={"run": {"info": {
+                "run_id": run_id,
+                "artifact_uri": f"mlflow-artifacts:/{body['experiment_id']}/{run_id}/artifacts"
+            }}})
+        if path.endswith("/runs/log-batch"):
+            self.batches.append(body)
+            return httpx.Response(200, json={})
+        if path.endswith("/runs/update"):
+            self.runs[body["run_id"]]["status"] = body["status"]
+            return httpx.Response(200, json={})
+        if request.method == "PUT" and "/mlflow-artifacts/artifacts/" in path:
+            self.artifacts[path.split("/mlflow-artifacts/artifacts/", 1)[1]] = request.content
+            return httpx.Response(200, json={})
+        return httpx.Response(404, json={"error_code": "ENDPOINT_NOT_FOUND", "message": path})
+
+
+@pytest.fixture
+def fake_server(monkeypatch):
+    server = FakeTrackingServer()
+    monkeypatch.setattr(
+        aio, "AsyncMlflowClient",
+        partial(aio.AsyncMlflowClient, tracking_uri="http://tracking:5000", transport=httpx.MockTransport(server.handle))
+    )
+    yield server
+    with utils._experiment_id_cache_lock:
+        utils._experiment_id_cache.clear()
+
+
+async def train(*args, **kwargs):
+    await asyncio.sleep(0)
+    return "model", {"accuracy": 0.9, "loss_curve": np.linspace(1, 0, 5), "weights": np.ones((3, 3))}
+
+
+def test_log_async_logs_run_over_rest(fake_server):
+    logger = MlflowLogger(autolog=fake_autolog, timing_log="tags")
+    wrapped = logger.log_async(train)
+
+    async def main():
+        try:
+            return await wrapped(experiment_name="test_async")
+        finally:
+            await logger.aclose()
+
+    model, metrics = asyncio.run(main())
+
+    assert model == "model"
+    assert fake_server.experiments == {"test_async": "1"}
+    assert fake_server.runs[logger._latest_run_id]["status"] == "FINISHED"
+
+    metric_points = [m for batch in fake_server.batches for m in batch["metrics"]]
+    assert [m["value"] for m in metric_points if m["key"] == "accuracy"] == [0.9]
+    assert [m["step"] for m in metric_points if m["key"] == "loss_curve"] == list(range(5))
+
+    assert list(fake_server.artifacts) == ["1/run0/artifacts/weights.npy"]
+    tags = {t["key"] for batch in fake_server.batches for t in batch["tags"]}
+    assert "squid.timing.training" in tags
+
+
+def test_log_async_marks_failed_runs(fake_server):
+    logger = MlflowLogger(autolog=fake_autolog)
+
+    async def failing(*args, **kwargs):
+        raise RuntimeError("boom")
+
+    async def main():
+        try:
+            await logger.log_async(failing)(experiment_name="test_async_failure")
+        finally:
+            await logger.aclose()
+
+    with pytest.raises(RuntimeError, match="boom"):
+        asyncio.run(main())
+    assert fake_server.runs["run0"]["status"] == "FAILED"
+
+
+def test_async_client_raises_server_errors(fake_server):
+    async def main():
+        async with aio.AsyncMlflowClient() as client:
+            await client._call("GET", "/api/2.0/mlflow/unknown")
+
+    with pytest.raises(MlflowException, match="unknown"):
+        asyncio.run(main())
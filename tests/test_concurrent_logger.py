@@ -0,0 +1,112 @@
+import pickle
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from mlflow import MlflowClient
+from squid.ml_logging.loggers import MlflowLogger, _autolog_refcounts
+
+
+autolog_calls = []
+
+
+def fake_autolog(disable=False, **kwargs):
+    """Stand-in for mlflow.<flavor>.autolog that records how it was toggled."""
+    autolog_calls.append("disable" if disable else "enable")
+
+
+@pytest.fixture
+def concurrent_logger():
+    autolog_calls.clear()
+    logger = MlflowLogger(autolog=fake_autolog, concurrent=True)
+    yield logger
+    logger.close()
+
+
+def dummy_train_function(x, *args, **kwargs):
+    return f"model-{x}", {"x": x}
+
+
+def test_concurrent_runs_do_not_clobber(local_tracking_uri, concurrent_logger):
+    logged_func = concurrent_logger.log(dummy_train_function)
+
+    def call(x):
+        logged_func(x, experiment_name="test_concurrent")
+        return x, concurrent_logger._latest_run_id
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(call, range(32)))
+
+    client = MlflowClient()
+    # The first calls for a new name create a single experiment
+    assert len(client.search_experiments(filter_string="name = 'test_concurrent'")) == 1
+    run_ids = [run_id for _, run_id in results]
+    assert len(set(run_ids)) == 32
+    for x, run_id in results:
+        assert client.get_run(run_id).data.metrics["x"] == x
+
+    # Autologging was enabled once, not toggled per call
+    assert autolog_calls == ["enable"]
+    concurrent_logger.close()
+    assert autolog_calls == ["enable", "disable"]
+    assert fake_autolog not in _autolog_refcounts
+
+
+def test_concurrent_logger_is_picklable(concurrent_logger):
+    concurrent_logger._latest_run_id = "abc"
+
+    restored = pickle.loads(pickle.dumps(concurrent_logger))
+
+    assert restored.autolog is fake_autolog
+    assert restored.concurrent
+    assert restored._latest_run_id is None
+
+
+def test_run_sweep(local_tracking_uri, concurrent_logger):
+    from squid import run_sweep
+    from mlflow.utils.mlflow_tags import MLFLOW_PARENT_RUN_ID
+
+    logged_func = concurrent_logger.log(dummy_train_function)
+    results = run_sweep(
+        logged_func, 
+        {"x": [1, 2, 3], "y": ["a", "b"]}, 
+        "test_sweep", 
+        max_workers=3
+    )
+
+    assert len(results) == 6
+    assert sorted(results["x"]) == [1, 1, 2, 2, 3, 3]
+
+    client = MlflowClient()
+    parent_ids = {client.get_run(run_id).data.tags[MLFLOW_PARENT_RUN_ID] for run_id in results["run_id"]}
+    assert len(parent_ids) == 1
+    assert client.get_run(results["run_id"][0]).data.params["y"] in ("a", "b")
+
+
+def test_run_sweep_requires_concurrent_logger_for_threads():
+    from squid import run_sweep
+
+    logged_func = MlflowLogger(autolog=fake_autolog).log(dummy_train_function)
+    with pytest.raises(ValueError, match="requires a logger created with concurrent=True"):
+        run_sweep(logged_func, {"x": [1, 2]}, "test_sweep", max_workers=2)
+
+
+def test_run_sweep_trial_params_win_over_autologged_params(local_tracking_uri, concurrent_logger):
+    from mlflow.exceptions import MlflowException
+    from squid import run_sweep
+    from squid.ml_logging.utils import _last_run_id
+
+    def train_with_autolog(x, alpha, *args, **kwargs):
+        # Like autolog, log the estimator's alpha as a float, and only warn on failure
+        try:
+            MlflowClient().log_param(_last_run_id.get(), "alpha", float(alpha))
+        except MlflowException:
+            pass
+        return "model", {"x": x}
+
+    logged_func = concurrent_logger.log(train_with_autolog)
+    results = run_sweep(logged_func, {"x": [1, 2], "alpha": [1, 2]}, "test_sweep_params", max_workers=2)
+
+    assert len(results) == 4
+    assert "error" not in results
+    client = MlflowClient()
+    for run_id, alpha in zip(results["run_id"], results["alpha"]):
+        assert client.get_run(run_id).data.params["alpha"] == str(alpha)
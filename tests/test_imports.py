@@ -0,0 +1,58 @@
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+
+# Seconds `import squid` may take in a fresh interpreter. Loading mlflow alone 
+# takes well over this, so a regression that imports it eagerly fails the test.
+IMPORT_TIME_BUDGET = 0.5
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+
+
+def _run(code):
+    result = subprocess.run(
+        [sys.executable, "-c", code], 
+        cwd=REPO_ROOT, 
+        capture_output=True, 
+        text=True, 
+        check=True
+    )
+    return json.loads(result.stdout)
+
+
+def test_import_squid_is_lazy():
+    loaded = _run(
+        "import json, sys, time\n"
+        "start = time.perf_counter()\n"
+        "import squid\n"
+        "elapsed = time.perf_counter() - start\n"
+        "heavy = [m for m in ('mlflow', 'pandas', 'python_on_whales') if m in sys.modules]\n"
+        "print(json.dumps({'elapsed': elapsed, 'heavy': heavy}))\n"
+    )
+
+    assert loaded["heavy"] == []
+    assert loaded["elapsed"] < IMPORT_TIME_BUDGET
+
+
+def test_server_creates_docker_client_on_first_use():
+    loaded = _run(
+        "import json, sys\n"
+        "from squid import Server\n"
+        "server = Server(project_name='test-lazy-imports')\n"
+        "before = 'python_on_whales' in sys.modules\n"
+        "server._docker_client\n"
+        "after = 'python_on_whales' in sys.modules\n"
+        "print(json.dumps({'before': before, 'after': after}))\n"
+    )
+
+    assert loaded == {"before": False, "after": True}
+
+
+def test_lazy_attributes_resolve():
+    import squid
+
+    assert squid.Server.__name__ == "Server"
+    assert squid.SklearnLogger.__name__ == "SklearnLogger"
+    assert "TensorflowLogger" in dir(squid)
@@ -180,4 +180,21 @@ def test_mlflow_run_tensorflow_logger():
     model = mlflow.tensorflow.load_model(artifact_uri + "/model")
 
     assert latest_run["info"]["status"] == "FINISHED"
-    assert isinstance(model, tf.keras.Model)  # Ensure model type is correct
\ No newline at end of file
+    assert isinstance(model, tf.keras.Model)  # Ensure model type is correct
+
+
+# Batch logging tests
+def test_sklearn_logger_log_unbatched():
+    """Test logging with SklearnLogger when batch logging is disabled."""
+    model = LinearRegression()
+    x = np.random.rand(10, 10)
+    y = np.random.rand(10, 1)
+
+    unbatched_logger = SklearnLogger(batch_logging=False)
+    logged_func = unbatched_logger.log(dummy_train_function_sklearn)
+    model, metrics = logged_func(model, x, y, experiment_name='test_sklearn_unbatched')
+
+    client = MlflowClient(mlflow.get_tracking_uri())
+    run = client.get_run(unbatched_logger._latest_run_id)
+
+    assert run.data.metrics['accuracy'] == 0.95
@@ -0,0 +1,99 @@
+import pytest
+import numpy as np
+import pandas as pd
+from squid.ml_logging.loggers import MlflowLogger
+from squid.ml_logging.memo import _cache_key
+
+
+def fake_autolog(disable=False, **kwargs):
+    pass
+
+
+def dummy_train_function(x, y, *args, **kwargs):
+    dummy_train_function.calls += 1
+    return "model", {"n_rows": len(x)}
+
+
+dummy_train_function.calls = 0
+
+
+def test_cache_key_depends_on_data():
+    x = np.random.rand(100, 10)
+    df = pd.DataFrame({"a": np.arange(100)})
+    key = _cache_key(dummy_train_function, (x, df), {"experiment_name": "test_memo"})
+
+    assert key == _cache_key(dummy_train_function, (x.copy(), df.copy()), {"experiment_name": "test_memo"})
+
+    x_changed = x.copy()
+    x_changed[0, 0] += 1
+    assert key != _cache_key(dummy_train_function, (x_changed, df), {"experiment_name": "test_memo"})
+    assert key != _cache_key(dummy_train_function, (x, df.iloc[::-1]), {"experiment_name": "test_memo"})
+    assert key == _cache_key(dummy_train_function, (x, df), {"experiment_name": "test_memo", "force_rerun": True})
+
+
+def test_memoized_run_is_reused(local_tracking_uri):
+    logger = MlflowLogger(autolog=fake_autolog, load_model=lambda uri: "model", memoize=True)
+    logged_func = logger.log(dummy_train_function)
+    x, y = np.random.rand(20, 3), np.random.rand(20)
+    dummy_train_function.calls = 0
+
+    logged_func(x, y, experiment_name="test_memo")
+    first_run_id = logger._latest_run_id
+    model, metrics = logged_func(x, y, experiment_name="test_memo")
+
+    assert dummy_train_function.calls == 1
+    assert metrics == {"n_rows": 20}
+    assert logger._latest_run_id == first_run_id
+
+    logged_func(x, y, experiment_name="test_memo", force_rerun=True)
+    assert dummy_train_function.calls == 2
+    assert logger._latest_run_id != first_run_id
+
+
+def test_cache_key_depends_on_initial_weights():
+    torch = pytest.importorskip("torch")
+
+    torch.manual_seed(0)
+    pretrained = torch.nn.Linear(4, 1)
+    torch.manual_seed(1)
+    random_init = torch.nn.Linear(4, 1)
+    kwargs = {"experiment_name": "test_memo"}
+
+    assert repr(pretrained) == repr(random_init)
+    assert _cache_key(dummy_train_function, (pretrained,), kwargs) != _cache_key(dummy_train_function, (random_init,), kwargs)
+
+    random_init.load_state_dict(pretrained.state_dict())
+    assert _cache_key(dummy_train_function, (pretrained,), kwargs) == _cache_key(dummy_train_function, (random_init,), kwargs)
+
+
+def test_cache_key_depends_on_input_files(tmp_path):
+    import os
+
+    data = tmp_path / "train.csv"
+    data.write_text("a\n1\n")
+    kwargs = {"experiment_name": "test_memo"}
+    key = _cache_key(dummy_train_function, (str(data),), kwargs)
+    assert key == _cache_key(dummy_train_function, (str(data),), kwargs)
+
+    data.write_text("a\n2\n")
+    os.utime(data, ns=(0, 10**18))
+    assert key != _cache_key(dummy_train_function, (str(data),), kwargs)
+    assert _cache_key(dummy_train_function, (data,), kwargs) == _cache_key(dummy_train_function, (data,), kwargs)
+
+
+def test_inputs_without_stable_repr_are_not_memoized(local_tracking_uri):
+    class Loader:
+        pass
+
+    with pytest.raises(TypeError, match="cannot be memoized"):
+        _cache_key(dummy_train_function, (Loader(),), {})
+
+    logger = MlflowLogger(autolog=fake_autolog, load_model=lambda uri: "model", memoize=True)
+    logged_func = logger.log(dummy_train_function)
+    x = np.random.rand(20, 3)
+    dummy_train_function.calls = 0
+
+    with pytest.warns(UserWarning, match="Training without memoization"):
+        logged_func(x, Loader(), experiment_name="test_memo")
+        logged_func(x, Loader(), experiment_name="test_memo")
+    assert dummy_train_function.calls == 2
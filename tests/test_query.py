@@ -0,0 +1,85 @@
+import os
+import pytest
+import mlflow
+from mlflow import MlflowClient
+from squid.ml_logging import query
+from squid.ml_logging.query import query_runs
+
+
+def log_runs(client, experiment_id, n, start=0):
+    for i in range(start, start + n):
+        run = client.create_run(experiment_id, start_time=1_000 + i, tags={"trial": str(i)})
+        client.log_batch(
+            run.info.run_id,
+            metrics=[mlflow.entities.Metric("accuracy", i / 100, 0, 0), mlflow.entities.Metric("loss", 1 - i / 100, 0, 0)],
+            params=[mlflow.entities.Param("lr", str(i)), mlflow.entities.Param("seed", "0")]
+        )
+        client.set_terminated(run.info.run_id, end_time=2_000 + i)
+
+
+def test_query_runs_projects_columns(local_tracking_uri, tmp_path):
+    client = MlflowClient()
+    experiment_id = client.create_experiment("test_query")
+    log_runs(client, experiment_id, 25)
+
+    df = query_runs("test_query", metrics=["accuracy"], params=["lr"], tags=["trial"], cache=False, max_workers=4)
+
+    assert list(df.columns) == ["run_id", "run_name", "status", "start_time", "end_time", "metrics.accuracy", "params.lr", "tags.trial"]
+    assert len(df) == 25
+    assert df["params.lr"].tolist() == [str(i) for i in reversed(range(25))]
+
+
+def test_query_runs_refreshes_cache_incrementally(local_tracking_uri, tmp_path, monkeypatch):
+    client = MlflowClient()
+    experiment_id = client.create_experiment("test_query_cache")
+    log_runs(client, experiment_id, 10)
+
+    first = query_runs("test_query_cache", metrics=["accuracy"], params=[], cache_dir=str(tmp_path / "cache"))
+    assert len(first) == 10
+
+    fetched = []
+    search = query._search
+    def counting_search(*args, **kwargs):
+        rows = search(*args, **kwargs)
+        if "max_results" not in kwargs:
+            fetched.extend(rows)
+        return rows
+    monkeypatch.setattr(query, "_search", counting_search)
+
+    log_runs(client, experiment_id, 5, start=10)
+    second = query_runs("test_query_cache", metrics=["accuracy"], params=[], cache_dir=str(tmp_path / "cache"))
+
+    assert len(second) == 15
+    assert second["metrics.accuracy"].iloc[0] == pytest.approx(0.14)
+    # The new runs, and the newest cached run since others may share its start time
+    assert len(fetched) == 6
+
+
+def test_query_runs_refreshes_runs_written_after_they_ended(local_tracking_uri, tmp_path):
+    client = MlflowClient()
+    experiment_id = client.create_experiment("test_query_late_writes")
+    log_runs(client, experiment_id, 3)
+    run_id = client.create_run(experiment_id, start_time=500).info.run_id
+    client.set_terminated(run_id)
+
+    first = query_runs("test_query_late_writes", metrics=[], params=[], tags=["squid.timing.total"], cache_dir=str(tmp_path / "cache"))
+    assert first["tags.squid.timing.total"].isna().all()
+
+    # Loggers report timings once the run has ended
+    client.set_tag(run_id, "squid.timing.total", "1.5")
+    second = query_runs("test_query_late_writes", metrics=[], params=[], tags=["squid.timing.total"], cache_dir=str(tmp_path / "cache"))
+
+    assert len(second) == 4
+    assert second.set_index("run_id").loc[run_id, "tags.squid.timing.total"] == "1.5"
+    assert os.listdir(tmp_path / "cache")[0].endswith(".parquet")
+
+
+def test_query_runs_arrow_output(local_tracking_uri):
+    pytest.importorskip("pyarrow")
+    client = MlflowClient()
+    experiment_id = client.create_experiment("test_query_arrow")
+    log_runs(client, experiment_id, 3)
+
+    table = query_runs("test_query_arrow", metrics=["loss"], params=[], output="arrow", cache=False)
+    assert table.num_rows == 3
+    assert "metrics.loss" in table.column_names
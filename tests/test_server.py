@@ -1,6 +1,9 @@
 import pytest
 import os 
+import sys
+import requests
 from squid import Server
+from squid.server.profiles import ServerProfile
 
 @pytest.fixture
 def server():
@@ -18,10 +21,26 @@ def test_init_set_env_variables(server):
     assert os.getenv("SQUID_ML_ARTIFACT_STORE_PORT") == "5002"
     assert os.getenv("SQUID_ML_CONSOLE_PORT") == "5003"
 
+def test_init_set_profile_env_variables():
+    Server("test_project", profile="team")
+    assert os.getenv("SQUID_ML_MLFLOW_WORKERS") == "8"
+    assert os.getenv("SQUID_ML_POSTGRES_SHARED_BUFFERS") == "1GB"
+
+    Server("test_project", profile=ServerProfile(mlflow_workers=3))
+    assert os.getenv("SQUID_ML_MLFLOW_WORKERS") == "3"
+
+def test_init_invalid_profile():
+    with pytest.raises(ValueError, match="profile must be one of"):
+        Server("test_project", profile="cluster")
+
+    with pytest.raises(ValueError, match="pooler_pool_size"):
+        ServerProfile(pooler_pool_size=60, postgres_max_connections=50)
+
 def test_set_versions_valid(server):
     server._set_versions(python_="3.10", mlflow_="2.18.0")
     assert os.getenv("SQUID_ML_PYTHON_VERSION") == "3.10"
     assert os.getenv("SQUID_ML_MLFLOW_VERSION") == "2.18.0"
+    assert os.getenv("SQUID_ML_IMAGE_TAG") == "py3.10-mlflow2.18.0"
 
 def test_set_version_invalid_python(server):
     python_versions = ["3.10.0", "3.abc"]
@@ -60,8 +79,19 @@ def test_server_build_using_versions(server):
 
     client = server._create_docker_client()
 
-    client.image.exists("mlflow_server:latest")
+    assert client.image.exists("mlflow_server:py3.10-mlflow2.18.0")
+
+    server.down()
+
+
+def test_server_reuses_tagged_image(server):
+    server.start(python_version="3.10", mlflow_version="2.18.0")
+    client = server._create_docker_client()
+    image_id = client.image.inspect("mlflow_server:py3.10-mlflow2.18.0").id
+    server.down()
 
+    server.start(python_version="3.10", mlflow_version="2.18.0")
+    assert client.image.inspect("mlflow_server:py3.10-mlflow2.18.0").id == image_id
     server.down()
 
 
@@ -70,7 +100,7 @@ def test_server_build_using_current_env(server):
 
     client = server._create_docker_client() 
 
-    client.image.exists("mlflow_server:latest") 
+    assert client.image.exists(f"mlflow_server:{server._image_tag()}") 
 
     server.down() 
     
@@ -81,3 +111,338 @@ def test_start_invalid_versions(server):
 
     with pytest.raises(ValueError, match="Both python_version and mlflow_version must be provided for building the image. Only mlflow_version was provided."):
         server.start(python_version="", mlflow_version="2.18.0")
+
+
+def fake_docker(images, calls):
+    """A Docker client whose compose calls are recorded, for a project whose containers all exist."""
+    from types import SimpleNamespace
+
+    mlflow_container = SimpleNamespace(name="test_project-mlops-ui", config=SimpleNamespace(image="mlflow_server:latest"))
+    services = ("backend-store", "pooler", "artifact-store", "artifact-store-setup")
+    containers = [mlflow_container] + [SimpleNamespace(name=f"test_project-mlops-{s}") for s in services]
+    return SimpleNamespace(
+        image=SimpleNamespace(
+            list=lambda name: [SimpleNamespace(repo_tags=sorted(images), created=0)],
+            exists=images.__contains__
+        ),
+        compose=SimpleNamespace(
+            build=lambda **kwargs: calls.append("build"),
+            start=lambda: calls.append("start"),
+            up=lambda **kwargs: calls.append("up"),
+            ps=lambda all=False: containers
+        )
+    )
+
+
+def test_start_falls_back_to_untagged_image(server, monkeypatch):
+    calls = []
+    images = {"mlflow_server:latest"}
+    server._docker = fake_docker(images, calls)
+    monkeypatch.setattr(server, "_wait_until_ready", lambda started_at, timeout: {})
+
+    server.start(replay_spooled_runs=False)
+    assert calls == ["start"]
+    assert os.getenv("SQUID_ML_IMAGE_TAG") == "latest"
+
+    images.clear()
+    with pytest.raises(ValueError, match="Docker image mlflow_server not found"):
+        server.start(replay_spooled_runs=False)
+
+
+def test_start_survives_failed_replay(server, monkeypatch):
+    server._docker = fake_docker({"mlflow_server:latest"}, [])
+    monkeypatch.setattr(server, "_wait_until_ready", lambda started_at, timeout: {})
+
+    def replay(spool_dir=None):
+        raise requests.ConnectionError("tracking server went away")
+    monkeypatch.setattr(server, "_replay_spool", replay)
+
+    with pytest.warns(UserWarning, match="Replaying spooled runs failed"):
+        server.start()
+
+
+def test_start_waits_until_ready(server):
+    timings = server.start()
+
+    for service in ["backend-store", "artifact-store", "mlflow", "compose", "total"]:
+        assert service in timings
+    assert timings["mlflow"] <= timings["total"]
+    assert requests.get("http://localhost:5001/health").ok
+
+    # A warm start reuses the stopped containers
+    server.stop()
+    warm_timings = server.start()
+    assert requests.get("http://localhost:5001/health").ok
+    assert warm_timings["total"] > 0
+
+    server.down()
+
+
+@pytest.fixture
+def ec2_instance(monkeypatch):
+    moto = pytest.importorskip("moto")
+    import boto3
+    from squid.server import utils
+
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    monkeypatch.setattr(utils, "_endpoint_cache", {})
+
+    with moto.mock_aws():
+        ec2 = boto3.client("ec2", region_name="us-east-1")
+        image_id = ec2.describe_images()["Images"][0]["ImageId"]
+        instance = ec2.run_instances(ImageId=image_id, MinCount=1, MaxCount=1)["Instances"][0]
+        yield ec2, instance["InstanceId"]
+
+
+def test_tracking_server_discovery_caches_address(ec2_instance, monkeypatch):
+    from squid.server import utils
+    ec2, instance_id = ec2_instance
+
+    calls = []
+    describe = utils._describe_public_ip
+    monkeypatch.setattr(utils, "_describe_public_ip", lambda i: calls.append(i) or describe(i))
+
+    ip = utils.get_tracking_server_ip(instance_id)
+    assert utils.get_tracking_server_ip(instance_id) == ip
+    assert len(calls) == 1
+
+    utils.get_tracking_server_ip(instance_id, use_cache=False)
+    assert len(calls) == 2
+
+    ec2.stop_instances(InstanceIds=[instance_id])
+    with pytest.raises(ValueError, match="down"):
+        utils.get_tracking_server_ip(instance_id, use_cache=False)
+
+
+def test_tracking_server_discovery_resolves_again_on_connection_failure(ec2_instance, monkeypatch):
+    from squid.server import utils
+    _, instance_id = ec2_instance
+
+    addresses = iter(["10.0.0.1", "127.0.0.1"])
+    monkeypatch.setattr(utils, "_describe_public_ip", lambda i: next(addresses))
+    monkeypatch.setattr(utils, "_active_discovery", None)
+    for name in ("MLFLOW_TRACKING_URI", "MLFLOW_HTTP_REQUEST_MAX_RETRIES", "MLFLOW_HTTP_POOL_CONNECTIONS", "MLFLOW_HTTP_POOL_MAXSIZE"):
+        monkeypatch.delenv(name, raising=False)
+    # Keep the test from repointing mlflow for the tests that follow
+    monkeypatch.setattr(utils, "_set_tracking_uri", lambda uri: os.environ.__setitem__("MLFLOW_TRACKING_URI", uri))
+
+    discovery = utils.TrackingServerDiscovery(instance_id, port=5001, timeout=0.2, max_retries=0)
+    assert discovery.configure() == "http://10.0.0.1:5001"
+
+    def fake_request(method, url, **kwargs):
+        if "10.0.0.1" in url:
+            raise requests.ConnectionError(url)
+        response = requests.Response()
+        response.status_code = 200
+        return response
+    monkeypatch.setattr(discovery.session, "request", fake_request)
+
+    assert discovery.available()
+    assert discovery.tracking_uri == "http://127.0.0.1:5001"
+    assert os.environ["MLFLOW_TRACKING_URI"] == "http://127.0.0.1:5001"
+    assert utils.get_http_session(discovery.pool_size, 0) is discovery.session
+
+
+def test_tracking_server_discovery_sizes_mlflow_session_created_before(ec2_instance, monkeypatch):
+    import functools
+    import types
+    from squid.server import utils
+    _, instance_id = ec2_instance
+
+    monkeypatch.setattr(utils, "_describe_public_ip", lambda i: "10.0.0.1")
+    monkeypatch.setattr(utils, "_active_discovery", None)
+    monkeypatch.setattr(utils, "_set_tracking_uri", lambda uri: None)
+    for name in ("MLFLOW_HTTP_REQUEST_MAX_RETRIES", "MLFLOW_HTTP_POOL_CONNECTIONS", "MLFLOW_HTTP_POOL_MAXSIZE"):
+        monkeypatch.delenv(name, raising=False)
+
+    # Stands in for MLflow's cached session factory, which reads the pool size once
+    @functools.lru_cache(maxsize=64)
+    def _get_request_session(max_retries):
+        return os.environ.get("MLFLOW_HTTP_POOL_MAXSIZE")
+    request_utils = types.ModuleType("mlflow.utils.request_utils")
+    request_utils._get_request_session = _get_request_session
+    monkeypatch.setitem(sys.modules, "mlflow.utils.request_utils", request_utils)
+
+    assert _get_request_session(3) is None
+    utils.TrackingServerDiscovery(instance_id, pool_size=32).configure()
+    assert _get_request_session(3) == "32"
+
+
+def test_retention_policy_selects_expired_runs():
+    from types import SimpleNamespace
+    from squid.server.maintenance import RetentionPolicy, KEEP_TAG
+
+    day_ms = 24 * 60 * 60 * 1000
+    now_ms = 100 * day_ms
+    def run(run_id, age_days, tags=None):
+        return SimpleNamespace(
+            info=SimpleNamespace(run_id=run_id, start_time=now_ms - age_days * day_ms),
+            data=SimpleNamespace(tags=tags or {})
+        )
+    runs = [run("a", 1), run("b", 2, {KEEP_TAG: "true"}), run("c", 3), run("d", 40), run("e", 50)]
+
+    assert RetentionPolicy(max_runs=2).expired(runs, now_ms) == ["d", "e"]
+    assert RetentionPolicy(max_age_days=30).expired(runs, now_ms) == ["d", "e"]
+    assert RetentionPolicy(max_runs=1, max_age_days=30).expired(runs, now_ms) == ["c", "d", "e"]
+
+    with pytest.raises(ValueError, match="max_age_days, max_runs or both"):
+        RetentionPolicy()
+
+
+def test_apply_retention_deletes_page_by_page(monkeypatch):
+    import mlflow
+    from types import SimpleNamespace
+    from squid.server import maintenance
+    from squid.server.maintenance import RetentionPolicy, KEEP_TAG
+    from squid.ml_logging.persistence import MODEL_REF_TAG
+
+    class Page(list):
+        token = None
+
+    class FakeClient:
+        def __init__(self, tracking_uri=None):
+            # Latest first, with every third run protected by the keep tag
+            self.runs = [
+                SimpleNamespace(
+                    info=SimpleNamespace(run_id=f"run{i}", start_time=1000 - i),
+                    data=SimpleNamespace(tags={KEEP_TAG: "true"} if i % 3 == 0 else {})
+                )
+                for i in range(20)
+            ]
+            self.page_sizes = []
+
+        def search_experiments(self, view_type=None):
+            return [SimpleNamespace(name="sweeps", experiment_id="1")]
+
+        def search_runs(self, experiment_ids, run_view_type, max_results, page_token, order_by=None, filter_string=""):
+            if filter_string:
+                # Runs that reference a model file
+                return Page(r for r in self.runs if MODEL_REF_TAG in r.data.tags)
+            self.page_sizes.append(max_results)
+            offset = int(page_token or 0)
+            page = Page(self.runs[offset:offset + max_results])
+            if offset + max_results < len(self.runs):
+                page.token = str(offset + max_results)
+            return page
+
+        def delete_run(self, run_id):
+            self.runs = [r for r in self.runs if r.info.run_id != run_id]
+
+    client = FakeClient()
+    # run1 reuses the model file logged by run17, which is kept although it expired
+    client.runs[1].data.tags[MODEL_REF_TAG] = "run17"
+    client.runs[17].data.tags[MODEL_REF_TAG] = "run17"
+    monkeypatch.setattr(mlflow, "MlflowClient", lambda tracking_uri: client)
+
+    assert maintenance.apply_retention({"*": RetentionPolicy(max_runs=4)}, batch_size=3) == {"sweeps": 8}
+    assert [r.info.run_id for r in client.runs] == [f"run{i}" for i in (0, 1, 2, 3, 4, 5, 6, 9, 12, 15, 17, 18)]
+    assert set(client.page_sizes) == {3}
+
+
+def test_downsample_metrics_runs_batches_until_done(server, monkeypatch):
+    results = iter([[["50", "12000"]], [["7", "900"]], [["0", "0"]]])
+    statements = []
+    monkeypatch.setattr(server, "_psql", lambda sql: statements.append(sql) or next(results))
+
+    assert server.downsample_metrics(keep_every=10) == {"runs": 57, "points": 12900}
+    assert len(statements) == 3
+    assert "m.step % 10 <> 0" in statements[0]
+
+    with pytest.raises(ValueError, match="keep_every"):
+        server.downsample_metrics(keep_every=1)
+
+
+def test_purge_deleted_runs_does_not_retry_runs_gc_leaves(server, monkeypatch):
+    import re
+    from types import SimpleNamespace
+
+    deleted = {f"run{i}": 1000 + i for i in range(5)}
+    def psql(sql):
+        if sql.startswith("SELECT run_uuid FROM runs WHERE run_uuid IN"):
+            return [[r] for r in re.findall(r"'([^']+)'", sql) if r in deleted]
+        after = re.search(r"> \((\d+), '([^']+)'\)", sql)
+        rows = sorted((t, r) for r, t in deleted.items())
+        if after:
+            rows = [row for row in rows if row > (int(after.group(1)), after.group(2))]
+        return [[str(t), r] for t, r in rows[:2]]
+    monkeypatch.setattr(server, "_psql", psql)
+
+    gc_calls = []
+    def execute(container, command, envs=None):
+        run_ids = command[-1].split(",")
+        gc_calls.append(run_ids)
+        # mlflow gc exits cleanly but leaves run1 behind
+        for run_id in run_ids:
+            if run_id != "run1":
+                deleted.pop(run_id)
+    monkeypatch.setattr(type(server), "_docker_client", SimpleNamespace(container=SimpleNamespace(execute=execute)))
+
+    with pytest.warns(UserWarning, match="left 1 deleted runs in the backend store: run1"):
+        assert server.purge_deleted_runs(batch_size=2) == 4
+    assert gc_calls == [["run0", "run1"], ["run2", "run3"], ["run4"]]
+
+
+def test_shared_servers_get_own_database_prefix_and_ports(tmp_path, monkeypatch):
+    from squid.server import operations
+
+    monkeypatch.setattr(operations, "SHARED_PORTS_FILE", str(tmp_path / "ports.json"))
+    for name in ("SQUID_ML_DATABASE", "SQUID_ML_ARTIFACT_PREFIX", "SQUID_ML_ARTIFACT_STORE_PREFIX"):
+        monkeypatch.setenv(name, "")
+
+    first = Server("churn_model", shared=True)
+    second = Server("fraud-v2", shared=True)
+    assert os.getenv("SQUID_ML_DATABASE") == second._database
+    assert os.getenv("SQUID_ML_ARTIFACT_STORE_PREFIX") == second._artifact_prefix
+    assert first._database.startswith("mlflow_churn_model_")
+    assert first._artifact_prefix.startswith("churn-model-")
+    assert first.profile.mlflow_workers == 1
+
+    # Names that clean up to the same string still get their own database and prefix
+    clash = Server("churn-model", shared=True)
+    assert clash._database != first._database
+    assert clash._artifact_prefix != first._artifact_prefix
+
+    # Projects get their own UI port, share the artifact store's, and keep them across restarts
+    assert first.ui_port != second.ui_port
+    assert first.artifact_store_port == second.artifact_store_port
+    assert Server("churn_model", shared=True).ui_port == first.ui_port
+    assert first._container_name("backend-store") == "squid-shared-mlops-backend-store"
+    assert first._container_name("mlflow") == "churn_model-mlops-ui"
+
+
+def test_shared_port_allocation_is_locked_and_released(tmp_path):
+    from concurrent.futures import ProcessPoolExecutor
+    from squid.server.operations import _allocate_port, _release_port
+
+    ports_file = str(tmp_path / "ports.json")
+    keys = [f"project{i}:mlflow" for i in range(8)]
+    with ProcessPoolExecutor(max_workers=4) as executor:
+        ports = list(executor.map(_allocate_port, keys, [ports_file] * len(keys)))
+
+    assert len(set(ports)) == len(keys)
+    assert [_allocate_port(key, ports_file) for key in keys] == ports
+
+    _release_port(keys[0], ports_file)
+    assert _allocate_port("other:mlflow", ports_file) not in ports[1:]
+
+
+def test_sweep_artifact_blobs_deletes_unreferenced_blobs(server, monkeypatch):
+    import json
+
+    kept, orphan = "ab" + "1" * 62, "cd" + "2" * 62
+    reference = json.dumps({"uri": f"mlflow-artifacts:/squid-cas/ab/{kept}", "sha256": kept, "size": 10})
+    monkeypatch.setattr(server, "_psql", lambda sql: [[reference]])
+
+    calls = []
+    def mc(script, *args):
+        calls.append((script, args))
+        if script.startswith("mc find"):
+            return f"local/mlflow-artifacts/squid-cas/ab/{kept}\nlocal/mlflow-artifacts/squid-cas/cd/{orphan}\n"
+        return ""
+    monkeypatch.setattr(server, "_mc", mc)
+
+    assert server.sweep_artifact_blobs(min_age_hours=48) == 1
+    assert "--older-than 48h" in calls[0][0]
+    assert calls[1][1] == (f"local/mlflow-artifacts/squid-cas/cd/{orphan}",)
@@ -0,0 +1,74 @@
+import os
+from mlflow import MlflowClient
+from squid.ml_logging.spool import RunSpool, replay_spool
+
+
+def record_run(spool_dir, experiment_name):
+    spool = RunSpool(str(spool_dir), experiment_name)
+    spool.set_tags({"estimator_name": "LinearRegression"})
+    spool.log_params({"fit_intercept": True})
+    spool.log_metrics({"accuracy": 0.95})
+    spool.end()
+    return spool
+
+
+def test_replay_spool(local_tracking_uri, tmp_path):
+    spool_dir = tmp_path / "spool"
+    spool = record_run(spool_dir, "test_spool")
+
+    run_ids = replay_spool(str(spool_dir))
+
+    assert len(run_ids) == 1
+    run = MlflowClient().get_run(run_ids[0])
+    assert run.info.status == "FINISHED"
+    assert run.data.metrics["accuracy"] == 0.95
+    assert run.data.params["fit_intercept"] == "True"
+    assert run.data.tags["squid.spool_id"] == spool.spool_id
+
+    # The spool is drained, so replaying again does nothing
+    assert not os.path.exists(spool.path)
+    assert replay_spool(str(spool_dir)) == []
+
+
+def test_replay_spool_skips_unfinished_runs(local_tracking_uri, tmp_path):
+    spool_dir = tmp_path / "spool"
+    spool = RunSpool(str(spool_dir), "test_spool")
+    spool.log_metrics({"accuracy": 0.95})
+
+    assert replay_spool(str(spool_dir)) == []
+    assert os.path.exists(spool.path)
+
+
+def test_replay_spool_ignores_lock_of_killed_replay(local_tracking_uri, tmp_path):
+    from squid.server.utils import _lock_fd
+
+    spool_dir = tmp_path / "spool"
+    spool = record_run(spool_dir, "test_spool")
+    lock_path = spool.path[:-len(".jsonl")] + ".lock"
+
+    # Another process is replaying the run
+    with open(lock_path, "w") as lock:
+        _lock_fd(lock.fileno())
+        assert replay_spool(str(spool_dir)) == []
+
+    # The lock file of a replay that was killed is left behind, but not locked
+    open(lock_path, "w").close()
+    assert len(replay_spool(str(spool_dir))) == 1
+    assert not os.path.exists(lock_path)
+
+
+def test_interrupted_replay_does_not_log_metrics_twice(local_tracking_uri, tmp_path, monkeypatch):
+    import pytest
+
+    spool_dir = tmp_path / "spool"
+    record_run(spool_dir, "test_spool")
+
+    def set_terminated(self, run_id, status=None, end_time=None):
+        raise ConnectionError("tracking server went away")
+    with monkeypatch.context() as m:
+        m.setattr(MlflowClient, "set_terminated", set_terminated)
+        with pytest.raises(ConnectionError):
+            replay_spool(str(spool_dir))
+
+    run_id, = replay_spool(str(spool_dir))
+    assert len(MlflowClient().get_metric_history(run_id, "accuracy")) == 1
@@ -0,0 +1,96 @@
+import pytest
+from mlflow import MlflowClient
+from squid.ml_logging.loggers import MlflowLogger
+from squid.ml_logging.stream import metric_stream, MetricStream
+
+
+def fake_autolog(disable=False, **kwargs):
+    pass
+
+
+def training_loop(n_steps, *args, **kwargs):
+    stream = metric_stream()
+    for step in range(n_steps):
+        stream.log(step, loss=1 / (step + 1), accuracy=step / n_steps)
+    return "model", {"final_loss": 1 / n_steps}
+
+
+def test_metric_stream_logs_step_history(local_tracking_uri):
+    logger = MlflowLogger(autolog=fake_autolog)
+    logger.log(training_loop)(2500, experiment_name="test_stream")
+
+    client = MlflowClient()
+    history = client.get_metric_history(logger._latest_run_id, "loss")
+    assert [m.step for m in history] == list(range(2500))
+    assert history[9].value == pytest.approx(0.1)
+
+
+def test_metric_stream_downsamples(local_tracking_uri):
+    logger = MlflowLogger(autolog=fake_autolog, stream_downsample={"loss": 10})
+    logger.log(training_loop)(25, experiment_name="test_stream_downsample")
+
+    client = MlflowClient()
+    loss = client.get_metric_history(logger._latest_run_id, "loss")
+    # Two full windows and the incomplete last one
+    assert [m.step for m in loss] == [9, 19, 24]
+    assert loss[0].value == pytest.approx(sum(1 / (s + 1) for s in range(10)) / 10)
+    assert len(client.get_metric_history(logger._latest_run_id, "accuracy")) == 25
+
+
+def test_metric_stream_flushes_in_batches(monkeypatch):
+    uploads = []
+    monkeypatch.setattr("squid.ml_logging.stream._upload", lambda run_id, points: uploads.append(len(points)))
+
+    stream = MetricStream(run_id="abc", flush_interval=3600, flush_every=100)
+    for step in range(250):
+        stream.log(step, loss=0.5)
+    stream.close()
+
+    assert uploads == [100, 100, 50]
+
+
+def test_metric_stream_outside_run():
+    with pytest.raises(RuntimeError, match="can only be called from inside"):
+        metric_stream()
+
+
+def test_metric_stream_never_blocks_event_loop(monkeypatch):
+    import asyncio
+    import threading
+
+    release = threading.Event()
+    monkeypatch.setattr("squid.ml_logging.stream._upload", lambda run_id, points: release.wait(5))
+
+    async def main():
+        stream = MetricStream(run_id="abc", flush_interval=3600, flush_every=1)
+        # More uploads than MAX_PENDING_UPLOADS, all stuck on the server
+        for step in range(5):
+            stream.log(step, loss=0.5)
+        await asyncio.sleep(0)
+        logged = len(stream._pending)
+
+        waiting = asyncio.ensure_future(stream.alog(5, loss=0.5))
+        await asyncio.sleep(0.05)
+        assert not waiting.done()
+        release.set()
+        await waiting
+        stream.close()
+        return logged
+
+    assert asyncio.run(main()) == 5
+
+
+def test_stream_upload_error_does_not_replace_pipeline_error(monkeypatch):
+    from squid.ml_logging.stream import _with_stream
+
+    def upload(run_id, points):
+        raise ConnectionError("tracking server unreachable")
+    monkeypatch.setattr("squid.ml_logging.stream._upload", upload)
+
+    def failing_loop():
+        metric_stream().log(0, loss=0.5)
+        raise ValueError("diverged")
+
+    with pytest.warns(UserWarning, match="Uploading streamed metrics failed"):
+        with pytest.raises(ValueError, match="diverged"):
+            _with_stream(failing_loop)()
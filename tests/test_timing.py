@@ -0,0 +1,71 @@
+import time
+from mlflow import MlflowClient
+from squid.ml_logging.loggers import MlflowLogger
+from squid.ml_logging.timing import RunTimings, TIMING_TAG_PREFIX
+from squid.ml_logging.utils import _get_experiment_id
+
+
+def fake_autolog(disable=False, **kwargs):
+    pass
+
+
+def slow_train_function(*args, **kwargs):
+    time.sleep(0.05)
+    return "model", {"accuracy": 0.9}
+
+
+def test_run_phases_are_timed(local_tracking_uri):
+    reported = []
+    logger = MlflowLogger(autolog=fake_autolog, timing_log="tags", timing_hook=reported.append)
+    _get_experiment_id("test_timing")
+
+    logger.log(slow_train_function)(experiment_name="test_timing")
+
+    timings = logger.last_timings
+    assert timings.complete
+    assert timings.run_id == logger._latest_run_id
+    assert timings.phases["training"] >= 0.05
+    for phase in ("autolog_setup", "experiment_lookup", "run_start", "metric_logging", "post_run"):
+        assert phase in timings.phases
+    assert timings.total >= sum(timings.phases.values())
+    assert reported == [timings]
+
+    tags = MlflowClient().get_run(timings.run_id).data.tags
+    assert float(tags[TIMING_TAG_PREFIX + "training"]) >= 0.05
+    assert TIMING_TAG_PREFIX + "total" in tags
+
+
+def test_async_timings_complete_after_queued_jobs(local_tracking_uri):
+    reported = []
+    logger = MlflowLogger(autolog=fake_autolog, async_logging=True, timing_hook=reported.append)
+
+    logger.log(slow_train_function)(experiment_name="test_timing_async")
+    logger.flush()
+
+    timings = logger.last_timings
+    assert timings.complete
+    assert "metric_logging" in timings.phases
+    assert reported == [timings]
+    logger.close()
+
+
+def test_failing_timing_hook_does_not_fail_the_run(local_tracking_uri, recwarn):
+    def failing_hook(timings):
+        raise RuntimeError("exporter down")
+
+    logger = MlflowLogger(autolog=fake_autolog, timing_hook=failing_hook)
+    model, metrics = logger.log(slow_train_function)(experiment_name="test_timing_hook")
+
+    assert model == "model"
+    assert any("exporter down" in str(w.message) for w in recwarn)
+
+
+def test_timings_add_up_repeated_phases():
+    timings = RunTimings()
+    timings.add("autolog_setup", 0.0, 0.25)
+    timings.add("autolog_setup", 1.0, 1.5)
+
+    assert timings.phases == {"autolog_setup": 0.75}
+    assert not timings.complete
+    timings._seal()
+    assert timings.complete
@@ -0,0 +1,404 @@
+import os
+import pytest
+import numpy as np
+import pandas as pd
+import mlflow
+from mlflow import MlflowClient
+from mlflow.exceptions import MlflowException
+from mlflow.protos.databricks_pb2 import RESOURCE_ALREADY_EXISTS
+from squid.ml_logging import utils
+from squid.ml_logging.artifacts import _check_dataframe_format, _log_dataframe, _log_artifact, S3ArtifactUploader
+from squid.ml_logging.dispatch import LoggingQueue, AsyncLoggingError
+from squid.ml_logging.utils import (
+    _chunk_batch, 
+    MAX_METRICS_PER_BATCH, 
+    MAX_PARAMS_TAGS_PER_BATCH, 
+    MAX_ENTITIES_PER_BATCH
+)
+
+
+def test_chunk_batch_respects_limits():
+    metrics = list(range(2500))
+    params = list(range(150))
+    tags = list(range(120))
+
+    chunks = list(_chunk_batch(metrics, params, tags))
+
+    for m, p, t in chunks:
+        assert len(m) <= MAX_METRICS_PER_BATCH
+        assert len(p) + len(t) <= MAX_PARAMS_TAGS_PER_BATCH
+        assert len(m) + len(p) + len(t) <= MAX_ENTITIES_PER_BATCH
+
+    assert sum([c[0] for c in chunks], []) == metrics
+    assert sum([c[1] for c in chunks], []) == params
+    assert sum([c[2] for c in chunks], []) == tags
+
+
+def test_chunk_batch_empty():
+    assert list(_chunk_batch([], [], [])) == []
+
+
+def test_logging_queue_runs_jobs_in_order_of_submission():
+    logging_queue = LoggingQueue(max_size=2, num_workers=1)
+    results = []
+
+    for i in range(10):
+        logging_queue.submit(results.append, i)
+    logging_queue.flush()
+
+    assert results == list(range(10))
+    logging_queue.close()
+
+
+def test_logging_queue_surfaces_failures():
+    logging_queue = LoggingQueue(num_workers=2)
+
+    def fail():
+        raise ConnectionError("tracking server unreachable")
+
+    logging_queue.submit(fail)
+    with pytest.raises(AsyncLoggingError, match="1 asynchronous logging job"):
+        logging_queue.flush()
+
+    logging_queue.close()
+    with pytest.raises(RuntimeError, match="closed LoggingQueue"):
+        logging_queue.submit(print)
+
+
+def test_logging_queue_is_released_without_close():
+    import gc
+
+    logging_queue = LoggingQueue(num_workers=2)
+    results = []
+    logging_queue.submit(results.append, 1)
+    workers = list(logging_queue._workers)
+
+    del logging_queue
+    gc.collect()
+
+    # The pending job still runs, then the workers stop
+    for worker in workers:
+        worker.join(timeout=5)
+        assert not worker.is_alive()
+    assert results == [1]
+
+
+@pytest.fixture
+def fake_experiments(monkeypatch):
+    """Replace the experiment lookup and creation calls with counting fakes."""
+    calls = {"get": 0, "create": 0}
+    experiments = {}
+
+    class FakeExperiment:
+        def __init__(self, experiment_id):
+            self.experiment_id = experiment_id
+            self.lifecycle_stage = "active"
+
+    def get_experiment_by_name(name):
+        calls["get"] += 1
+        return experiments.get(name)
+
+    def create_experiment(name, artifact_location=None):
+        calls["create"] += 1
+        experiments[name] = FakeExperiment(str(len(experiments) + 1))
+        return experiments[name].experiment_id
+
+    monkeypatch.setattr(mlflow, "get_experiment_by_name", get_experiment_by_name)
+    monkeypatch.setattr(mlflow, "create_experiment", create_experiment)
+    utils._invalidate_experiment_id()
+    yield calls, experiments, FakeExperiment
+    utils._invalidate_experiment_id()
+
+
+def test_get_experiment_id_is_cached(fake_experiments):
+    calls, _, _ = fake_experiments
+
+    ids = [utils._get_experiment_id("test_cache") for _ in range(5)]
+
+    assert len(set(ids)) == 1
+    assert calls == {"get": 1, "create": 1}
+
+    utils._invalidate_experiment_id("test_cache")
+    utils._get_experiment_id("test_cache")
+    assert calls["get"] == 2
+
+
+def test_get_experiment_id_concurrent_create(fake_experiments, monkeypatch):
+    calls, experiments, FakeExperiment = fake_experiments
+
+    def create_experiment(name, artifact_location=None):
+        # Simulate another worker winning the race to create the experiment
+        experiments[name] = FakeExperiment("7")
+        raise MlflowException("Experiment already exists.", error_code=RESOURCE_ALREADY_EXISTS)
+
+    monkeypatch.setattr(mlflow, "create_experiment", create_experiment)
+
+    assert utils._get_experiment_id("test_race") == "7"
+
+
+def test_start_run_retries_only_for_stale_experiments(fake_experiments, monkeypatch):
+    from mlflow.protos.databricks_pb2 import PERMISSION_DENIED, RESOURCE_DOES_NOT_EXIST
+
+    errors = [MlflowException("No experiment.", error_code=RESOURCE_DOES_NOT_EXIST)]
+    started = []
+    def start_run(experiment_id=None, tags=None):
+        if errors:
+            raise errors.pop(0)
+        started.append(experiment_id)
+        return "run"
+    monkeypatch.setattr(mlflow, "start_run", start_run)
+
+    # A deleted or recreated experiment is resolved again once
+    assert utils._start_mlflow_run("test_stale") == "run"
+    assert len(started) == 1
+
+    errors.append(MlflowException("Forbidden.", error_code=PERMISSION_DENIED))
+    with pytest.raises(MlflowException, match="Forbidden"):
+        utils._start_mlflow_run("test_stale")
+    assert len(started) == 1
+
+
+def test_check_dataframe_format_invalid():
+    with pytest.raises(ValueError, match="dataframe_format must be one of"):
+        _check_dataframe_format("xlsx")
+
+    with pytest.raises(ValueError, match="CSV compression must be one of"):
+        _check_dataframe_format("csv", compression="snappy")
+
+
+def test_log_dataframe_in_chunks(local_tracking_uri, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    client = MlflowClient()
+    experiment_id = client.create_experiment("test_dataframe")
+    run_id = client.create_run(experiment_id).info.run_id
+
+    df = pd.DataFrame({"y_true": np.arange(25), "y_pred": np.arange(25)})
+    _log_dataframe(run_id, "predictions", df, compression="gzip", chunk_rows=10)
+
+    parts = [f.path for f in client.list_artifacts(run_id, "predictions")]
+    assert parts == [
+        "predictions/part-00000.csv.gz", 
+        "predictions/part-00001.csv.gz", 
+        "predictions/part-00002.csv.gz"
+    ]
+    # Nothing is written to the working directory
+    assert os.listdir(tmp_path) == ["mlruns"]
+
+
+class FakeS3:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.uploads = []
+
+    def upload_file(self, filename, bucket, key, Config=None):
+        if self.fail:
+            raise ConnectionError("artifact store unreachable")
+        self.uploads.append((bucket, key, Config.multipart_chunksize))
+
+
+def test_direct_upload_maps_run_artifacts_to_bucket(tmp_path, monkeypatch):
+    pytest.importorskip("boto3")
+    uploader = S3ArtifactUploader(endpoint_url="http://localhost:5002", chunk_size=16 * 1024 * 1024)
+    s3 = FakeS3()
+    uploader._s3()
+    monkeypatch.setattr(uploader, "_client", s3)
+    monkeypatch.setattr(uploader, "_artifact_root", lambda run_id: ("mlflow-artifacts", f"test-exp/{run_id}/artifacts"))
+
+    local_path = tmp_path / "predictions.csv"
+    local_path.write_text("y\n1\n")
+    _log_artifact("abc", str(local_path), artifact_path="predictions", uploader=uploader)
+
+    assert s3.uploads == [("mlflow-artifacts", "test-exp/abc/artifacts/predictions/predictions.csv", 16 * 1024 * 1024)]
+
+
+def test_direct_upload_falls_back_to_tracking_server(local_tracking_uri, tmp_path):
+    pytest.importorskip("boto3")
+    client = MlflowClient()
+    experiment_id = client.create_experiment("test_direct_upload")
+    run_id = client.create_run(experiment_id).info.run_id
+
+    uploader = S3ArtifactUploader(endpoint_url="http://localhost:5002")
+    uploader._s3()
+    uploader._client = FakeS3(fail=True)
+    uploader._artifact_roots[run_id] = ("mlflow-artifacts", f"test-exp/{run_id}/artifacts")
+
+    local_path = tmp_path / "graph.png"
+    local_path.write_bytes(b"png")
+    with pytest.warns(UserWarning, match="Uploading through the tracking server"):
+        _log_artifact(run_id, str(local_path), uploader=uploader)
+
+    assert [f.path for f in client.list_artifacts(run_id)] == ["graph.png"]
+    # The artifact store is not tried again
+    assert uploader.upload(run_id, str(local_path)) is False
+
+
+def test_direct_upload_remembers_a_bounded_number_of_runs(monkeypatch):
+    from squid.ml_logging import artifacts
+    from types import SimpleNamespace
+
+    lookups = []
+    class FakeClient:
+        def __init__(self, tracking_uri=None):
+            pass
+        def get_run(self, run_id):
+            lookups.append(run_id)
+            return SimpleNamespace(info=SimpleNamespace(artifact_uri=f"mlflow-artifacts:/1/{run_id}/artifacts"))
+    monkeypatch.setattr(artifacts, "MlflowClient", FakeClient)
+    monkeypatch.setattr(artifacts, "MAX_CACHED_ARTIFACT_ROOTS", 2)
+
+    uploader = S3ArtifactUploader(endpoint_url="http://localhost:5002")
+    for run_id in ("a", "b", "a", "c", "a", "b"):
+        assert uploader._artifact_root(run_id) == ("mlflow-artifacts", f"1/{run_id}/artifacts")
+
+    # "b" was evicted by "c", as "a" had been used more recently
+    assert lookups == ["a", "b", "c", "b"]
+    assert list(uploader._artifact_roots) == ["a", "b"]
+
+
+def test_split_metrics_by_kind():
+    from squid.ml_logging.arrays import _split_metrics
+
+    metrics = {
+        "accuracy": np.float32(0.5), 
+        "single": np.array([3]), 
+        "loss_curve": np.array([0.9, 0.5, 0.3]), 
+        "val_loss": pd.Series([0.8, 0.6], index=[5, 10]), 
+        "confusion": np.eye(3), 
+        "embedding": np.zeros(20), 
+        "predictions": pd.DataFrame({"y": [1, 2]}), 
+        "n_epochs": 3
+    }
+
+    scalars, histories, arrays, dataframes = _split_metrics(metrics, max_history_steps=10)
+
+    assert scalars == {"accuracy": 0.5, "single": 3, "n_epochs": 3}
+    assert histories == {"loss_curve": ([0, 1, 2], [0.9, 0.5, 0.3]), "val_loss": ([5, 10], [0.8, 0.6])}
+    assert list(arrays) == ["confusion", "embedding"]
+    assert list(dataframes) == ["predictions"]
+
+
+def test_log_metrics_arrays(local_tracking_uri):
+    client = MlflowClient()
+    experiment_id = client.create_experiment("test_arrays")
+    run_id = client.create_run(experiment_id).info.run_id
+
+    utils._log_metrics(run_id, {"loss_curve": np.array([0.9, 0.5, 0.3]), "confusion": np.eye(3)})
+
+    history = client.get_metric_history(run_id, "loss_curve")
+    assert [(m.step, m.value) for m in history] == [(0, 0.9), (1, 0.5), (2, 0.3)]
+    local_path = mlflow.artifacts.download_artifacts(run_id=run_id, artifact_path="confusion.npy")
+    assert np.array_equal(np.load(local_path, mmap_mode="r"), np.eye(3))
+
+
+def test_pytorch_model_graph_is_cached(tmp_path, monkeypatch):
+    import sys
+    import types
+
+    renders = []
+
+    def draw_graph(model, input_size, directory, filename, **kwargs):
+        renders.append(input_size)
+        with open(os.path.join(directory, filename + ".png"), "wb") as f:
+            f.write(b"png")
+
+    monkeypatch.setitem(sys.modules, "torchview", types.SimpleNamespace(draw_graph=draw_graph))
+    monkeypatch.chdir(tmp_path)
+
+    class Net:
+        def __repr__(self):
+            return "Net(\n  (fc): Linear(in_features=4, out_features=1)\n)"
+
+    cache_dir = str(tmp_path / "graphs")
+    first = utils._render_pytorch_model_graph(Net(), (1, 4), cache_dir)
+    second = utils._render_pytorch_model_graph(Net(), (1, 4), cache_dir)
+    utils._render_pytorch_model_graph(Net(), (8, 4), cache_dir)
+
+    assert first == second
+    assert renders == [(1, 4), (8, 4)]
+    # Nothing is written to the working directory
+    assert os.listdir(tmp_path) == ["graphs"]
+
+
+def test_pytorch_model_graph_cache_on_another_filesystem(tmp_path, monkeypatch):
+    import errno
+    import sys
+    import tempfile
+    import types
+
+    def draw_graph(model, input_size, directory, filename, **kwargs):
+        with open(os.path.join(directory, filename + ".png"), "wb") as f:
+            f.write(b"png")
+
+    monkeypatch.setitem(sys.modules, "torchview", types.SimpleNamespace(draw_graph=draw_graph))
+
+    # The temp root and the cache directory stand for two filesystems, like a tmpfs /tmp
+    temp_root = tmp_path / "tmpfs"
+    temp_root.mkdir()
+    monkeypatch.setattr(tempfile, "tempdir", str(temp_root))
+    cache_dir = str(tmp_path / "home" / "graphs")
+
+    replace = os.replace
+    def cross_device_replace(src, dst):
+        if str(src).startswith(str(temp_root)) != str(dst).startswith(str(temp_root)):
+            raise OSError(errno.EXDEV, "Invalid cross-device link")
+        replace(src, dst)
+    monkeypatch.setattr(os, "replace", cross_device_replace)
+
+    class Net:
+        def __repr__(self):
+            return "Net()"
+
+    cached_path = utils._render_pytorch_model_graph(Net(), (1, 4), cache_dir)
+
+    assert open(cached_path, "rb").read() == b"png"
+    assert os.listdir(cache_dir) == [os.path.basename(cached_path)]
+
+
+def test_dedup_uploads_identical_artifacts_once(local_tracking_uri, tmp_path):
+    from squid.ml_logging.dedup import DedupUploader, download_artifacts, REF_TAG_PREFIX
+
+    client = MlflowClient()
+    experiment_id = client.create_experiment("test_dedup")
+    run_ids = [client.create_run(experiment_id).info.run_id for _ in range(2)]
+
+    local_path = tmp_path / "preprocessed.csv"
+    local_path.write_text("x\n" * 1024)
+    uploader = DedupUploader(min_bytes=1024)
+    for run_id in run_ids:
+        _log_artifact(run_id, str(local_path), artifact_path="data", uploader=uploader)
+
+    blobs = list((tmp_path / "mlruns" / "squid-cas").rglob("*"))
+    assert len([b for b in blobs if b.is_file()]) == 1
+
+    for run_id in run_ids:
+        assert client.list_artifacts(run_id) == []
+        assert REF_TAG_PREFIX + "data/preprocessed.csv" in client.get_run(run_id).data.tags
+        downloaded = download_artifacts(run_id, "data", str(tmp_path / run_id))
+        assert open(os.path.join(downloaded, "preprocessed.csv")).read() == "x\n" * 1024
+
+
+def test_fast_model_persistence_skips_unchanged_models(local_tracking_uri, tmp_path):
+    from sklearn.linear_model import LinearRegression
+    from squid.ml_logging.persistence import ModelPersister, load_persisted_model, MODEL_REF_TAG
+
+    client = MlflowClient()
+    experiment_id = client.create_experiment("test_fast_models")
+    run_ids = [client.create_run(experiment_id).info.run_id for _ in range(3)]
+
+    x = np.arange(20, dtype=float).reshape(-1, 1)
+    model = LinearRegression().fit(x, 2 * x.ravel())
+    retrained = LinearRegression().fit(x, 3 * x.ravel())
+
+    persister = ModelPersister(compression_level=5)
+    persister.persist(run_ids[0], experiment_id, model)
+    # A fresh persister finds the logged model through its hash tag
+    ModelPersister().persist(run_ids[1], experiment_id, model)
+    persister.persist(run_ids[2], experiment_id, retrained)
+
+    assert [a.path for a in client.list_artifacts(run_ids[0], "model")] == ["model/model.joblib"]
+    assert client.list_artifacts(run_ids[1]) == []
+    assert client.get_run(run_ids[1]).data.tags[MODEL_REF_TAG] == run_ids[0]
+    assert client.get_run(run_ids[2]).data.tags[MODEL_REF_TAG] == run_ids[2]
+
+    assert load_persisted_model(run_ids[1]).coef_ == pytest.approx([2.0])
+    assert load_persisted_model(run_ids[2]).coef_ == pytest.approx([3.0])